@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming SQL splitter against the original in-memory splitter
+Usage: python benchmarks/bench_splitter.py [--sizes 10,100] [--skip-legacy] [--memory]
+
+Sizes are in megabytes. Synthetic scripts mix INSERTs, comments, quoted
+semicolons and dollar-quoted function bodies. With --memory each splitter
+runs a second time under tracemalloc to report its peak allocation.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.sql_splitter import iter_sql_statements
+
+STATEMENT_TEMPLATES = [
+    "-- seed row {n}\nINSERT INTO submissions (puzzle_id, answer) VALUES ({n}, 'answer; with semicolon {n}');\n",
+    "UPDATE puzzles SET title = 'it''s puzzle {n}' WHERE id = {n}; /* trailing ; comment */\n",
+    "CREATE OR REPLACE FUNCTION f_{n}() RETURNS TRIGGER AS $$\nBEGIN\n    NEW.updated_at = NOW();\n    RETURN NEW;\nEND;\n$$ LANGUAGE plpgsql;\n",
+    "SELECT id, \"quoted;name\" FROM users WHERE id = {n} ORDER BY id;\n",
+]
+
+
+def legacy_split(sql_content: str) -> list:
+    """The original character-by-character splitter, kept for comparison"""
+    lines = sql_content.split('\n')
+    clean_content = '\n'.join(line for line in lines if not line.strip().startswith('--'))
+    queries = []
+    current_query = ""
+    in_string = False
+    string_char = None
+    for char in clean_content:
+        if char in ["'", '"'] and (not in_string or char == string_char):
+            in_string = not in_string
+            string_char = char if in_string else None
+            current_query += char
+        elif char == ';' and not in_string:
+            current_query = current_query.strip()
+            if current_query:
+                queries.append(current_query)
+            current_query = ""
+        else:
+            current_query += char
+    current_query = current_query.strip()
+    if current_query:
+        queries.append(current_query)
+    return queries
+
+
+def write_script(path: str, size_mb: int):
+    target = size_mb * 1024 * 1024
+    written = 0
+    n = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        while written < target:
+            statement = STATEMENT_TEMPLATES[n % len(STATEMENT_TEMPLATES)].format(n=n)
+            file.write(statement)
+            written += len(statement)
+            n += 1
+
+
+def measure(label: str, func, trace_memory: bool):
+    start = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - start
+    line = f"  {label:<10} {count:>10} statements  {elapsed:8.2f} s"
+    if trace_memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"  peak {peak / 1024 / 1024:8.1f} MB"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,100', help='comma-separated script sizes in MB')
+    parser.add_argument('--skip-legacy', action='store_true', help='only run the streaming splitter')
+    parser.add_argument('--memory', action='store_true', help='also report peak traced memory')
+    args = parser.parse_args()
+
+    for size_mb in (int(size) for size in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f'synthetic_{size_mb}mb.sql')
+            write_script(path, size_mb)
+            print(f"{size_mb} MB script:")
+
+            def run_streaming():
+                with open(path, encoding='utf-8') as file:
+                    return sum(1 for _ in iter_sql_statements(file))
+
+            def run_legacy():
+                with open(path, encoding='utf-8') as file:
+                    return len(legacy_split(file.read().strip()))
+
+            measure('streaming', run_streaming, args.memory)
+            if not args.skip_legacy:
+                measure('legacy', run_legacy, args.memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Measure run_sql.py cold start and check that heavy imports stay deferred
+Usage: python benchmarks/bench_startup.py [--runs 10] [--max-ms 100] [--max-total-ms MS] [--output FILE]
+
+Scenarios, each timed in a fresh interpreter (median of --runs):
+  import        python -c "import run_sql"
+  dry-run       run_sql.py migrate <dir> --dry-run on an up-to-date directory
+  cached-query  run_sql.py <file> --cache, whose SELECT is answered from the result cache
+
+Times are reported as measured and above the bare interpreter (python -c pass).
+The --max-ms budget applies to the time above the interpreter, so slow site
+hooks on a machine do not count against the project; --max-total-ms also
+gates the measured time, interpreter included. One extra run per scenario under
+-X importtime lists the slowest imports and checks that requests, urllib3,
+httpx and the supabase SDK were not imported. Any breach exits 1.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fake_postgrest import FakePostgrest
+
+# Modules that none of the scenarios needs; importing one is a regression
+DEFERRED_MODULES = ['requests', 'urllib3', 'httpx', 'supabase', 'concurrent.futures']
+
+QUERY = "SELECT id, user_id, score FROM bench_rows WHERE score >= 500 ORDER BY id LIMIT 20;\n"
+MIGRATION = "CREATE TABLE IF NOT EXISTS bench_startup (id BIGINT PRIMARY KEY);\n"
+
+
+def run(command: List[str], env: Dict[str, str]) -> Tuple[float, subprocess.CompletedProcess]:
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - start, completed
+
+
+def median_ms(command: List[str], env: Dict[str, str], runs: int) -> float:
+    """Median wall time of a command, after one warm-up run that also writes bytecode caches"""
+    run(command, env)
+    times = []
+    for _ in range(runs):
+        elapsed, completed = run(command, env)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed:\n{completed.stdout}{completed.stderr}")
+        times.append(elapsed)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def import_profile(command: List[str], env: Dict[str, str]) -> Tuple[List[Tuple[float, str]], List[str]]:
+    """(slowest imports as (self ms, module), deferred modules that were imported) from -X importtime"""
+    _, completed = run([command[0], '-X', 'importtime'] + command[1:], env)
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        imports.append((int(self_us) / 1000, name.strip()))
+    loaded = {name for _, name in imports}
+    return sorted(imports, reverse=True)[:5], [module for module in DEFERRED_MODULES if module in loaded]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='timed runs per scenario (default: 10)')
+    parser.add_argument('--max-ms', type=float, default=100.0,
+                        help='budget per scenario above bare interpreter startup (default: 100)')
+    parser.add_argument('--max-total-ms', type=float, default=None,
+                        help='budget per scenario for the measured time, interpreter included (default: none)')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    python = sys.executable
+    with FakePostgrest(tables={'bench_rows': 10_000}) as server, tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        # Measure the normal case, with bytecode caches written and used
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        env.update(NEXT_PUBLIC_SUPABASE_URL=server.url, SUPABASE_SERVICE_ROLE_KEY='benchmark',
+                   DB_UTILS_CACHE_DIR=os.path.join(workdir, 'cache'))
+
+        migrations = os.path.join(workdir, 'migrations')
+        os.makedirs(migrations)
+        with open(os.path.join(migrations, '001_bench.sql'), 'w', encoding='utf-8') as file:
+            file.write(MIGRATION)
+        query = os.path.join(workdir, 'query.sql')
+        with open(query, 'w', encoding='utf-8') as file:
+            file.write(QUERY)
+
+        # Apply the migration and fill the result cache, so the timed runs send no requests
+        for command in ([python, 'run_sql.py', 'migrate', migrations], [python, 'run_sql.py', query, '--cache']):
+            _, completed = run(command, env)
+            if completed.returncode != 0:
+                raise RuntimeError(f"setup failed:\n{completed.stdout}{completed.stderr}")
+        requests_before = server.requests
+
+        scenarios = {
+            'import': [python, '-c', 'import run_sql'],
+            'dry-run': [python, 'run_sql.py', 'migrate', migrations, '--dry-run'],
+            'cached-query': [python, 'run_sql.py', query, '--cache'],
+        }
+        floor = median_ms([python, '-c', 'pass'], env, args.runs)
+        results: List[Dict[str, Any]] = []
+        for name, command in scenarios.items():
+            print(f"Running {name}...", file=sys.stderr)
+            total = median_ms(command, env, args.runs)
+            slowest, deferred = import_profile(command, env)
+            results.append({
+                "scenario": name,
+                "median_ms": round(total, 1),
+                "above_interpreter_ms": round(total - floor, 1),
+                "deferred_imported": deferred,
+                "slowest_imports": [[module, round(ms, 2)] for ms, module in slowest],
+            })
+        requests_sent = server.requests - requests_before
+
+    print(f"Interpreter startup (python -c pass): {floor:.1f} ms")
+    print(f"{'scenario':<13} {'median ms':>10} {'above python':>13}  slowest imports (self ms)")
+    for result in results:
+        slowest = ", ".join(f"{module} {ms:.1f}" for module, ms in result["slowest_imports"][:3])
+        print(f"{result['scenario']:<13} {result['median_ms']:>10.1f} {result['above_interpreter_ms']:>13.1f}  {slowest}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({"interpreter_ms": round(floor, 1), "requests_sent": requests_sent, "results": results},
+                      file, indent=2)
+            file.write("\n")
+
+    failures = []
+    for result in results:
+        if result["above_interpreter_ms"] > args.max_ms:
+            failures.append(f"{result['scenario']}: {result['above_interpreter_ms']:.1f} ms above the interpreter "
+                            f"> {args.max_ms:.0f} ms")
+        if args.max_total_ms is not None and result["median_ms"] > args.max_total_ms:
+            failures.append(f"{result['scenario']}: {result['median_ms']:.1f} ms in total > {args.max_total_ms:.0f} ms")
+        if result["deferred_imported"]:
+            failures.append(f"{result['scenario']}: imported {', '.join(result['deferred_imported'])}")
+    if requests_sent:
+        failures.append(f"{requests_sent} requests sent by runs that should be served locally")
+    if failures:
+        print("\n❌ Startup regressions:")
+        for failure in failures:
+            print(f"   {failure}")
+        sys.exit(1)
+    slowest = max(result["median_ms"] for result in results)
+    budget = f"{args.max_ms:.0f} ms above interpreter startup"
+    if args.max_total_ms is not None:
+        budget += f" and {args.max_total_ms:.0f} ms in total"
+    print(f"\n✅ Every scenario starts within {budget} (slowest {slowest:.1f} ms in total) "
+          "and keeps heavy imports deferred")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Benchmark SupabaseUtil end to end against an in-process fake PostgREST server
+Usage: python benchmarks/bench_workloads.py [--workloads migration,scan,aggregate,insert,backfill]
+                                            [--scale 1.0] [--latency-ms 0]
+                                            [--save-baseline FILE | --baseline FILE [--threshold 0.25]]
+
+Workloads (sizes at --scale 1.0):
+  migration  10k DDL/DML statements from a SQL file, one exec_sql call each
+  scan       1M-row keyset-paginated SELECT
+  aggregate  GROUP BY / COUNT / DISTINCT queries over a 100k-row table, 3 rounds
+  insert     100k single-row INSERT statements, coalesced into bulk POSTs
+  backfill   10k UPDATEs over 64 tables on 8 threads, against a server that
+             answers 429 beyond 4 requests in flight (at least 5 ms latency)
+
+Each workload runs in its own subprocess so peak RSS is measured per workload.
+Results report throughput, p50/p99 latency per operation (statement, page, query
+or bulk request) and peak RSS. With --baseline the run fails (exit 1) when
+throughput drops, or p99 or RSS grow, by more than the threshold.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_postgrest import FakePostgrest
+
+WORKLOADS = ['migration', 'scan', 'aggregate', 'insert', 'backfill']
+
+# Requests the fake server accepts at once in the backfill workload, and the threads sending them
+BACKFILL_CAPACITY = 4
+BACKFILL_JOBS = 8
+
+MIGRATION_TEMPLATES = [
+    "CREATE TABLE IF NOT EXISTS bench_m_{n} (id BIGINT PRIMARY KEY, note TEXT DEFAULT 'a;b');\n",
+    "ALTER TABLE bench_rows ADD COLUMN IF NOT EXISTS c_{n} INTEGER;\n",
+    "-- keep scores in range\nUPDATE bench_rows SET score = {n} % 1000 WHERE id = {n};\n",
+    "CREATE INDEX IF NOT EXISTS bench_rows_c_{n} ON bench_rows (score);\n",
+]
+
+AGGREGATE_QUERIES = [
+    "SELECT user_id, COUNT(*) AS attempts, AVG(score) AS avg_score FROM bench_agg GROUP BY user_id",
+    "SELECT COUNT(*) FROM bench_agg WHERE is_correct = true",
+    "SELECT puzzle_id, MAX(score) AS best FROM bench_agg WHERE score >= 500 GROUP BY puzzle_id HAVING COUNT(*) > 10",
+    "SELECT COUNT(DISTINCT user_id) AS players FROM bench_agg",
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def statement_latencies(util) -> List[float]:
+    """Register a metrics hook and return the list it fills with per-statement wall times"""
+    latencies: List[float] = []
+    util.add_metrics_hook(lambda metrics: latencies.append(metrics.wall_time))
+    return latencies
+
+
+def run_migration(util, server: FakePostgrest, scale: float, workdir: str) -> Tuple[int, str, List[float], float]:
+    count = max(1, int(10_000 * scale))
+    path = os.path.join(workdir, 'migration.sql')
+    with open(path, 'w', encoding='utf-8') as file:
+        for n in range(count):
+            file.write(MIGRATION_TEMPLATES[n % len(MIGRATION_TEMPLATES)].format(n=n))
+    latencies = statement_latencies(util)
+    start = time.perf_counter()
+    result = util.execute_sql_file(path)
+    elapsed = time.perf_counter() - start
+    if not result["success"] or result["total_queries"] != count:
+        raise RuntimeError(f"migration failed: {result.get('error')}")
+    return count, 'statements', latencies, elapsed
+
+
+def run_scan(util, server: FakePostgrest, scale: float, workdir: str) -> Tuple[int, str, List[float], float]:
+    page_size = 1000
+    latencies: List[float] = []
+    rows = 0
+    start = began = time.perf_counter()
+    for _ in util.iter_select("SELECT id, user_id, score FROM bench_rows", page_size=page_size, key_column='id'):
+        rows += 1
+        if rows % page_size == 0:
+            now = time.perf_counter()
+            latencies.append(now - start)
+            start = now
+    elapsed = time.perf_counter() - began
+    if rows != server.tables['bench_rows']:
+        raise RuntimeError(f"scan returned {rows} rows, expected {server.tables['bench_rows']}")
+    return rows, 'rows', latencies, elapsed
+
+
+def run_aggregate(util, server: FakePostgrest, scale: float, workdir: str) -> Tuple[int, str, List[float], float]:
+    latencies = []
+    for _ in range(3):
+        for query in AGGREGATE_QUERIES:
+            start = time.perf_counter()
+            result = util.aggregate_query(query, key_column='id')
+            latencies.append(time.perf_counter() - start)
+            if not result["success"]:
+                raise RuntimeError(f"aggregate failed: {result.get('error')}")
+    return len(latencies), 'queries', latencies, sum(latencies)
+
+
+def run_insert(util, server: FakePostgrest, scale: float, workdir: str) -> Tuple[int, str, List[float], float]:
+    count = max(1, int(100_000 * scale))
+    path = os.path.join(workdir, 'inserts.sql')
+    with open(path, 'w', encoding='utf-8') as file:
+        for n in range(1, count + 1):
+            file.write(f"INSERT INTO bench_inserts (id, user_id, score, note) VALUES ({n}, {n % 97}, {n % 1000}, 'row {n}');\n")
+    latencies = statement_latencies(util)
+    start = time.perf_counter()
+    result = util.execute_sql_file(path)
+    elapsed = time.perf_counter() - start
+    if not result["success"] or server.rows_inserted != count:
+        raise RuntimeError(f"insert failed: {result.get('error')} ({server.rows_inserted}/{count} rows)")
+    return count, 'rows', latencies, elapsed
+
+
+def run_backfill(util, server: FakePostgrest, scale: float, workdir: str) -> Tuple[int, str, List[float], float]:
+    count = max(1, int(10_000 * scale))
+    path = os.path.join(workdir, 'backfill.sql')
+    with open(path, 'w', encoding='utf-8') as file:
+        for n in range(count):
+            file.write(f"UPDATE bench_fill_{n % 64} SET score = {n % 1000} WHERE id = {n};\n")
+    # Without some latency requests rarely overlap and the server is never saturated
+    server.latency = max(server.latency, 0.005)
+    latencies = statement_latencies(util)
+    start = time.perf_counter()
+    result = util.execute_sql_file(path, jobs=BACKFILL_JOBS)
+    elapsed = time.perf_counter() - start
+    if not result["success"] or result["successful_queries"] != count:
+        failed = [entry.get("error") for entry in result.get("data") or [] if not entry.get("success")]
+        raise RuntimeError(f"backfill failed: {result.get('error') or failed[:3]}")
+    return count, 'statements', latencies, elapsed
+
+
+# Each runner prepares its input, then returns (items, unit, per-operation latencies, timed seconds)
+RUNNERS: Dict[str, Callable[..., Tuple[int, str, List[float], float]]] = {
+    'migration': run_migration,
+    'scan': run_scan,
+    'aggregate': run_aggregate,
+    'insert': run_insert,
+    'backfill': run_backfill,
+}
+
+
+def run_child(workload: str, scale: float, latency_ms: float) -> Dict[str, Any]:
+    """Run one workload in this process and return its measurements"""
+    tables = {
+        'bench_rows': max(1, int(1_000_000 * scale)),
+        'bench_agg': max(1, int(100_000 * scale)),
+        'bench_inserts': 0,
+    }
+    capacity = BACKFILL_CAPACITY if workload == 'backfill' else None
+    with FakePostgrest(tables=tables, latency=latency_ms / 1000, capacity=capacity) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ['NEXT_PUBLIC_SUPABASE_URL'] = server.url
+        os.environ['SUPABASE_SERVICE_ROLE_KEY'] = 'benchmark'
+        # Imported here so the parent process, which only spawns workloads, never loads the client
+        from utils.rpc_discovery import RpcEndpointCache
+        from utils.supabase_util import SupabaseUtil
+
+        with SupabaseUtil(rpc_cache=RpcEndpointCache(path=None)) as util:
+            logging.disable(logging.INFO)
+            util.connect_to_database()
+            items, unit, latencies, elapsed = RUNNERS[workload](util, server, scale, workdir)
+        return {
+            "workload": workload,
+            "items": items,
+            "unit": unit,
+            "seconds": round(elapsed, 4),
+            "throughput": round(items / elapsed, 2) if elapsed else 0.0,
+            "operations": len(latencies),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "requests": server.requests,
+            "throttled": server.throttled,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+def run_workload(workload: str, scale: float, latency_ms: float) -> Dict[str, Any]:
+    """Run one workload in a fresh interpreter so its peak RSS is its own"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', workload,
+               '--scale', str(scale), '--latency-ms', str(latency_ms)]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{workload} workload failed:\n{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Regressions of more than threshold (a fraction) against the baseline results"""
+    previous = {entry["workload"]: entry for entry in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        base = previous.get(result["workload"])
+        if base is None:
+            continue
+        name = result["workload"]
+        if result["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {result['throughput']:.0f} < {base['throughput']:.0f} {result['unit']}/s")
+        for key in ("p99_ms", "peak_rss_mb"):
+            if base[key] and result[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {result[key]} > {base[key]}")
+    return regressions
+
+
+def print_results(results: List[Dict[str, Any]], baseline: Dict[str, Any]):
+    previous = {entry["workload"]: entry for entry in baseline.get("results", [])}
+    print(f"{'workload':<10} {'items':>9} {'seconds':>8} {'throughput':>22} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'requests':>9} {'peak RSS':>9} {'vs base':>8}")
+    for result in results:
+        base = previous.get(result["workload"])
+        change = f"{100 * (result['throughput'] / base['throughput'] - 1):+.0f}%" if base else ""
+        print(f"{result['workload']:<10} {result['items']:>9} {result['seconds']:>8.2f} "
+              f"{result['throughput']:>10.0f} {result['unit'] + '/s':<11} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{result['requests']:>9} {result['peak_rss_mb']:>6.1f} MB {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workloads', default=','.join(WORKLOADS), help='comma-separated workloads to run')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every workload size (e.g. 0.1 for a quick run)')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated round-trip latency per request')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--save-baseline', metavar='FILE', help='store the results as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against a stored baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed regression against the baseline, as a fraction (default: 0.25)')
+    parser.add_argument('--child', choices=WORKLOADS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.scale, args.latency_ms)))
+        return
+
+    workloads = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    baseline: Dict[str, Any] = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        config = baseline.get("config", {})
+        if config.get("scale") != args.scale or config.get("latency_ms") != args.latency_ms:
+            print(f"⚠️  Baseline was recorded with scale={config.get('scale')} latency_ms={config.get('latency_ms')}")
+
+    results = []
+    for workload in workloads:
+        print(f"Running {workload}...", file=sys.stderr)
+        results.append(run_workload(workload, args.scale, args.latency_ms))
+
+    print_results(results, baseline)
+    report = {"config": {"scale": args.scale, "latency_ms": args.latency_ms}, "results": results}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+
+    if args.baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ Regressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
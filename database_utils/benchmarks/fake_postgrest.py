@@ -0,0 +1,288 @@
+"""
+In-process stand-in for the Supabase REST API, for offline benchmarks.
+
+Serves /rest/v1/ (an OpenAPI document listing exec_sql), /rest/v1/<table>
+GETs/HEADs over synthetic tables, table POSTs and /rest/v1/rpc/exec_sql on a
+local port. Table rows are generated from their id on demand, so a 1M-row
+table costs no memory. Every response can be delayed by a fixed latency to
+model the network round trip, and a capacity makes it reject requests beyond
+that many in flight with 429, as a rate-limiting gateway would.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+BASE_TIME = 1767225600  # 2026-01-01T00:00:00Z
+
+OPENAPI = {
+    "swagger": "2.0",
+    "paths": {
+        "/rpc/exec_sql": {"post": {"parameters": [
+            {"in": "body", "name": "args", "schema": {"properties": {"sql": {"type": "string"}}}}
+        ]}},
+    },
+}
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a != b,
+    'gt': lambda a, b: a is not None and a > b,
+    'gte': lambda a, b: a is not None and a >= b,
+    'lt': lambda a, b: a is not None and a < b,
+    'lte': lambda a, b: a is not None and a <= b,
+    'is': lambda a, b: a is b,
+}
+
+
+def make_row(i: int) -> Dict[str, Any]:
+    """The synthetic row with id i (1-based); every table uses the same shape"""
+    return {
+        "id": i,
+        "user_id": i % 97,
+        "puzzle_id": i % 500,
+        "score": (i * 37) % 1000,
+        "is_correct": i % 3 == 0,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(BASE_TIME + i * 60)),
+    }
+
+
+def _parse_value(value: str) -> Any:
+    if value in ('true', 'false'):
+        return value == 'true'
+    if value == 'null':
+        return None
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
+
+
+class FakePostgrest:
+    """A threaded fake PostgREST server; use as `with FakePostgrest(tables={...}) as server:`"""
+
+    def __init__(self, tables: Optional[Dict[str, int]] = None, latency: float = 0.0, max_rows: int = 1000,
+                 capacity: Optional[int] = None, retry_after: Optional[float] = None):
+        self.tables = dict(tables or {})
+        self.latency = latency
+        self.max_rows = max_rows
+        self.capacity = capacity
+        # Sent as Retry-After with every 429
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self.rows_inserted = 0
+        self.statements_executed = 0
+        # Statuses to answer the next table POSTs with, one each, instead of inserting
+        self.post_failures: List[int] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakePostgrest':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'FakePostgrest':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def admit(self) -> bool:
+        """Take a slot for a request, or count it as throttled if the server is at capacity"""
+        with self._lock:
+            if self.capacity is not None and self._in_flight >= self.capacity:
+                self.throttled += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def count(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def openapi(self) -> Dict[str, Any]:
+        """The /rest/v1/ document: the exec_sql function and every table, keyed on id"""
+        definitions = {table: {"type": "object", "properties": {
+            column: {"description": "Note:\nThis is a Primary Key.<pk/>"} if column == 'id' else {}
+            for column in make_row(1)
+        }} for table in self.tables}
+        return dict(OPENAPI, definitions=definitions)
+
+    def fail_posts(self, *statuses: int):
+        """Answer the next table POSTs with these statuses, in order"""
+        with self._lock:
+            self.post_failures.extend(statuses)
+
+    def next_post_failure(self) -> Optional[int]:
+        with self._lock:
+            return self.post_failures.pop(0) if self.post_failures else None
+
+    def query(self, table: str, params: List[Tuple[str, str]],
+              max_rows: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """(page rows, offset) for a table GET
+
+        Supports select, limit, offset, order on id, and (negated) comparison filters;
+        filters on id narrow the generated range instead of being scanned.
+        """
+        size = self.tables[table]
+        max_rows = max_rows or self.max_rows
+        low, high = 1, size
+        filters = []
+        limit, offset, columns, descending = max_rows, 0, None, False
+        for key, value in params:
+            if key == 'select':
+                columns = None if value == '*' else value.split(',')
+            elif key == 'limit':
+                limit = min(int(value), max_rows)
+            elif key == 'offset':
+                offset = int(value)
+            elif key == 'order':
+                descending = value.split(',')[0].endswith('.desc')
+            else:
+                operator, _, operand = value.partition('.')
+                negated = operator == 'not'
+                if negated:
+                    operator, _, operand = operand.partition('.')
+                operand = _parse_value(operand)
+                if key == 'id' and operator in ('gt', 'gte', 'lt', 'lte', 'eq') and not negated:
+                    if operator in ('gt', 'gte', 'eq'):
+                        low = max(low, operand + (operator == 'gt'))
+                    if operator in ('lt', 'lte', 'eq'):
+                        high = min(high, operand - (operator == 'lt'))
+                elif negated:
+                    compare = _OPERATORS[operator]
+                    filters.append((key, lambda a, b, compare=compare: not compare(a, b), operand))
+                else:
+                    filters.append((key, _OPERATORS[operator], operand))
+
+        ids = range(high, low - 1, -1) if descending else range(low, high + 1)
+        page: List[Dict[str, Any]] = []
+        skipped = 0
+        for i in ids:
+            if len(page) >= limit:
+                break
+            row = make_row(i)
+            if all(compare(row.get(key), operand) for key, compare, operand in filters):
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                page.append({column: row.get(column) for column in columns} if columns else row)
+        return page, offset
+
+    def total(self, table: str, params: List[Tuple[str, str]]) -> int:
+        """Number of rows matching the filters, ignoring limit/offset"""
+        filters = [(key, value) for key, value in params if key not in ('select', 'limit', 'offset', 'order')]
+        if not filters:
+            return self.tables[table]
+        rows, _ = self.query(table, filters, max_rows=self.tables[table])
+        return len(rows)
+
+
+def _make_handler(server: FakePostgrest):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        admitted = False
+        # Headers and body are written separately; without TCP_NODELAY each response waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: Any = None, headers: Tuple[Tuple[str, str], ...] = (), head: bool = False):
+            payload = b'' if body is None else json.dumps(body, separators=(',', ':')).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(0 if head else len(payload)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            if not head:
+                self.wfile.write(payload)
+            if self.admitted:
+                self.admitted = False
+                server.leave()
+
+        def _begin(self) -> Optional[Tuple[str, List[Tuple[str, str]]]]:
+            """(path, query parameters) of the request, or None once it has been rejected with 429"""
+            server.count('requests')
+            self.admitted = server.admit()
+            if not self.admitted:
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                headers = (('Retry-After', str(server.retry_after)),) if server.retry_after is not None else ()
+                self._send(429, {"message": "Too many requests"}, headers, head=self.command == 'HEAD')
+                return None
+            if server.latency:
+                time.sleep(server.latency)
+            url = urlsplit(self.path)
+            return unquote(url.path), parse_qsl(url.query, keep_blank_values=True)
+
+        def do_HEAD(self):
+            self.do_GET(head=True)
+
+        def do_GET(self, head: bool = False):
+            request = self._begin()
+            if request is None:
+                return
+            path, params = request
+            if path == '/rest/v1/':
+                return self._send(200, server.openapi(), head=head)
+            table = path[len('/rest/v1/'):]
+            if table not in server.tables:
+                return self._send(404, {"code": "42P01", "message": f'relation "public.{table}" does not exist'})
+            if head:
+                total = server.total(table, params)
+                return self._send(200, None, (('Content-Range', f"*/{total}"),), head=True)
+            page, offset = server.query(table, params)
+            content_range = f"{offset}-{offset + len(page) - 1}/*" if page else "*/*"
+            return self._send(200, page, (('Content-Range', content_range),))
+
+        def do_POST(self):
+            request = self._begin()
+            if request is None:
+                return
+            path, _ = request
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if path.startswith('/rest/v1/rpc/'):
+                if path != '/rest/v1/rpc/exec_sql':
+                    return self._send(404, {"code": "PGRST202", "message": "Could not find the function"})
+                sql = json.loads(body).get('sql', '')
+                server.count('statements_executed', max(1, sql.count('current_statement :=')))
+                return self._send(200, [])
+            table = path[len('/rest/v1/'):]
+            if table not in server.tables:
+                return self._send(404, {"code": "42P01", "message": f'relation "public.{table}" does not exist'})
+            failure = server.next_post_failure()
+            if failure is not None:
+                return self._send(failure, {"message": f"Injected failure {failure}"})
+            rows = json.loads(body)
+            server.count('rows_inserted', len(rows) if isinstance(rows, list) else 1)
+            return self._send(201)
+
+    return Handler
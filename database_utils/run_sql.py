@@ -1,25 +1,319 @@
 #!/usr/bin/env python3
 """
 Simple script to run SQL files against Supabase database
-Usage: python run_sql.py your_file.sql
+Usage: python run_sql.py your_file.sql [--jobs N | --single-transaction] [--format csv --output out.csv]
+       python run_sql.py 'nightly/*.sql' more.sql [--file-jobs N | --manifest nightly.txt]
+       python run_sql.py migrate migrations_dir [--dry-run]
+       python run_sql.py export puzzles submissions users [--format parquet] [--incremental]
 """
 
 import sys
 import os
+import argparse
+import itertools
+import time
+from contextlib import redirect_stdout
+from typing import Iterator, Optional
+from utils.migrations import MigrationPlan, MigrationRunner
+from utils.query_core import DEFAULT_INSERT_BATCH_SIZE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SupabaseQueryError
+from utils.query_metrics import PHASES, MetricsCollector
+from utils.request_scheduler import RequestScheduler
+from utils.result_cache import DEFAULT_RESULT_TTL, ResultCache, default_result_cache_path
+from utils.result_writers import FORMATS, OutputError, ResultWriter, create_writer, open_output
+from utils.sql_batches import expand_paths, plan_stages, read_manifest
 from utils.supabase_util import SupabaseUtil
+from utils.table_export import EXPORT_FORMATS, WATERMARK_FILE, read_watermarks, snapshot_name, write_watermarks
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run SQL files against the Supabase database",
+        epilog="Example: python run_sql.py queries/my_query.sql"
+    )
+    parser.add_argument("sql_files", nargs="*", metavar="sql_file",
+                        help="SQL files, directories or glob patterns; numeric prefixes (01_, 02_) order several files")
+    parser.add_argument("--manifest", metavar="FILE", default=None,
+                        help="run the files listed in FILE, one stage per line, instead of the sql_file arguments")
+    parser.add_argument("--file-jobs", type=int, default=4, metavar="N",
+                        help="with several files, run up to N files of the same stage at once (default: 4)")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="run independent statements on up to N threads (default: 1, sequential)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"rows fetched per request when streaming SELECT results (default: {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--insert-batch-size", type=int, default=DEFAULT_INSERT_BATCH_SIZE,
+                        help="rows per request when consecutive INSERTs are sent as bulk inserts "
+                             f"(default: {DEFAULT_INSERT_BATCH_SIZE}, 0 sends INSERTs through the SQL RPC)")
+    parser.add_argument("--single-transaction", action="store_true",
+                        help="send the whole file in one exec_sql call that commits or rolls back as a unit")
+    parser.add_argument("--transaction-chunk", type=int, default=None, metavar="N",
+                        help="with --single-transaction, send N statements per call (each call is atomic)")
+    parser.add_argument("--cache", action="store_true",
+                        help=f"reuse SELECT results of earlier runs for {DEFAULT_RESULT_TTL:.0f} seconds "
+                             "(off by default; writes made by other clients are not seen until they expire)")
+    parser.add_argument("--rate", type=float, default=None, metavar="N",
+                        help="send at most N requests per second (default: no limit; 429s still slow the run down)")
+    parser.add_argument("--error-budget", type=int, default=None, metavar="N",
+                        help="stop sending requests once more than N have failed after retries (default: no limit)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-statement timings, requests and bytes, slowest statements first")
+    parser.add_argument("--profile-jsonl", metavar="FILE", default=None,
+                        help="append one JSON line of metrics per statement to FILE (implies --profile)")
+    parser.add_argument("--format", choices=FORMATS, default="table",
+                        help="how result rows are written (default: table); arrow writes an Arrow IPC stream")
+    parser.add_argument("--output", "-o", metavar="FILE", default=None,
+                        help="write result rows to FILE instead of stdout")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if not 1 <= args.page_size <= MAX_PAGE_SIZE:
+        parser.error(f"--page-size must be between 1 and {MAX_PAGE_SIZE}, the server's max-rows")
+    if args.insert_batch_size < 0:
+        parser.error("--insert-batch-size must not be negative")
+    if args.single_transaction and args.jobs > 1:
+        parser.error("--single-transaction cannot be combined with --jobs")
+    if args.transaction_chunk is not None and (args.transaction_chunk < 1 or not args.single_transaction):
+        parser.error("--transaction-chunk needs --single-transaction and must be at least 1")
+    if args.file_jobs < 1:
+        parser.error("--file-jobs must be at least 1")
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.error_budget is not None and args.error_budget < 0:
+        parser.error("--error-budget must not be negative")
+    if bool(args.sql_files) == bool(args.manifest):
+        parser.error("give either SQL files or --manifest")
+    try:
+        args.stages = read_manifest(args.manifest) if args.manifest else plan_stages(expand_paths(args.sql_files))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    return args
+
+def parse_migrate_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_sql.py migrate",
+        description="Apply the new or changed statements of a directory of SQL files, in filename order",
+        epilog="Example: python run_sql.py migrate migrations/ --dry-run"
+    )
+    parser.add_argument("directory", help="directory containing the migration .sql files")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the plan without applying anything")
+    parser.add_argument("--refresh", action="store_true",
+                        help="check every file against the ledger, not only files that changed locally")
+    parser.add_argument("--transaction-chunk", type=int, default=None, metavar="N",
+                        help="apply N statements per transaction (default: one transaction per file)")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    if args.transaction_chunk is not None and args.transaction_chunk < 1:
+        parser.error("--transaction-chunk must be at least 1")
+    return args
+
+def parse_export_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_sql.py export",
+        description="Dump tables to Parquet, gzipped CSV or JSON Lines files, fetching key ranges in parallel",
+        epilog="Example: python run_sql.py export puzzles submissions users --format parquet --incremental"
+    )
+    parser.add_argument("tables", nargs="+", help="tables to export")
+    parser.add_argument("--output-dir", "-o", default="exports",
+                        help="directory for the files, one per table: TABLE.parquet, TABLE.csv.gz or TABLE.jsonl.gz "
+                             "(default: exports)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet",
+                        help="file format (default: parquet, which needs pyarrow)")
+    parser.add_argument("--jobs", "-j", type=int, default=4,
+                        help="key ranges of a table fetched at once (default: 4)")
+    parser.add_argument("--key-column", default="id",
+                        help="column the table is split on; only integer keys are split (default: id)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"rows fetched per request (default: {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only export rows added since the last incremental export, to TABLE.<UTC time>.<ext>")
+    parser.add_argument("--watermark-column", default="created_at",
+                        help="with --incremental, the column that tells which rows are new (default: created_at)")
+    parser.add_argument("--no-compress", action="store_true",
+                        help="write plain .csv/.jsonl files and uncompressed Parquet")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if not 1 <= args.page_size <= MAX_PAGE_SIZE:
+        parser.error(f"--page-size must be between 1 and {MAX_PAGE_SIZE}, the server's max-rows")
+    return args
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python run_sql.py <sql_file>")
-        print("Example: python run_sql.py queries/my_query.sql")
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        return migrate(parse_migrate_args(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        return export(parse_export_args(sys.argv[2:]))
+    args = parse_args()
+    stdout = sys.stdout
+    try:
+        output = open_output(args.output, args.format, stdout)
+        writer = create_writer(args.format, output)
+    except (OSError, OutputError) as e:
+        print(f"❌ Cannot write {args.format} output: {e}")
+        sys.exit(1)
+    # Keep stdout parseable when rows go there: status messages are sent to stderr instead
+    to_stdout = output in (stdout, getattr(stdout, 'buffer', None))
+    try:
+        with redirect_stdout(sys.stderr if writer.machine_readable and to_stdout else stdout):
+            run(args, writer)
+    except OutputError as e:
+        print(f"❌ Cannot write {args.format} output: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        writer.close()
+        if args.output is not None:
+            output.close()
+
+def run(args, writer: ResultWriter):
+    """Run the SQL file of the parsed arguments, then report cache statistics and the profile"""
+    # Initialize utility; the connection is probed once and reused for every statement
+    result_cache = ResultCache() if args.cache else None
+    jsonl = open(args.profile_jsonl, 'a', encoding='utf-8', buffering=1) if args.profile_jsonl else None
+    collector = MetricsCollector(jsonl) if args.profile or jsonl else None
+    files = [path for stage in args.stages for path in stage]
+    # Every file shares one connection pool, sized for all the statements that can be in flight
+    pool_size = max(10, args.jobs * min(args.file_jobs, len(files)))
+    # ...and one scheduler, so the rate limit and error budget cover the whole run
+    scheduler = RequestScheduler(max_concurrency=pool_size, rate=args.rate, error_budget=args.error_budget)
+    try:
+        with SupabaseUtil(pool_size=pool_size, insert_batch_size=args.insert_batch_size,
+                          result_cache=result_cache, scheduler=scheduler) as util:
+            if collector is not None:
+                util.add_metrics_hook(collector)
+            if len(files) == 1:
+                run_file(util, files[0], writer, jobs=args.jobs, page_size=args.page_size,
+                         single_transaction=args.single_transaction, transaction_chunk=args.transaction_chunk)
+            else:
+                run_files(util, args.stages, writer, file_jobs=args.file_jobs, jobs=args.jobs,
+                          single_transaction=args.single_transaction, transaction_chunk=args.transaction_chunk)
+    finally:
+        # Failed runs are the ones worth profiling, so report even after sys.exit
+        print_scheduler_stats(scheduler)
+        if result_cache is not None:
+            print_cache_stats(result_cache)
+            result_cache.close()
+        if collector is not None:
+            print_profile(collector)
+        if jsonl is not None:
+            jsonl.close()
+            print(f"📝 Metrics written to {args.profile_jsonl}")
+
+def run_file(util: SupabaseUtil, sql_file: str, writer: ResultWriter, jobs: int = 1,
+             page_size: int = DEFAULT_PAGE_SIZE, single_transaction: bool = False,
+             transaction_chunk: Optional[int] = None):
+    """Check the connection, execute one SQL file and print its results"""
+    streaming = not single_transaction and jobs == 1
+    if streaming and served_from_cache(util, sql_file):
+        print("💾 Every statement has a cached result, skipping the connection test")
+    else:
+        check_connection(util)
+    
+    # Execute SQL file
+    print(f"🚀 Executing SQL file: {sql_file}")
+    if single_transaction:
+        # One round trip per chunk; results arrive together once it commits or rolls back
+        result = util.execute_sql_file(sql_file, single_transaction=True, transaction_chunk_size=transaction_chunk)
+        report_results(collected_entries(result), writer)
+    elif not streaming:
+        # Concurrent statements finish out of order, so collect results before printing
+        result = util.execute_sql_file(sql_file, jobs=jobs)
+        report_results(collected_entries(result), writer)
+    else:
+        report_results(streamed_entries(util, sql_file, page_size), writer)
+
+def run_files(util: SupabaseUtil, stages, writer: ResultWriter, file_jobs: int = 4, jobs: int = 1,
+              single_transaction: bool = False, transaction_chunk: Optional[int] = None):
+    """Check the connection once, run the files of each stage concurrently, then print a merged summary
+    
+    A stage only starts when every file of the previous stage succeeded; after a
+    failure the remaining stages are skipped.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
     
-    sql_file = sys.argv[1]
+    check_connection(util)
     
-    # Initialize utility
-    util = SupabaseUtil()
+    files = [path for stage in stages for path in stage]
+    print(f"🚀 Executing {len(files)} SQL files in {len(stages)} stage(s), up to {file_jobs} at a time")
+    outcomes = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=file_jobs) as pool:
+        for number, stage in enumerate(stages, 1):
+            if any(not outcome["success"] for outcome in outcomes.values()):
+                break
+            if len(stages) > 1:
+                print(f"\n📂 Stage {number}/{len(stages)}: {len(stage)} file(s)")
+            futures = {pool.submit(execute_file, util, path, jobs, single_transaction, transaction_chunk): path
+                       for path in stage}
+            # Report files as they finish; rows are written from this thread only
+            for future in as_completed(futures):
+                outcome = future.result()
+                outcomes[futures[future]] = outcome
+                report_file(outcome, writer)
     
-    # Test connection
+    print_file_summary(files, outcomes, time.perf_counter() - start)
+    if len(outcomes) == len(files) and all(outcome["success"] for outcome in outcomes.values()):
+        print("✅ All SQL files executed successfully")
+    else:
+        print("❌ SQL execution failed: some files failed")
+        sys.exit(1)
+
+def execute_file(util: SupabaseUtil, path: str, jobs: int, single_transaction: bool,
+                 transaction_chunk: Optional[int]) -> dict:
+    """Run one file of a multi-file run and summarize its statements"""
+    start = time.perf_counter()
+    result = util.execute_sql_file(path, jobs=jobs, single_transaction=single_transaction,
+                                   transaction_chunk_size=transaction_chunk)
+    entries = collected_entries(result)
+    return {
+        "file": path,
+        "success": bool(result["success"]) and all(entry["success"] for _, _, entry in entries),
+        "entries": entries,
+        "successful": sum(1 for _, _, entry in entries if entry["success"]),
+        "seconds": time.perf_counter() - start,
+    }
+
+def report_file(outcome: dict, writer: ResultWriter):
+    """Print a finished file's status line, its failed statements and any rows it returned"""
+    counts = f"{outcome['successful']}/{len(outcome['entries'])} statements"
+    print(f"{'✅' if outcome['success'] else '❌'} {outcome['file']}: {counts} ({outcome['seconds']:.2f}s)")
+    for i, query, result in outcome["entries"]:
+        if not result["success"]:
+            error = result.get("error") or "Unknown error"
+            if not error.startswith(("Rolled back", "Not executed")):
+                query_text = " ".join(query.split())
+                query_text = query_text[:100] + "..." if len(query_text) > 100 else query_text
+                print(f"   🔍 Query {i}: {query_text}" if query_text else f"   🔍 Query {i}")
+                print(f"   ❌ {error}")
+            continue
+        rows = iter_data(result.get("data"))
+        first_row = next(rows, None)
+        if isinstance(first_row, dict):
+            if not writer.machine_readable:
+                print(f"📊 {outcome['file']}, query {i}:")
+            write_result(writer, i, query, itertools.chain([first_row], rows))
+
+def print_file_summary(files, outcomes: dict, seconds: float):
+    """Print one line per file, in run order, and the overall count"""
+    width = max(len(path) for path in files)
+    print("\n📋 Summary:")
+    for path in files:
+        outcome = outcomes.get(path)
+        if outcome is None:
+            print(f"   ⏭️  {path.ljust(width)}  skipped: an earlier stage failed")
+            continue
+        status = "✅" if outcome["success"] else "❌"
+        counts = f"{outcome['successful']}/{len(outcome['entries'])} statements"
+        print(f"   {status} {path.ljust(width)}  {counts:>18}  {outcome['seconds']:>7.2f}s")
+    successful = sum(1 for outcome in outcomes.values() if outcome["success"])
+    print(f"📊 {successful}/{len(files)} files successful in {seconds:.2f}s")
+
+def served_from_cache(util: SupabaseUtil, sql_file: str) -> bool:
+    """True when every statement of the file is a SELECT with a fresh cached result"""
+    if util.result_cache is None or not os.path.exists(sql_file):
+        return False
+    return all(util.is_cached(query) for query in util.iter_sql_file(sql_file))
+
+def check_connection(util: SupabaseUtil):
+    """Probe the database once, exiting when it cannot be reached"""
     print("🔌 Testing database connection...")
     if not util.connect_to_database():
         print("❌ Failed to connect to database")
@@ -27,86 +321,257 @@ def main():
         sys.exit(1)
     
     print("✅ Database connection successful")
+
+def migrate(args):
+    """Run `migrate` with a util that keeps the result cache of normal runs consistent"""
+    # Applied statements invalidate the results cached by earlier --cache runs, as in a normal run
+    result_cache = ResultCache() if os.path.exists(default_result_cache_path()) else None
+    try:
+        with SupabaseUtil(result_cache=result_cache) as util:
+            apply_migrations(util, args)
+    finally:
+        if result_cache is not None:
+            result_cache.close()
+
+def apply_migrations(util: SupabaseUtil, args):
+    """Print the plan of the migration directory and apply it unless --dry-run is given"""
+    runner = MigrationRunner(util, args.directory, chunk_size=args.transaction_chunk)
+    try:
+        plan = runner.plan(refresh=args.refresh)
+    except SupabaseQueryError as e:
+        print(f"❌ Could not read the migration ledger: {e}")
+        sys.exit(1)
     
-    # Execute SQL file
-    print(f"🚀 Executing SQL file: {sql_file}")
-    result = util.execute_sql_file(sql_file)
+    print_plan(plan)
+    if plan.is_up_to_date:
+        print("✅ Database is up to date")
+        return
+    if args.dry_run:
+        print("📝 Dry run: nothing was applied")
+        return
     
-    if result["success"]:
-        print("✅ SQL file executed successfully")
-        if result.get("data"):
-            data = result["data"]
+    if plan.pending_count:
+        print(f"🚀 Applying {plan.pending_count} statements...")
+    else:
+        print("📝 Recording already applied files in the local state...")
+    result = runner.apply(plan)
+    for entry in result.get("data") or []:
+        if entry["result"] is None:
+            print(f"✅ {entry['file']}: already in the ledger")
+        elif entry["result"]["success"]:
+            print(f"✅ {entry['file']}: {entry['applied']} statements applied")
+        else:
+            print(f"❌ {entry['file']}: rolled back")
+            for query_result in entry["result"].get("data") or []:
+                if not query_result["success"] and not query_result["error"].startswith(("Rolled back", "Not executed")):
+                    print(f"   🔍 Statement {query_result['query_number']}: {query_result['query']}")
+                    print(f"   {query_result['error']}")
+    if not result["success"]:
+        print(f"❌ Migration failed: {result.get('error', 'Unknown error')}")
+        sys.exit(1)
+    print("✅ Migrations applied successfully")
+
+def export(args):
+    """Export each table to a file in the output directory, only new rows with --incremental"""
+    state_path = os.path.join(args.output_dir, WATERMARK_FILE)
+    try:
+        os.makedirs(args.output_dir, exist_ok=True)
+        watermarks = read_watermarks(state_path) if args.incremental else {}
+    except (OSError, OutputError) as e:
+        print(f"❌ Cannot use {args.output_dir}: {e}")
+        sys.exit(1)
+    
+    failed = []
+    with SupabaseUtil(pool_size=max(10, args.jobs)) as util:
+        for table in args.tables:
+            previous = watermarks.get(table) or {}
+            since = previous.get("watermark") if previous.get("column") == args.watermark_column else None
+            name = snapshot_name(table, args.format, incremental=args.incremental, compress=not args.no_compress)
+            if since is not None:
+                print(f"📦 Exporting {table} rows with {args.watermark_column} after {since}...")
+            else:
+                print(f"📦 Exporting {table}...")
             
-            # Check if this is multiple query results
-            if isinstance(data, list) and len(data) > 0 and isinstance(data[0], dict) and "query_number" in data[0]:
-                # Multiple queries executed
-                print(f"📊 Results ({result.get('successful_queries', 0)}/{result.get('total_queries', 0)} queries successful):")
-                print("=" * 80)
-                
-                for query_result in data:
-                    print(f"\n🔍 Query {query_result['query_number']}: {query_result['query']}")
-                    print("-" * 60)
-                    
-                    if query_result["success"]:
-                        query_data = query_result.get("data")
-                        if query_data:
-                            if isinstance(query_data, list) and len(query_data) > 0:
-                                # Display table data
-                                if isinstance(query_data[0], dict):
-                                    columns = list(query_data[0].keys())
-                                    header = " | ".join([col.ljust(15) for col in columns])
-                                    print(header)
-                                    print("-" * len(header))
-                                    
-                                    for row in query_data:
-                                        row_str = " | ".join([str(row.get(col, "")).ljust(15) for col in columns])
-                                        print(row_str)
-                                else:
-                                    for item in query_data:
-                                        print(item)
-                            elif isinstance(query_data, str):
-                                print(query_data)
-                            else:
-                                print(query_data)
-                        else:
-                            print("Query executed successfully (no data returned)")
-                    else:
-                        print(f"❌ Query failed: {query_result.get('error', 'Unknown error')}")
-                
-                print("=" * 80)
+            start = time.perf_counter()
+            result = util.export_table(table, os.path.join(args.output_dir, name), fmt=args.format, jobs=args.jobs,
+                                       key_column=args.key_column, page_size=args.page_size,
+                                       watermark_column=args.watermark_column if args.incremental else None,
+                                       since=since, compression="none" if args.no_compress else None)
+            seconds = time.perf_counter() - start
+            if not result["success"]:
+                print(f"❌ {result['error']}")
+                failed.append(table)
+                continue
+            
+            data = result["data"]
+            if data["path"] is None:
+                print(f"💤 {table}: no new rows" if since is not None else f"💤 {table}: no rows, nothing written")
             else:
-                # Single query result (original format)
+                print(f"✅ {table}: {data['rows']} rows in {data['chunks']} chunk{'s' if data['chunks'] != 1 else ''} → {data['path']} "
+                      f"({format_bytes(data['bytes'])}, {seconds:.1f}s, {data['rows'] / seconds if seconds else 0:.0f} rows/s)")
+            if args.incremental and data["watermark"] is not None and data["watermark"] != since:
+                # Saved after every table, so a later failure keeps the progress made so far
+                watermarks[table] = {"column": args.watermark_column, "watermark": data["watermark"],
+                                     "file": data["path"]}
+                write_watermarks(state_path, watermarks)
+    
+    if failed:
+        print(f"❌ {len(failed)} of {len(args.tables)} exports failed: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"✅ Exported {len(args.tables)} tables to {args.output_dir}")
+
+def print_plan(plan: MigrationPlan):
+    """Print one line per migration file and the statements it would run"""
+    source = "ledger" if plan.ledger_checked else "local state, no requests sent"
+    print(f"📋 Migration plan ({source}):")
+    for file in plan.files:
+        if file.status == 'unchanged':
+            print(f"   ✔️  {file.name}: up to date")
+        elif not file.pending:
+            print(f"   ✔️  {file.name}: every statement already in the ledger")
+        else:
+            print(f"   ➕ {file.name}: {file.status}, {len(file.pending)}/{len(file.statements)} statements to apply")
+            for statement in file.pending:
+                query_text = " ".join(statement.query.split())
+                query_text = query_text[:100] + "..." if len(query_text) > 100 else query_text
+                print(f"        {statement.number}: {query_text}")
+
+def streamed_entries(util: SupabaseUtil, sql_file: str, page_size: int):
+    """(query_number, query, result) for each statement, executed one at a time as they are consumed"""
+    if not os.path.exists(sql_file):
+        print(f"❌ SQL execution failed: File {sql_file} not found")
+        sys.exit(1)
+    # Consecutive INSERTs are sent as bulk inserts and reported once their batch is done
+    return util.stream_queries(util.iter_sql_file(sql_file), page_size=page_size)
+
+def collected_entries(result: dict):
+    """(query_number, query, result) for each statement of an execute_sql_file result"""
+    data = result.get("data")
+    if isinstance(data, list) and len(data) > 0 and isinstance(data[0], dict) and "query_number" in data[0]:
+        return [(query_result["query_number"], query_result["query"], query_result) for query_result in data]
+    # A single statement, or a failure before any statement ran
+    return [(1, "", result)]
+
+def report_results(entries, writer: ResultWriter):
+    """Print each statement's outcome and hand its rows to the writer as they arrive"""
+    entries = iter(entries)
+    first = next(entries, None)
+    if first is None:
+        print("❌ SQL execution failed: SQL file is empty")
+        sys.exit(1)
+    second = next(entries, None)
+    
+    if second is None:
+        # Single query result (original format)
+        i, query, result = first
+        if not result["success"]:
+            print(f"❌ SQL execution failed: {result.get('error', 'Unknown error')}")
+            sys.exit(1)
+        try:
+            rows = iter_data(result.get("data"))
+            first_row = next(rows, None)
+            print("✅ SQL file executed successfully")
+            if first_row is not None:
                 print("📊 Results:")
                 print("-" * 50)
-                
-                if isinstance(data, list) and len(data) > 0:
-                    # Display table data nicely
-                    if isinstance(data[0], dict):
-                        # Get column names from first row
-                        columns = list(data[0].keys())
-                        
-                        # Print header
-                        header = " | ".join([col.ljust(15) for col in columns])
-                        print(header)
-                        print("-" * len(header))
-                        
-                        # Print each row
-                        for row in data:
-                            row_str = " | ".join([str(row.get(col, "")).ljust(15) for col in columns])
-                            print(row_str)
-                    else:
-                        # Simple list of values
-                        for item in data:
-                            print(item)
-                elif isinstance(data, str):
-                    print(data)
-                else:
-                    print(data)
-                
+                write_result(writer, i, query, itertools.chain([first_row], rows))
                 print("-" * 50)
+        except SupabaseQueryError as e:
+            print(f"❌ SQL execution failed: {e}")
+            sys.exit(1)
+        return
+    
+    # Multiple queries: report each one as soon as it is available
+    print("📊 Results:")
+    print("=" * 80)
+    total = successful = 0
+    for i, query, result in itertools.chain([first, second], entries):
+        total += 1
+        query_text = query[:100] + "..." if len(query) > 100 else query
+        print(f"\n🔍 Query {i}: {query_text}")
+        print("-" * 60)
+        
+        if result["success"]:
+            try:
+                if write_result(writer, i, query, iter_data(result.get("data"))) == 0:
+                    print("Query executed successfully (no data returned)")
+                successful += 1
+            except SupabaseQueryError as e:
+                print(f"❌ Query failed: {e}")
+        else:
+            print(f"❌ Query failed: {result.get('error', 'Unknown error')}")
+    
+    print("=" * 80)
+    print(f"📊 {successful}/{total} queries successful")
+    if successful == total:
+        print("✅ SQL file executed successfully")
     else:
-        print(f"❌ SQL execution failed: {result['error']}")
+        print("❌ SQL execution failed: some queries failed")
         sys.exit(1)
 
+def write_result(writer: ResultWriter, query_number: int, query: str, rows) -> int:
+    """Write one statement's rows; everything is flushed before the next status line is printed"""
+    writer.begin_result(query_number, query)
+    try:
+        return writer.write_rows(rows)
+    finally:
+        writer.end_result()
+
+def print_cache_stats(result_cache: ResultCache):
+    """Print how many SELECTs were answered from the result cache"""
+    stats = result_cache.stats()
+    if stats["hits"] or stats["misses"]:
+        print(f"💾 Result cache: {stats['hits']} hits ({stats['memory_hits']} memory, {stats['disk_hits']} disk), "
+              f"{stats['misses']} misses, {stats['invalidations']} invalidated")
+
+def print_scheduler_stats(scheduler: RequestScheduler):
+    """Summarize rate limiting and retries, if there were any"""
+    stats = scheduler.stats()
+    if not (stats["throttled"] or stats["retries"] or stats["failures"]):
+        return
+    print(f"🚦 Requests: {stats['requests']} sent, {stats['throttled']} rate limited, {stats['retries']} retried, "
+          f"{stats['failures']} gave up; concurrency limit ended at {stats['concurrency_limit']}")
+    if scheduler.budget_exhausted:
+        print(f"❌ Error budget of {stats['error_budget']} failed requests exhausted; the remaining statements were not sent")
+
+def print_profile(collector: MetricsCollector, top: int = 10):
+    """Print totals per phase and path, then the slowest statements"""
+    totals = collector.totals()
+    if not totals["records"]:
+        return
+    wall = totals["wall_time"]
+    print(f"\n⏱️  Profile: {totals['records']} measured, {wall:.3f}s, {totals['requests']} requests, "
+          f"{format_bytes(totals['bytes_out'])} sent, {format_bytes(totals['bytes_in'])} received, {totals['rows']} rows")
+    print("   Phases: " + " | ".join(
+        f"{name} {totals['phases'].get(name, 0.0):.3f}s ({100 * totals['phases'].get(name, 0.0) / wall if wall else 0:.0f}%)"
+        for name in PHASES))
+    print("   Paths:  " + " | ".join(f"{path} {count}" for path, count in sorted(totals["paths"].items())))
+    print(f"   Slowest statements:")
+    print(f"   {'query':>7} {'time':>9} {'path':<12} {'reqs':>5} {'rows':>7}  statement")
+    for metrics in collector.slowest(top):
+        number = metrics.query_number if metrics.query_number is not None else "-"
+        if metrics.statements > 1:
+            number = f"{number}+{metrics.statements - 1}"
+        query_text = " ".join(metrics.query.split())
+        query_text = query_text[:60] + "..." if len(query_text) > 60 else query_text
+        status = "" if metrics.success else "❌ "
+        print(f"   {number:>7} {metrics.wall_time:>8.3f}s {metrics.path or '-':<12} {metrics.requests:>5} "
+              f"{metrics.rows if metrics.rows is not None else '-':>7}  {status}{query_text}")
+
+def format_bytes(count: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f}{unit}" if unit == "B" else f"{count:.1f}{unit}"
+        count /= 1024
+    return f"{count:.1f}GB"
+
+def iter_data(data):
+    """Iterate over result data: rows for lists/iterators, a single item otherwise"""
+    if data is None or data == "" or data == []:
+        return iter(())
+    if isinstance(data, (list, Iterator)):
+        return iter(data)
+    return iter([data])
+
 if __name__ == "__main__":
     main()
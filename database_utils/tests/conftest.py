@@ -0,0 +1,34 @@
+"""
+Shared fixtures: an in-process fake PostgREST server and utilities pointed at it.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_postgrest import FakePostgrest
+from utils.rpc_discovery import RpcEndpointCache
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """A fake server with a 5000-row submissions table, configured as the project to use"""
+    with FakePostgrest(tables={'submissions': 5000}) as fake:
+        monkeypatch.setenv('NEXT_PUBLIC_SUPABASE_URL', fake.url)
+        monkeypatch.setenv('SUPABASE_SERVICE_ROLE_KEY', 'test')
+        monkeypatch.setenv('DB_UTILS_CACHE_DIR', str(tmp_path / 'cache'))
+        yield fake
+
+
+@pytest.fixture
+def util(server):
+    """A SupabaseUtil for the fake server with an in-memory RPC cache"""
+    from utils.supabase_util import SupabaseUtil
+
+    with SupabaseUtil(rpc_cache=RpcEndpointCache(path=None)) as db:
+        yield db
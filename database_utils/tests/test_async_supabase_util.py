@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from utils.rpc_discovery import RpcEndpointCache
+
+QUERY = "SELECT id, score FROM submissions WHERE id <= 3 ORDER BY id"
+
+
+@pytest.fixture
+def run(server):
+    """Run a coroutine function with an AsyncSupabaseUtil for the fake server"""
+    from utils.async_supabase_util import AsyncSupabaseUtil
+
+    def run(fn, **kwargs):
+        async def main():
+            async with AsyncSupabaseUtil(rpc_cache=RpcEndpointCache(path=None), **kwargs) as db:
+                return await fn(db)
+        return asyncio.run(main())
+    return run
+
+
+def test_results_match_the_sync_util(run, util):
+    async def query(db):
+        return await db.execute_raw_query(QUERY)
+
+    assert run(query) == util.execute_raw_query(QUERY)
+
+
+def test_timeout_fails_the_statement_and_frees_its_slot(run):
+    async def query(db):
+        result = await db.execute_raw_query("SELECT id FROM submissions", timeout=0.0001)
+        return result, db.scheduler.in_flight, await db.execute_raw_query(QUERY)
+
+    result, in_flight, after = run(query)
+    assert result == {"success": False, "error": "Query timed out after 0.0001s"}
+    assert in_flight == 0
+    assert after["success"]
+
+
+def test_sql_file_runs_every_statement(run, tmp_path):
+    path = tmp_path / 'script.sql'
+    path.write_text("SELECT id FROM submissions WHERE id = 1;\nSELECT id FROM submissions WHERE id = 2;\n")
+
+    async def execute(db):
+        return await db.execute_sql_file(str(path), jobs=2)
+
+    result = run(execute)
+    assert result["success"]
+    assert [entry["data"] for entry in result["data"]] == [[{"id": 1}], [{"id": 2}]]
@@ -0,0 +1,134 @@
+from argparse import Namespace
+
+import pytest
+
+import run_sql
+from utils.migrations import MigrationRunner, statement_checksum
+from utils.query_core import SupabaseQueryError
+from utils.result_cache import ResultCache
+from utils.supabase_util import SupabaseUtil
+
+CACHED = "SELECT id, score FROM submissions WHERE id = 1"
+
+
+def test_migrate_invalidates_cached_results(server, tmp_path):
+    cache = ResultCache()
+    with SupabaseUtil(result_cache=cache) as util:
+        assert util.execute_raw_query(CACHED)["success"]
+        assert util.is_cached(CACHED)
+    cache.close()
+
+    directory = tmp_path / 'migrations'
+    directory.mkdir()
+    (directory / '001_scores.sql').write_text("UPDATE submissions SET score = 0 WHERE id = 1;\n")
+    run_sql.migrate(Namespace(directory=str(directory), dry_run=False, refresh=False, transaction_chunk=None))
+
+    cache = ResultCache()
+    with SupabaseUtil(result_cache=cache) as util:
+        assert not util.is_cached(CACHED)
+    cache.close()
+
+FIRST = "CREATE TABLE scores (id INT);\nINSERT INTO scores VALUES (1);\n"
+
+
+@pytest.fixture
+def directory(tmp_path):
+    path = tmp_path / 'migrations'
+    path.mkdir()
+    (path / '001_scores.sql').write_text(FIRST)
+    return path
+
+
+@pytest.fixture
+def runner(util, directory, tmp_path):
+    return MigrationRunner(util, str(directory), state_path=str(tmp_path / 'migrations.json'))
+
+
+def ledger(monkeypatch, util, rows):
+    """Serve ledger rows instead of reading db_utils_migrations from the server"""
+    queries = []
+
+    def iter_select(query):
+        queries.append(query)
+        return iter(rows)
+
+    monkeypatch.setattr(util, 'iter_select', iter_select)
+    return queries
+
+
+def test_missing_ledger_plans_every_file_as_new(runner, directory):
+    (directory / '002_more.sql').write_text("INSERT INTO scores VALUES (2);\n")
+    plan = runner.plan()
+
+    assert plan.ledger_checked
+    assert [(file.name, file.status, len(file.pending)) for file in plan.files] == [
+        ('001_scores.sql', 'new', 2), ('002_more.sql', 'new', 1)]
+    assert plan.pending_count == 3
+
+
+def test_applied_files_are_planned_without_requests(runner, server):
+    assert runner.apply(runner.plan())["success"]
+    requests_before = server.requests
+    plan = runner.plan()
+
+    assert plan.is_up_to_date
+    assert not plan.ledger_checked
+    assert server.requests == requests_before
+
+
+def test_missing_ledger_after_applying_is_an_error(runner, directory):
+    runner.apply(runner.plan())
+    (directory / '001_scores.sql').write_text(FIRST + "INSERT INTO scores VALUES (2);\n")
+
+    with pytest.raises(SupabaseQueryError):
+        runner.plan()
+
+
+def test_edited_file_only_runs_new_statements(runner, directory, util, monkeypatch):
+    runner.apply(runner.plan())
+    (directory / '001_scores.sql').write_text(
+        "-- the table\nCREATE TABLE scores (id INT);\n\nINSERT INTO scores VALUES (1);\nINSERT INTO scores VALUES (2);\n")
+    queries = ledger(monkeypatch, util, [
+        {"file": '001_scores.sql', "checksum": statement_checksum("CREATE TABLE scores (id INT)"), "occurrence": 1},
+        {"file": '001_scores.sql', "checksum": statement_checksum("INSERT INTO scores VALUES (1)"), "occurrence": 1},
+    ])
+    file, = runner.plan().files
+
+    assert file.status == 'changed'
+    assert [statement.number for statement in file.pending] == [3]
+    assert "WHERE file IN ('001_scores.sql')" in queries[0]
+
+
+def test_fully_recorded_edit_is_marked_applied(runner, directory, util, monkeypatch):
+    (directory / '001_scores.sql').write_text(FIRST.replace(";\n", ";   \n"))
+    ledger(monkeypatch, util, [
+        {"file": '001_scores.sql', "checksum": statement_checksum(query), "occurrence": 1}
+        for query in ("CREATE TABLE scores (id INT)", "INSERT INTO scores VALUES (1)")])
+    file, = runner.plan().files
+
+    assert (file.status, file.pending) == ('applied', [])
+
+
+def test_repeated_statements_are_told_apart(runner, directory, util, monkeypatch):
+    insert = "INSERT INTO scores VALUES (1)"
+    (directory / '001_scores.sql').write_text(f"{insert};\n{insert};\n{insert};\n")
+    ledger(monkeypatch, util, [
+        {"file": '001_scores.sql', "checksum": statement_checksum(insert), "occurrence": occurrence}
+        for occurrence in (1, 2)])
+    file, = runner.plan().files
+
+    assert [statement.occurrence for statement in file.statements] == [1, 2, 3]
+    assert [(statement.number, statement.occurrence) for statement in file.pending] == [(3, 3)]
+
+
+def test_checksum_ignores_comments_and_whitespace():
+    assert statement_checksum("SELECT 1") == statement_checksum("-- one\nSELECT 1   \n\n")
+    assert statement_checksum("SELECT 1") != statement_checksum("SELECT 2")
+
+
+def test_files_are_planned_in_natural_order(runner, directory):
+    for name in ('10_last.sql', '2_second.sql', 'notes.txt'):
+        (directory / name).write_text("SELECT 1;\n")
+
+    assert [name for name, _ in runner.files()] == ['001_scores.sql', '2_second.sql', '10_last.sql']
+    assert [file.name for file in runner.plan().files] == ['001_scores.sql', '2_second.sql', '10_last.sql']
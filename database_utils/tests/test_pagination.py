@@ -0,0 +1,48 @@
+import pytest
+
+from utils.query_core import MAX_PAGE_SIZE, Paginator, SupabaseQueryError, build_select_request
+from utils.rpc_discovery import discover_primary_keys
+
+
+def test_page_size_is_capped_at_max_rows(util, server):
+    rows = list(util.iter_select("SELECT id FROM submissions", page_size=5000))
+
+    assert [row["id"] for row in rows] == list(range(1, 5001))
+    # The probe, five full pages and the empty page that ends the scan
+    assert server.requests == 1 + 5000 // MAX_PAGE_SIZE + 1
+
+
+def test_offset_pages_are_ordered_by_the_primary_key(util):
+    paginator = util._run(util._paginator(build_select_request("SELECT score FROM submissions"), 100))
+
+    assert ('order', 'id.asc') in paginator.next_params()
+
+
+def test_unordered_pages_without_a_primary_key_are_refused():
+    paginator = Paginator([('select', '*')], page_size=2)
+    paginator.advance([{"v": 1}])
+    assert paginator.done
+
+    paginator = Paginator([('select', '*')], page_size=2)
+    with pytest.raises(SupabaseQueryError, match="no stable order"):
+        paginator.advance([{"v": 1}, {"v": 2}])
+
+
+def test_query_order_and_key_column_take_precedence_over_the_primary_key():
+    ordered = Paginator([('order', 'score.desc')], primary_key=['id'])
+    keyset = Paginator([('select', '*')], key_column='user_id', primary_key=['id'])
+
+    assert [value for key, value in ordered.next_params() if key == 'order'] == ['score.desc']
+    assert [value for key, value in keyset.next_params() if key == 'order'] == ['user_id.asc']
+
+
+def test_discover_primary_keys():
+    openapi = {"definitions": {
+        "submissions": {"properties": {"id": {"description": "Note:\nThis is a Primary Key.<pk/>"},
+                                       "score": {"type": "integer"}}},
+        "memberships": {"properties": {"team_id": {"description": "<pk/>"}, "user_id": {"description": "<pk/>"}}},
+        "log": {"properties": {"line": {}}},
+    }}
+
+    assert discover_primary_keys(openapi) == {"submissions": ["id"], "memberships": ["team_id", "user_id"]}
+    assert discover_primary_keys({}) == {}
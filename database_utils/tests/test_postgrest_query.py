@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fake_postgrest import make_row
+
+from utils.postgrest_query import constant_value, parse_interval, quote_value, translate_select
+from utils.sql_select import UnsupportedQueryError, is_aggregate_query, parse_select
+
+
+@pytest.mark.parametrize('sql, params, headers', [
+    ("SELECT * FROM submissions", [], {}),
+    ("SELECT id, score FROM submissions WHERE score >= 10 AND is_correct = true "
+     "ORDER BY score DESC, id LIMIT 5 OFFSET 10",
+     [('select', 'id,score'), ('score', 'gte.10'), ('is_correct', 'eq.true'),
+      ('order', 'score.desc,id.asc'), ('limit', '5'), ('offset', '10')], {}),
+    ("SELECT id FROM submissions WHERE user_id IN (1, 2, 3) OR score BETWEEN 5 AND 9",
+     [('select', 'id'), ('or', '(user_id.in.(1,2,3),and(score.gte.5,score.lte.9))')], {}),
+    ("SELECT id FROM submissions WHERE NOT (score < 3) AND note IS NULL",
+     [('select', 'id'), ('score', 'not.lt.3'), ('note', 'is.null')], {}),
+    ("SELECT id FROM submissions WHERE name LIKE 'a%' AND title ILIKE '%B_'",
+     [('select', 'id'), ('name', 'like.a*'), ('title', 'ilike.*B_')], {}),
+    ("SELECT id AS submission_id FROM public.submissions s WHERE s.score <> 0",
+     [('select', 'submission_id:id'), ('score', 'neq.0')], {}),
+    ("SELECT id FROM auth.users", [('select', 'id')], {'Accept-Profile': 'auth'}),
+    ("SELECT id FROM submissions ORDER BY score DESC NULLS LAST",
+     [('select', 'id'), ('order', 'score.desc.nullslast')], {}),
+    ("SELECT id, score FROM submissions ORDER BY 2 DESC, 1",
+     [('select', 'id,score'), ('order', 'score.desc,id.asc')], {}),
+])
+def test_translation_pushes_everything_down(sql, params, headers):
+    request = translate_select(sql)
+
+    assert request.params == params
+    assert request.headers == headers
+
+
+def test_schema_is_not_part_of_the_path():
+    assert translate_select("SELECT id FROM auth.users").path == '/rest/v1/users'
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT a.id FROM a JOIN b ON a.id = b.id",
+    "SELECT score + 1 FROM submissions",
+    "SELECT id FROM (SELECT id FROM t) sub",
+    "SELECT id FROM t WHERE score > (SELECT 1)",
+    "SELECT id FROM t WHERE a = b",
+    "SELECT COUNT(*) FROM t",
+    "SELECT DISTINCT user_id FROM t",
+    # TRUE is a constant, not the first select item
+    "SELECT id FROM t ORDER BY TRUE",
+    "SELECT id FROM t ORDER BY 2",
+])
+def test_untranslatable_queries_are_refused(sql):
+    with pytest.raises(UnsupportedQueryError):
+        translate_select(sql)
+
+
+def test_intervals_are_folded_against_now():
+    now = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+    expr = parse_select("SELECT id FROM t WHERE created_at > NOW() - INTERVAL '1 day 2 hours'").where.right
+
+    assert constant_value(expr, now) == now - timedelta(days=1, hours=2)
+    assert parse_interval('90 minutes') == timedelta(minutes=90)
+    with pytest.raises(UnsupportedQueryError):
+        parse_interval('1 month')
+
+
+def test_values_with_reserved_characters_are_quoted():
+    assert quote_value('plain') == 'plain'
+    assert quote_value('a,b') == '"a,b"'
+    assert quote_value('') == '""'
+
+
+def test_aggregates_are_detected():
+    assert is_aggregate_query(parse_select("SELECT user_id, MAX(score) FROM t GROUP BY user_id"))
+    assert not is_aggregate_query(parse_select("SELECT id FROM t"))
+
+
+@pytest.mark.parametrize('where, keep', [
+    ("score >= 990", lambda row: row['score'] >= 990),
+    ("score > 500 AND NOT puzzle_id < 490", lambda row: row['score'] > 500 and not row['puzzle_id'] < 490),
+    ("id <= 300 AND score <> 370 AND is_correct = true",
+     lambda row: row['id'] <= 300 and row['score'] != 370 and row['is_correct']),
+])
+def test_filters_return_the_rows_sql_would(util, where, keep):
+    # The fake server evaluates the comparison filters it receives
+    result = util.execute_raw_query(f"SELECT id FROM submissions WHERE {where} ORDER BY id")
+
+    assert result["success"]
+    assert [row["id"] for row in result["data"]] == [i for i in range(1, 5001) if keep(make_row(i))]
@@ -0,0 +1,76 @@
+import io
+import json
+import time
+
+from utils.query_metrics import MetricsCollector, QueryMetrics, phase, record_request
+from utils.request_scheduler import RequestScheduler
+
+QUERY = "SELECT id, score FROM submissions WHERE id <= 3 ORDER BY id"
+UPDATE = "UPDATE submissions SET score = 0 WHERE id = 1"
+
+
+def test_nested_phases_count_towards_the_outer_one():
+    metrics = QueryMetrics("SELECT 1")
+    with metrics.active():
+        with phase('http'):
+            with phase('decode'):
+                time.sleep(0.01)
+        record_request(10, 20)
+    metrics.finish({"success": True, "data": [{"a": 1}]})
+
+    assert set(metrics.phases) == {'http', 'local'}
+    assert metrics.phases['http'] >= 0.01
+    assert metrics.wall_time >= metrics.phases['http'] + metrics.phases['local'] - 1e-9
+    assert (metrics.requests, metrics.bytes_out, metrics.bytes_in, metrics.rows) == (1, 10, 20, 1)
+
+
+def test_nothing_is_recorded_without_a_current_record():
+    with phase('http'):
+        record_request(10, 20)
+
+
+def test_statement_records_phases_requests_and_bytes(util, monkeypatch):
+    session = util._get_session()
+    send = session.request
+    traffic = []
+
+    def counted(method, url, **kwargs):
+        response = send(method, url, **kwargs)
+        traffic.append((len(response.request.body or b''), len(response.content)))
+        return response
+
+    monkeypatch.setattr(session, 'request', counted)
+    jsonl = io.StringIO()
+    util.add_metrics_hook(MetricsCollector(jsonl))
+    assert util.execute_raw_query(QUERY)["success"]
+    assert util.execute_raw_query(UPDATE)["success"]
+    select, update = [json.loads(line) for line in jsonl.getvalue().splitlines()]
+
+    assert set(select) == {"query_number", "query", "statements", "path", "success", "error", "started_at",
+                           "wall_time", "phases", "requests", "bytes_out", "bytes_in", "rows"}
+    # The health probe belongs to the first statement
+    assert (select["path"], select["success"], select["rows"], select["requests"]) == ("select", True, 3, 2)
+    assert set(select["phases"]) == {"connect", "throttle", "http", "decode", "local"}
+    assert (select["bytes_out"], select["bytes_in"]) == tuple(map(sum, zip(*traffic[:2])))
+
+    assert (update["path"], update["requests"]) == ("rpc", 1)
+    assert set(update["phases"]) == {"throttle", "http", "decode", "local"}
+    assert (update["bytes_out"], update["bytes_in"]) == traffic[2]
+    assert update["bytes_out"] > len(UPDATE)
+    assert abs(sum(update["phases"].values()) - update["wall_time"]) < 1e-3
+
+
+def test_rate_limit_waits_are_recorded_as_throttle(server):
+    from utils.supabase_util import SupabaseUtil
+
+    collector = MetricsCollector()
+    with SupabaseUtil(scheduler=RequestScheduler(rate=20, burst=1)) as util:
+        util.add_metrics_hook(collector)
+        for _ in range(3):
+            util.execute_raw_query(UPDATE)
+
+    totals = collector.totals()
+    # Four requests (probe included) at 20 per second wait at least 3 * 50 ms
+    assert totals["requests"] == 4
+    assert totals["phases"]["throttle"] >= 0.12
+    assert totals["paths"] == {"rpc": 3}
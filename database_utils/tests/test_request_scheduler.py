@@ -0,0 +1,106 @@
+import random
+import time
+from email.utils import formatdate
+
+import pytest
+
+from utils.request_scheduler import ErrorBudgetExhausted, RequestScheduler, parse_retry_after
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    """Back off by the full exponential delay so decisions are deterministic"""
+    monkeypatch.setattr(random, 'uniform', lambda low, high: high)
+
+
+@pytest.mark.parametrize('status, idempotent, delay', [
+    (429, False, 0.0),   # rejected before running: always retried, paced by the cut limit
+    (503, True, 0.0),
+    (500, True, 0.5),
+    (502, True, 0.5),
+    (None, True, 0.5),   # dropped connection
+    (500, False, None),  # the statement may have run
+    (503, False, None),
+    (None, False, None),
+    (200, True, None),
+    (404, True, None),
+])
+def test_first_retry_decision(status, idempotent, delay):
+    assert RequestScheduler().next_retry(0, status, idempotent) == delay
+
+
+def test_backoff_grows_and_is_capped():
+    scheduler = RequestScheduler(max_retries=10, backoff_factor=0.5, max_backoff=3.0)
+
+    assert [scheduler.next_retry(attempt, 500, True) for attempt in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+    # Throttled retries skip the first backoff step
+    assert [scheduler.next_retry(attempt, 429, False) for attempt in range(3)] == [0.0, 0.5, 1.0]
+
+
+def test_gives_up_after_max_retries_and_counts_a_failure():
+    scheduler = RequestScheduler(max_retries=2)
+
+    assert scheduler.next_retry(1, 500, True) is not None
+    assert scheduler.next_retry(2, 500, True) is None
+    assert (scheduler.retries, scheduler.failures) == (1, 1)
+
+
+def test_error_budget_stops_retries_and_new_requests():
+    scheduler = RequestScheduler(error_budget=1)
+    for _ in range(2):
+        ticket = scheduler.acquire()
+        scheduler.release(ticket, 500)
+        assert scheduler.next_retry(0, 500, False) is None
+
+    assert scheduler.budget_exhausted
+    assert scheduler.next_retry(0, 429, False) is None
+    with pytest.raises(ErrorBudgetExhausted):
+        scheduler.acquire()
+
+    scheduler.reset()
+    assert not scheduler.budget_exhausted
+
+
+def test_throttling_cuts_the_limit_once_per_round_and_recovers():
+    scheduler = RequestScheduler(max_concurrency=8)
+    tickets = [scheduler.acquire() for _ in range(4)]
+
+    for ticket in tickets:
+        scheduler.release(ticket, 429)
+    assert scheduler.limit == 4
+    assert scheduler.throttled == 4
+
+    for _ in range(20):
+        scheduler.release(scheduler.acquire(), 200)
+    assert 4 < scheduler.limit <= 8
+
+
+def test_concurrency_limit_blocks_extra_requests():
+    scheduler = RequestScheduler(max_concurrency=2)
+    scheduler.acquire()
+    scheduler.acquire()
+
+    assert scheduler._try_acquire(0.0) is None
+    assert scheduler.in_flight == 2
+
+
+def test_rate_limit_waits_for_a_token():
+    scheduler = RequestScheduler(rate=10, burst=1)
+    scheduler.release(scheduler.acquire(), 200)
+
+    assert scheduler._try_acquire(scheduler._refilled_at) == pytest.approx(0.1)
+
+
+def test_retry_after_pauses_every_request():
+    scheduler = RequestScheduler()
+    scheduler.release(scheduler.acquire(), 429, retry_after=2.0)
+
+    assert 1.9 < scheduler._try_acquire(scheduler._paused_until - 2.0) <= 2.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert 0 < parse_retry_after(formatdate(usegmt=True, timeval=time.time() + 30)) <= 30
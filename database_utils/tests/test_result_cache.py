@@ -0,0 +1,177 @@
+import json
+
+import pytest
+
+from utils import result_cache as result_cache_module
+from utils.result_cache import ResultCache, normalize_sql
+from utils.sql_analysis import is_volatile
+from utils.supabase_util import SupabaseUtil
+
+URL = "https://example.supabase.co"
+ROWS = [{"id": 1, "name": "Ada"}]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache_module.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(path=str(tmp_path / 'results.sqlite'))
+    yield cache
+    cache.close()
+
+
+def reopen(cache, **kwargs):
+    """A cache on the same file with an empty memory tier, as in the next run"""
+    cache.close()
+    return ResultCache(path=cache.path, **kwargs)
+
+
+def test_normalized_queries_share_an_entry(cache):
+    cache.put(URL, "SELECT * FROM Users WHERE name = 'Ada'", ['users'], ROWS)
+
+    assert cache.get(URL, "select *\n  from users where name = 'Ada';") == (True, ROWS)
+    assert cache.get(URL, "SELECT * FROM users WHERE name = 'ada'") == (False, None)
+    assert cache.get("https://other.supabase.co", "SELECT * FROM users WHERE name = 'Ada'") == (False, None)
+    assert normalize_sql('SELECT "Name"  FROM T;') == normalize_sql('select "Name" from t')
+    assert normalize_sql('SELECT "Name" FROM t') != normalize_sql('SELECT "name" FROM t')
+
+
+def test_cached_rows_cannot_be_changed_by_callers(cache):
+    cache.put(URL, "SELECT * FROM users", ['users'], ROWS)
+    cache.get(URL, "SELECT * FROM users")[1][0]["name"] = "Bob"
+
+    assert cache.get(URL, "SELECT * FROM users") == (True, ROWS)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(path=None, max_entries=2)
+    for name in 'abc':
+        cache.put(URL, f"SELECT * FROM {name}", [name], [name])
+        if name == 'b':
+            cache.get(URL, "SELECT * FROM a")
+
+    assert [cache.contains(URL, f"SELECT * FROM {name}") for name in 'abc'] == [True, False, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_tier_is_bounded_in_bytes():
+    payload = ["x" * 100]
+    size = len(json.dumps(payload, separators=(',', ':')))
+    cache = ResultCache(path=None, max_memory_bytes=2 * size)
+    for name in 'abc':
+        cache.put(URL, f"SELECT * FROM {name}", [name], payload)
+
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.stats()["memory_bytes"] == 2 * size
+    assert not cache.contains(URL, "SELECT * FROM a")
+
+
+def test_oversized_results_are_not_cached(cache):
+    cache.max_entry_bytes = 10
+    cache.put(URL, "SELECT * FROM users", ['users'], ROWS)
+    assert not cache.contains(URL, "SELECT * FROM users")
+
+    rows = list(cache.tee(URL, "SELECT * FROM users", ['users'], iter(ROWS * 3)))
+    assert rows == ROWS * 3
+    assert not cache.contains(URL, "SELECT * FROM users")
+
+
+def test_disk_tier_survives_a_new_run_and_evicts_by_size(cache):
+    cache.put(URL, "SELECT * FROM a", ['a'], ["x" * 100])
+    cache = reopen(cache)
+    assert cache.get(URL, "SELECT * FROM a") == (True, ["x" * 100])
+    assert cache.stats()["disk_hits"] == 1
+
+    cache.max_disk_bytes = 150
+    cache.put(URL, "SELECT * FROM b", ['b'], ["y" * 100])
+    cache = reopen(cache)
+    assert cache.get(URL, "SELECT * FROM a") == (False, None)
+    assert cache.get(URL, "SELECT * FROM b") == (True, ["y" * 100])
+    cache.close()
+
+
+def test_entries_expire_in_both_tiers(cache, clock):
+    cache.put(URL, "SELECT * FROM users", ['users'], ROWS)
+    cache.put(URL, "SELECT * FROM puzzles", ['puzzles'], ROWS, ttl=1000)
+    clock.now += cache.ttl - 1
+    assert cache.get(URL, "SELECT * FROM users") == (True, ROWS)
+
+    clock.now += 2
+    assert cache.get(URL, "SELECT * FROM users") == (False, None)
+    cache = reopen(cache)
+    assert cache.get(URL, "SELECT * FROM users") == (False, None)
+    assert cache.get(URL, "SELECT * FROM puzzles") == (True, ROWS)
+    cache.close()
+
+
+def test_writes_drop_the_results_of_their_tables(cache):
+    cache.put(URL, "SELECT * FROM users", ['users'], ROWS)
+    cache.put(URL, "SELECT * FROM submissions JOIN users ON true", ['submissions', 'users'], ROWS)
+    cache.put(URL, "SELECT * FROM puzzles", ['puzzles'], ROWS)
+    cache.put("https://other.supabase.co", "SELECT * FROM users", ['users'], ROWS)
+
+    assert cache.invalidate(URL, ['users']) == 2
+    assert cache.invalidate(URL, []) == 0
+    assert cache.contains(URL, "SELECT * FROM puzzles")
+    assert cache.contains("https://other.supabase.co", "SELECT * FROM users")
+
+    cache = reopen(cache)
+    assert not cache.contains(URL, "SELECT * FROM users")
+    assert cache.invalidate(URL) == 1
+    assert not cache.contains(URL, "SELECT * FROM puzzles")
+    assert cache.contains("https://other.supabase.co", "SELECT * FROM users")
+    cache.close()
+
+
+def test_stats_count_hits_misses_and_stores(cache):
+    cache.put(URL, "SELECT * FROM users", ['users'], ROWS)
+    cache.get(URL, "SELECT * FROM users")
+    cache.get(URL, "SELECT * FROM users")
+    cache.get(URL, "SELECT * FROM puzzles")
+    cache.contains(URL, "SELECT * FROM puzzles")
+    cache.invalidate(URL, ['users'])
+    stats = cache.stats()
+
+    assert {key: stats[key] for key in ("hits", "memory_hits", "disk_hits", "misses", "stores", "invalidations")} == {
+        "hits": 2, "memory_hits": 2, "disk_hits": 0, "misses": 1, "stores": 1, "invalidations": 1}
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["memory_entries"] == 0
+
+
+@pytest.mark.parametrize('query, volatile', [
+    ("SELECT * FROM submissions WHERE created_at >= NOW() - INTERVAL '1 hour'", True),
+    ("SELECT * FROM submissions WHERE created_at >= CURRENT_TIMESTAMP", True),
+    ("SELECT random() AS r FROM puzzles", True),
+    ("SELECT gen_random_uuid() FROM puzzles", True),
+    ("SELECT * FROM submissions WHERE note = 'now()'", False),
+    ("SELECT known_at FROM submissions", False),
+    ("SELECT * FROM puzzles", False),
+])
+def test_volatile_statements(query, volatile):
+    assert is_volatile(query) is volatile
+
+
+def test_volatile_selects_are_not_cached(server, tmp_path):
+    cache = ResultCache(path=None)
+    stable = "SELECT id FROM submissions WHERE id <= 2"
+    volatile = "SELECT id FROM submissions WHERE id <= 2 AND score < random() * 1000"
+    with SupabaseUtil(result_cache=cache) as util:
+        util.execute_raw_query(stable)
+        util.execute_raw_query(volatile)
+
+        assert util.is_cached(stable)
+        assert not util.is_cached(volatile)
+    assert cache.stats()["stores"] == 1
@@ -0,0 +1,132 @@
+import io
+import sys
+
+import pytest
+
+from utils import result_writers
+from utils.result_writers import ArrowWriter, OutputError, TableWriter, create_writer
+
+ROWS = [
+    {"id": 1, "name": "Ada", "tags": None},
+    {"id": 22, "name": "Grace Hopper", "tags": ["a"]},
+    {"id": 333333333, "name": "a long name here", "tags": {"k": 1}},
+]
+
+
+def written(fmt, *results, **options):
+    stream = io.StringIO()
+    writer = create_writer(fmt, stream, **options)
+    for rows in results:
+        writer.begin_result(1, "SELECT 1")
+        writer.write_rows(rows)
+        writer.end_result()
+    writer.close()
+    return stream.getvalue()
+
+
+def test_table_widths_come_from_the_sampled_rows():
+    assert written('table', ROWS, sample_size=2, max_width=8) == (
+        "id | name     | tags \n"
+        "---------------------\n"
+        " 1 | Ada      |      \n"
+        "22 | Grace H… | [\"a\"]\n"
+        # Past the sample, text is cut to the sampled width and numbers are never cut
+        "333333333 | a long … | {\"k\"…\n"
+    )
+
+
+def test_table_samples_200_rows_by_default():
+    rows = [{"value": "x"}] * 200 + [{"value": "a much wider value"}]
+    lines = written('table', rows).splitlines()
+
+    assert TableWriter(io.StringIO()).sample_size == 200
+    assert lines[0] == "value"
+    assert lines[-1] == "a mu…"
+
+
+def test_table_escapes_control_characters_and_prints_other_rows():
+    assert written('table', [{"note": "a\tb\nc"}, "not a dict"]) == (
+        "note   \n"
+        "-------\n"
+        "a\\tb\\nc\n"
+        "not a dict\n"
+    )
+
+
+def test_csv_escapes_and_repeats_the_header_for_other_columns():
+    assert written('csv', ROWS[:2] + [{"id": 3, "name": 'say "hi", then\nleave', "tags": None}],
+                   [{"name": "Ada", "tags": [], "id": 1}], [{"total": 3}]) == (
+        "id,name,tags\r\n"
+        "1,Ada,\r\n"
+        '22,Grace Hopper,"[""a""]"\r\n'
+        '3,"say ""hi"", then\nleave",\r\n'
+        # Same columns in another order: no new header, values follow the header
+        "1,Ada,[]\r\n"
+        "total\r\n"
+        "3\r\n"
+    )
+
+
+@pytest.mark.parametrize('fmt', ['jsonl', 'ndjson'])
+def test_json_lines_keep_nulls_and_nested_values(fmt):
+    rows = ROWS[:2] + [{"id": 4, "name": "Zoë", "tags": None}, "status message"]
+
+    assert written(fmt, rows) == (
+        '{"id": 1, "name": "Ada", "tags": null}\n'
+        '{"id": 22, "name": "Grace Hopper", "tags": ["a"]}\n'
+        '{"id": 4, "name": "Zoë", "tags": null}\n'
+    )
+
+
+def test_output_is_written_in_large_chunks(monkeypatch):
+    monkeypatch.setattr(result_writers, 'BUFFER_SIZE', 64)
+    writes = []
+
+    class Stream(io.StringIO):
+        def write(self, text):
+            writes.append(text)
+            return super().write(text)
+
+    stream = Stream()
+    writer = create_writer('jsonl', stream)
+    writer.write_rows({"id": i} for i in range(20))
+    writer.close()
+
+    assert len(writes) < 20
+    assert stream.getvalue() == "".join(f'{{"id": {i}}}\n' for i in range(20))
+
+
+def test_unknown_format_is_an_output_error():
+    with pytest.raises(OutputError, match="Unknown output format 'xml'"):
+        create_writer('xml', io.StringIO())
+
+
+def test_arrow_needs_pyarrow(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+
+    with pytest.raises(OutputError, match="pip install pyarrow"):
+        create_writer('arrow', io.BytesIO())
+
+
+def test_arrow_stream_round_trips():
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    stream = io.BytesIO()
+    writer = ArrowWriter(stream, batch_size=2)
+    assert writer.write_rows([{"id": 1, "name": "Ada"}, {"id": 2, "name": None}, {"id": 3, "name": "Grace"}]) == 3
+    assert writer.write_rows([{"name": "Linus", "id": 4}]) == 1
+    writer.close()
+
+    table = pa.ipc.open_stream(stream.getvalue()).read_all()
+    assert table.column_names == ['id', 'name']
+    assert table.to_pylist() == [{"id": 1, "name": "Ada"}, {"id": 2, "name": None},
+                                 {"id": 3, "name": "Grace"}, {"id": 4, "name": "Linus"}]
+
+
+def test_arrow_rejects_results_with_other_columns():
+    pytest.importorskip('pyarrow')
+    writer = ArrowWriter(io.BytesIO())
+    writer.write_rows([{"id": 1, "name": "Ada"}])
+
+    with pytest.raises(OutputError, match="different columns"):
+        writer.write_rows([{"id": 2, "score": 10}])
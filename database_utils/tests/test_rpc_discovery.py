@@ -0,0 +1,86 @@
+import json
+import os
+
+from fake_postgrest import OPENAPI
+from utils.rpc_discovery import NO_RPC, RpcEndpoint, RpcEndpointCache, discover_rpc_endpoint
+from utils.supabase_util import SupabaseUtil
+
+UPDATE = "UPDATE submissions SET score = 0 WHERE id = 1"
+EXEC_SQL = RpcEndpoint('/rest/v1/rpc/exec_sql', 'sql')
+
+
+def test_endpoint_is_read_from_openapi():
+    assert discover_rpc_endpoint(OPENAPI) == EXEC_SQL
+    assert discover_rpc_endpoint({"paths": {"/rpc/execute_sql": {"post": {"parameters": [
+        {"in": "body", "schema": {"properties": {"query": {"type": "string"}}}}]}}}}) == \
+        RpcEndpoint('/rest/v1/rpc/execute_sql', 'query')
+    assert discover_rpc_endpoint({"paths": {}}) is NO_RPC
+    assert discover_rpc_endpoint("not a document") is None
+
+
+def test_discovered_once_and_reused_from_disk(server, tmp_path):
+    path = str(tmp_path / 'rpc_endpoints.json')
+    with SupabaseUtil(rpc_cache=RpcEndpointCache(path=path)) as util:
+        assert util.execute_raw_query(UPDATE)["success"]
+        assert util.execute_raw_query(UPDATE)["success"]
+    # One probe, which lists the function, then one call per statement
+    assert server.requests == 3
+    with open(path, encoding='utf-8') as file:
+        assert json.load(file)[server.url]["path"] == EXEC_SQL.path
+    assert os.listdir(tmp_path) == ['rpc_endpoints.json']
+
+    cache = RpcEndpointCache(path=path)
+    assert cache.get(server.url) == EXEC_SQL
+    assert cache.get("https://other.supabase.co") is None
+    with SupabaseUtil(rpc_cache=cache) as util:
+        assert util.execute_raw_query(UPDATE)["success"]
+    # The probe again, and the statement straight to the cached function
+    assert server.requests == 5
+
+
+def test_projects_are_cached_separately(tmp_path):
+    path = str(tmp_path / 'rpc_endpoints.json')
+    first = RpcEndpointCache(path=path)
+    first.store("https://a.supabase.co", EXEC_SQL)
+    first.store("https://b.supabase.co", NO_RPC)
+
+    second = RpcEndpointCache(path=path)
+    assert second.get("https://a.supabase.co") == EXEC_SQL
+    assert second.get("https://b.supabase.co") is NO_RPC
+    second.forget("https://a.supabase.co")
+    assert RpcEndpointCache(path=path).get("https://a.supabase.co") is None
+
+
+def test_entries_expire(tmp_path):
+    path = str(tmp_path / 'rpc_endpoints.json')
+    RpcEndpointCache(path=path).store("https://a.supabase.co", EXEC_SQL)
+    RpcEndpointCache(path=path).store("https://b.supabase.co", NO_RPC)
+
+    assert RpcEndpointCache(path=path, ttl=0).get("https://a.supabase.co") is None
+    assert RpcEndpointCache(path=path, negative_ttl=0).get("https://b.supabase.co") is None
+    assert RpcEndpointCache(path=path, negative_ttl=0).get("https://a.supabase.co") == EXEC_SQL
+
+
+def test_unreadable_cache_file_is_ignored(tmp_path):
+    path = tmp_path / 'rpc_endpoints.json'
+    path.write_text("{not json")
+    cache = RpcEndpointCache(path=str(path))
+
+    assert cache.get("https://a.supabase.co") is None
+    cache.store("https://a.supabase.co", EXEC_SQL)
+    assert RpcEndpointCache(path=str(path)).get("https://a.supabase.co") == EXEC_SQL
+
+
+def test_cached_function_that_disappeared_is_rediscovered(server, tmp_path):
+    path = str(tmp_path / 'rpc_endpoints.json')
+    RpcEndpointCache(path=path).store(server.url, RpcEndpoint('/rest/v1/rpc/execute_sql', 'query'))
+
+    with SupabaseUtil(rpc_cache=RpcEndpointCache(path=path)) as util:
+        assert util.execute_raw_query(UPDATE)["success"]
+        requests_after_first = server.requests
+        assert util.execute_raw_query(UPDATE)["success"]
+        # The replacement is used directly from then on
+        assert server.requests == requests_after_first + 1
+
+    assert RpcEndpointCache(path=path).get(server.url) == EXEC_SQL
+    assert server.statements_executed == 2
@@ -0,0 +1,118 @@
+import pytest
+
+from utils import sql_aggregate
+from utils.sql_aggregate import AggregateEngine, plan_aggregate
+from utils.sql_select import UnsupportedQueryError
+
+THRESHOLD = sql_aggregate._NUMPY_MIN_VALUES
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def path(request, monkeypatch):
+    """Run each test with the NumPy reductions and again with plain lists"""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(sql_aggregate, '_numpy', lambda: None)
+    return request.param
+
+
+def aggregate(sql, rows, batch_size=sql_aggregate.BATCH_SIZE):
+    engine = AggregateEngine(plan_aggregate(sql), batch_size)
+    engine.consume(rows)
+    return engine.result()
+
+
+@pytest.mark.parametrize('size', [THRESHOLD - 3, THRESHOLD + 100])
+def test_min_max_over_mixed_ints_and_floats(path, size):
+    # size + 2 rows: just below the NumPy threshold, and above it
+    rows = [{'v': 1}] + [{'v': 0.5}] * size + [{'v': 7.75}]
+
+    [result] = aggregate("SELECT MIN(v) AS lo, MAX(v) AS hi, SUM(v) AS total FROM t", rows)
+
+    assert result == {'lo': 0.5, 'hi': 7.75, 'total': 8.75 + 0.5 * size}
+
+
+@pytest.mark.parametrize('size', [THRESHOLD - 2, THRESHOLD + 1])
+def test_integers_stay_exact_integers(path, size):
+    rows = [{'v': i} for i in range(size)] + [{'v': None}]
+
+    [result] = aggregate("SELECT MIN(v), MAX(v), SUM(v), COUNT(v), COUNT(*) FROM t", rows)
+
+    assert result == {'min': 0, 'max': size - 1, 'sum': size * (size - 1) // 2, 'count': size + 1}
+    assert all(type(result[name]) is int for name in ('min', 'max', 'sum'))
+
+
+@pytest.mark.parametrize('size', [THRESHOLD - 1, THRESHOLD + 1])
+def test_integers_beyond_float_precision(path, size):
+    values = [2 ** 60 + i for i in range(size)]
+
+    [result] = aggregate("SELECT MIN(v), MAX(v), SUM(v) FROM t", [{'v': v} for v in values])
+
+    assert result == {'min': values[0], 'max': values[-1], 'sum': sum(values)}
+
+
+def test_integer_sums_across_many_batches_stay_exact(path):
+    values = [2 ** 40 + i for i in range(4 * THRESHOLD)]
+
+    [result] = aggregate("SELECT SUM(v) FROM t", [{'v': v} for v in values], batch_size=THRESHOLD)
+
+    assert result == {'sum': sum(values)}
+
+
+def test_group_by_having_order_by(path):
+    rows = [{'g': i % 3, 'v': i} for i in range(3 * THRESHOLD)]
+
+    result = aggregate("SELECT g, COUNT(*) AS n, AVG(v) AS mean, MAX(v) AS top FROM t "
+                       "GROUP BY g HAVING MAX(v) > 10 ORDER BY g DESC", rows)
+
+    expected = []
+    for g in (2, 1, 0):
+        values = [row['v'] for row in rows if row['g'] == g]
+        expected.append({'g': g, 'n': len(values), 'mean': sum(values) / len(values), 'top': max(values)})
+    assert result == expected
+
+
+def test_groups_reached_by_only_some_batches(path):
+    rows = [{'g': 'a', 'v': i} for i in range(THRESHOLD)] + [{'g': 'b', 'v': 0.25}] * 3
+
+    result = aggregate("SELECT g, MIN(v), SUM(v) FROM t GROUP BY g ORDER BY g", rows, batch_size=THRESHOLD)
+
+    assert result == [{'g': 'a', 'min': 0, 'sum': THRESHOLD * (THRESHOLD - 1) // 2},
+                      {'g': 'b', 'min': 0.25, 'sum': 0.75}]
+
+
+def test_distinct_and_residual_filters(path):
+    rows = [{'v': i % 5, 'name': f"n{i}"} for i in range(THRESHOLD + 10)]
+
+    [result] = aggregate("SELECT COUNT(DISTINCT v) AS kinds, SUM(v) AS total FROM t WHERE length(name) = 3", rows)
+
+    assert result == {'kinds': 5, 'total': sum(i % 5 for i in range(10, 100))}
+
+
+def test_empty_input_still_returns_a_row():
+    assert aggregate("SELECT COUNT(*) AS n, SUM(v) AS total FROM t", []) == [{'n': 0, 'total': None}]
+
+
+def test_plan_pushes_filters_down_and_fetches_only_referenced_columns():
+    plan = plan_aggregate("SELECT user_id, SUM(score) FROM submissions WHERE is_correct = true GROUP BY user_id",
+                          key_column='id')
+
+    assert plan.request.path == '/rest/v1/submissions'
+    assert dict(plan.request.params) == {'select': 'user_id,score,id', 'is_correct': 'eq.true'}
+    assert not plan.count_only
+
+
+def test_bare_count_is_answered_from_the_row_count():
+    plan = plan_aggregate("SELECT COUNT(*) FROM submissions WHERE score > 10")
+    engine = AggregateEngine(plan)
+    engine.feed_count(42)
+
+    assert plan.count_only
+    assert plan.request.headers['Prefer'] == 'count=exact'
+    assert engine.result() == [{'count': 42}]
+
+
+def test_plain_select_is_not_planned():
+    with pytest.raises(UnsupportedQueryError):
+        plan_aggregate("SELECT id FROM submissions")
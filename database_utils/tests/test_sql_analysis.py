@@ -0,0 +1,121 @@
+import pytest
+
+from utils.query_core import InsertRun, group_statements, plan_batches
+from utils.rpc_discovery import discover_foreign_keys
+from utils.sql_analysis import analyze_statement, linked_tables
+
+# The foreign keys of rebuild-database.sql
+LINKS = linked_tables({'users': set(), 'puzzles': set(), 'user_stats': {'users'}, 'submissions': {'users', 'puzzles'},
+                       'audit_log': set()})
+
+
+@pytest.mark.parametrize('query, kind, reads, writes', [
+    ("SELECT * FROM users", 'select', {'users'}, set()),
+    ("SELECT s.id FROM submissions s JOIN public.users u ON u.id = s.user_id", 'select', {'submissions', 'users'}, set()),
+    ('SELECT * FROM "Users"', 'select', {'Users'}, set()),
+    ("SELECT 'DELETE FROM users' FROM puzzles", 'select', {'puzzles'}, set()),
+    ("INSERT INTO submissions (user_id) SELECT id FROM users", 'dml', {'users'}, {'submissions'}),
+    ("UPDATE users SET name = 'x' WHERE id = 1", 'dml', set(), {'users'}),
+    ("DELETE FROM ONLY users WHERE id = 1", 'dml', {'users'}, {'users'}),
+    ("INSERT INTO users (id) VALUES (1) ON CONFLICT (id) DO UPDATE SET id = 2", 'dml', set(), {'users'}),
+    ("WITH gone AS (DELETE FROM users RETURNING id) SELECT * FROM gone", 'dml', {'gone', 'users'}, {'users'}),
+    ("SELECT * INTO backup FROM users", 'ddl', {'users'}, set()),
+    ("SELECT * FROM users FOR UPDATE", 'ddl', {'users'}, set()),
+    ("CREATE TABLE t (id INT)", 'ddl', set(), set()),
+])
+def test_analyze_statement(query, kind, reads, writes):
+    info = analyze_statement(query)
+    assert (info.kind, set(info.reads), set(info.writes)) == (kind, reads, writes)
+
+
+@pytest.mark.parametrize('query, barrier', [
+    ("SELECT * FROM users", False),
+    ("SELECT now()", True),
+    ("ALTER TABLE users ADD COLUMN age INT", True),
+    ("DELETE FROM users", False),
+])
+def test_barriers(query, barrier):
+    assert analyze_statement(query).is_barrier is barrier
+
+
+def test_foreign_keys_are_read_from_openapi():
+    openapi = {"definitions": {
+        "users": {"properties": {"id": {"description": "Note:\nThis is a Primary Key.<pk/>"}}},
+        "submissions": {"properties": {
+            "user_id": {"description": "Note:\nThis is a Foreign Key to `users.id`.<fk table='users' column='id'/>"},
+            "puzzle_id": {"description": "Note:\nThis is a Foreign Key to `puzzles.id`.<fk table='puzzles' column='id'/>"},
+            "score": {"type": "integer"},
+        }},
+    }}
+
+    assert discover_foreign_keys(openapi) == {'users': set(), 'submissions': {'users', 'puzzles'}}
+    assert discover_foreign_keys({"paths": {}}) is None
+
+
+def test_linked_tables_are_connected_both_ways_and_transitively():
+    links = linked_tables({'a': {'b'}, 'c': {'d'}, 'b': {'c'}, 'e': set()})
+
+    assert links['a'] == links['d'] == frozenset('abcd')
+    assert links['e'] == frozenset('e')
+
+
+def batches(queries, links=LINKS, jobs=4, insert_batch_size=0):
+    units = group_statements(queries, insert_batch_size)
+    return [[unit.statements[0][0] if isinstance(unit, InsertRun) else unit[0] for unit in batch]
+            for batch in plan_batches(units, jobs, links)]
+
+
+def test_reads_run_together():
+    assert batches(["SELECT * FROM users", "SELECT * FROM submissions", "SELECT * FROM users"]) == [[1, 2, 3]]
+
+
+def test_unrelated_writes_run_together():
+    assert batches(["INSERT INTO users (id) VALUES (1)", "INSERT INTO audit_log (id) VALUES (1)"]) == [[1, 2]]
+
+
+def test_write_waits_for_a_read_of_the_same_table():
+    assert batches(["SELECT * FROM users", "UPDATE users SET name = 'x'", "SELECT * FROM users"]) == [[1], [2], [3]]
+
+
+def test_child_insert_waits_for_its_parent():
+    queries = ["INSERT INTO users (id) VALUES (1)", "INSERT INTO submissions (user_id) VALUES (1)"]
+
+    assert batches(queries) == [[1], [2]]
+    # Tables without a foreign key between them stay independent
+    assert batches(queries, links=linked_tables({'users': set(), 'submissions': set()})) == [[1, 2]]
+
+
+def test_cascading_delete_waits_for_reads_of_linked_tables():
+    queries = ["SELECT * FROM submissions", "DELETE FROM users WHERE id = 1", "SELECT * FROM puzzles"]
+
+    # puzzles is linked to users through submissions
+    assert batches(queries) == [[1], [2], [3]]
+    assert batches(["SELECT * FROM audit_log", "DELETE FROM users WHERE id = 1"]) == [[1, 2]]
+
+
+def test_without_links_a_write_waits_for_every_other_table():
+    queries = ["SELECT * FROM audit_log", "SELECT * FROM puzzles", "INSERT INTO users (id) VALUES (1)",
+               "INSERT INTO puzzles (id) VALUES (1)", "SELECT now()", "SELECT * FROM users", "SELECT * FROM puzzles"]
+
+    assert batches(queries, links=None) == [[1, 2], [3], [4], [5], [6, 7]]
+
+
+def test_table_missing_from_links_is_treated_as_linked_to_everything():
+    queries = ["CREATE TABLE scores (id INT REFERENCES users (id))", "INSERT INTO users (id) VALUES (1)",
+               "INSERT INTO scores (id) VALUES (1)", "SELECT * FROM audit_log"]
+
+    assert batches(queries) == [[1], [2], [3], [4]]
+
+
+def test_barriers_and_batch_size_split_batches():
+    queries = [f"SELECT * FROM users WHERE id = {i}" for i in range(1, 10)]
+
+    assert batches(queries[:2] + ["SELECT now()"] + queries[2:4]) == [[1, 2], [3], [4, 5]]
+    # At most jobs * 8 units per batch
+    assert batches(queries, jobs=1) == [list(range(1, 9)), [9]]
+
+
+def test_insert_runs_are_scheduled_as_one_unit():
+    queries = [f"INSERT INTO users (id) VALUES ({i})" for i in range(1, 4)] + ["INSERT INTO audit_log (id) VALUES (1)"]
+
+    assert batches(queries, insert_batch_size=10) == [[1, 4]]
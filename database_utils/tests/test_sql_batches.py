@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from utils.sql_batches import expand_paths, natural_key, numeric_prefix, plan_stages, read_manifest
+
+
+@pytest.fixture
+def directory(tmp_path):
+    for name in ('01_schema.sql', '02_b.sql', '02_a.sql', '10_views.sql', '2_x.sql', 'reference.sql', 'notes.txt'):
+        (tmp_path / name).write_text("SELECT 1;\n")
+    (tmp_path / 'seeds').mkdir()
+    for name in ('users.sql', 'puzzles.sql'):
+        (tmp_path / 'seeds' / name).write_text("SELECT 1;\n")
+    return tmp_path
+
+
+def names(stages):
+    return [[os.path.basename(path) for path in stage] for stage in stages]
+
+
+def test_numbers_sort_naturally():
+    assert sorted(['10_x.sql', '2_x.sql', '1_x.sql'], key=natural_key) == ['1_x.sql', '2_x.sql', '10_x.sql']
+    assert numeric_prefix('migrations/007_users.sql') == 7
+    assert numeric_prefix('users_007.sql') is None
+
+
+def test_expand_paths_sorts_matches_of_each_pattern(directory):
+    paths = expand_paths(['seeds', '*.sql', '01_schema.sql'], str(directory))
+
+    assert [os.path.relpath(path, directory) for path in paths] == [
+        os.path.join('seeds', 'puzzles.sql'), os.path.join('seeds', 'users.sql'),
+        '01_schema.sql', '02_a.sql', '02_b.sql', '2_x.sql', '10_views.sql', 'reference.sql']
+
+
+def test_unmatched_pattern_is_an_error(directory):
+    with pytest.raises(FileNotFoundError, match="missing"):
+        expand_paths(['missing_*.sql'], str(directory))
+    with pytest.raises(FileNotFoundError):
+        expand_paths([str(directory / 'missing.sql')])
+
+
+def test_stages_follow_numeric_prefixes(directory):
+    stages = plan_stages(expand_paths(['*.sql'], str(directory)))
+
+    # 02_a, 02_b and 2_x share prefix 2 and run together, before 10_views
+    assert names(stages) == [['reference.sql', '01_schema.sql'], ['02_a.sql', '02_b.sql', '2_x.sql'], ['10_views.sql']]
+
+
+def test_unprefixed_files_alone_form_one_stage():
+    assert plan_stages(['b.sql', 'a.sql']) == [['b.sql', 'a.sql']]
+    assert plan_stages([]) == []
+
+
+def test_manifest_lists_stages_in_order(directory):
+    manifest = directory / 'nightly.txt'
+    manifest.write_text("# nightly run\n10_views.sql\n\nseeds/*.sql  reference.sql  # together\n01_schema.sql\n")
+
+    assert names(read_manifest(str(manifest))) == [
+        ['10_views.sql'], ['puzzles.sql', 'users.sql', 'reference.sql'], ['01_schema.sql']]
+
+
+def test_manifest_listing_a_file_twice_is_an_error(directory):
+    manifest = directory / 'nightly.txt'
+    manifest.write_text("seeds/*.sql\nseeds/users.sql\n")
+
+    with pytest.raises(ValueError, match="more than once"):
+        read_manifest(str(manifest))
+
+
+def test_manifest_with_a_missing_entry_is_an_error(directory):
+    manifest = directory / 'nightly.txt'
+    manifest.write_text("01_schema.sql\n99_missing.sql\n")
+
+    with pytest.raises(FileNotFoundError, match="99_missing"):
+        read_manifest(str(manifest))
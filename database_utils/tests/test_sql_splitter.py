@@ -0,0 +1,59 @@
+import pytest
+
+from utils.sql_splitter import iter_sql_statements, split_sql_statements
+
+SCRIPT = r"""
+-- setup; not a statement
+CREATE TABLE "odd;name" (id int, note text);
+INSERT INTO "odd;name" VALUES (1, 'semi;colon'), (2, 'it''s; fine'), (3, E'back\'slash;');
+/* block; /* nested; */ still comment; */ SELECT 1;
+CREATE FUNCTION f() RETURNS int AS $$ BEGIN RETURN 1; END; $$ LANGUAGE plpgsql;
+CREATE FUNCTION g() RETURNS int AS $body$ SELECT $1; $body$ LANGUAGE sql;
+SELECT price$1 FROM t WHERE a = $1;
+SELECT 'trailing' -- comment; at the end
+"""
+
+EXPECTED = [
+    'CREATE TABLE "odd;name" (id int, note text)',
+    "INSERT INTO \"odd;name\" VALUES (1, 'semi;colon'), (2, 'it''s; fine'), (3, E'back\\'slash;')",
+    'SELECT 1',
+    'CREATE FUNCTION f() RETURNS int AS $$ BEGIN RETURN 1; END; $$ LANGUAGE plpgsql',
+    'CREATE FUNCTION g() RETURNS int AS $body$ SELECT $1; $body$ LANGUAGE sql',
+    'SELECT price$1 FROM t WHERE a = $1',
+    "SELECT 'trailing'",
+]
+
+
+def test_splits_on_top_level_semicolons_only():
+    assert split_sql_statements(SCRIPT) == EXPECTED
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64])
+def test_chunk_boundaries_do_not_change_the_result(chunk_size):
+    assert list(iter_sql_statements(SCRIPT, chunk_size=chunk_size)) == EXPECTED
+
+
+def test_reads_file_objects(tmp_path):
+    path = tmp_path / 'script.sql'
+    path.write_text(SCRIPT, encoding='utf-8')
+
+    with open(path, encoding='utf-8') as file:
+        assert list(iter_sql_statements(file, chunk_size=16)) == EXPECTED
+
+
+@pytest.mark.parametrize('sql', ["", "  \n", ";;", "-- only a comment", "/* only */ ; ;"])
+def test_empty_scripts_have_no_statements(sql):
+    assert split_sql_statements(sql) == []
+
+
+def test_plain_strings_keep_backslashes_literal():
+    # Without the E prefix a backslash is an ordinary character, so the quote closes the string
+    assert split_sql_statements(r"SELECT 'a\'; SELECT 2") == [r"SELECT 'a\'", "SELECT 2"]
+
+
+def test_identifier_ending_in_e_is_not_an_escape_string():
+    assert split_sql_statements(r"SELECT name'x\'; SELECT 2") == [r"SELECT name'x\'", "SELECT 2"]
+
+
+def test_unterminated_dollar_quote_runs_to_the_end():
+    assert split_sql_statements("DO $x$ BEGIN; END;") == ["DO $x$ BEGIN; END;"]
@@ -0,0 +1,94 @@
+import requests
+
+QUERY = "SELECT id, score FROM submissions WHERE id <= 3 ORDER BY id"
+
+
+def test_statements_within_ttl_share_one_health_check(util, server):
+    for _ in range(3):
+        result = util.execute_raw_query(QUERY)
+        assert result["success"]
+        assert [row["id"] for row in result["data"]] == [1, 2, 3]
+
+    assert util.health_checks == 1
+    # One probe, then one page request per statement
+    assert server.requests == 4
+
+
+def test_force_sends_another_health_check(util):
+    assert util.connect_to_database()
+    assert util.connect_to_database()
+    assert util.health_checks == 1
+
+    assert util.connect_to_database(force=True)
+    assert util.health_checks == 2
+
+
+def test_expired_ttl_probes_again(util):
+    util.connection_ttl = 0
+    util.execute_raw_query(QUERY)
+    util.execute_raw_query(QUERY)
+    assert util.health_checks == 2
+
+
+def test_dropped_connection_keeps_the_shared_session(util, monkeypatch):
+    assert util.connect_to_database()
+    session = util._get_session()
+    send = session.request
+    failures = []
+
+    def drop_once(method, url, **kwargs):
+        if not failures:
+            failures.append(url)
+            raise requests.ConnectionError("connection reset")
+        return send(method, url, **kwargs)
+
+    monkeypatch.setattr(session, 'request', drop_once)
+    result = util.execute_raw_query(QUERY)
+
+    assert result["success"]
+    assert failures
+    # The GET was retried on the same session; the next statement verifies the connection again
+    assert util._get_session() is session
+    assert not util.is_connected
+    assert util.execute_raw_query(QUERY)["success"]
+    assert util.health_checks == 2
+
+
+INSERTS = [f"INSERT INTO submissions (id, score) VALUES ({i}, {i * 10})" for i in range(9001, 9004)]
+
+
+def test_rejected_bulk_insert_is_retried_statement_by_statement(util, server):
+    server.fail_posts(400)
+    result = util.execute_multiple_queries(INSERTS)
+
+    assert result["success"]
+    assert server.rows_inserted == 3
+
+
+def test_bulk_insert_server_error_is_not_sent_again(util, server):
+    util.connect_to_database()
+    requests_before = server.requests
+    server.fail_posts(500)
+    result = util.execute_multiple_queries(INSERTS)
+
+    assert not result["success"]
+    assert [entry["success"] for entry in result["data"]] == [False, False, False]
+    assert all("HTTP 500" in entry["error"] for entry in result["data"])
+    # The rows may have been written before the error: one POST, no per-statement retries
+    assert server.requests == requests_before + 1
+    assert server.rows_inserted == 0
+
+
+def test_other_request_errors_give_the_scheduler_slot_back(util, monkeypatch):
+    assert util.connect_to_database()
+    session = util._get_session()
+
+    def broken_body(method, url, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError("connection broken: incomplete read")
+
+    monkeypatch.setattr(session, 'request', broken_body)
+    for _ in range(util.scheduler.max_concurrency + 1):
+        result = util.execute_raw_query(QUERY)
+        assert not result["success"]
+        assert "incomplete read" in result["error"]
+        assert util.scheduler.in_flight == 0
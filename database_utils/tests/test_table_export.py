@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from utils.result_writers import OutputError
+from utils.table_export import ExportFile, read_watermarks, write_watermarks
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'csv', 'jsonl'])
+def test_a_page_with_other_columns_fails_the_export(tmp_path, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / f"submissions.{fmt}")
+
+    with ExportFile(path, fmt) as output:
+        part = output.part(0)
+        part.write_rows([{"id": 1, "score": 10}])
+        with pytest.raises(OutputError, match="different columns"):
+            part.write_rows([{"id": 2, "score": 20, "added_later": True}])
+
+    assert not os.path.exists(path)
+
+
+def test_parquet_export_keeps_every_column(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    path = str(tmp_path / 'submissions.parquet')
+
+    with ExportFile(path, 'parquet') as output:
+        part = output.part(0)
+        part.write_rows([{"id": 1, "score": None}])
+        part.write_rows([{"id": 2, "score": 2.5}])
+        part.close()
+        output.commit()
+
+    table = pq.read_table(path)
+    assert table.column_names == ['id', 'score']
+    assert table.column('score').type == pa.float64()
+    assert table.to_pylist() == [{"id": 1, "score": None}, {"id": 2, "score": 2.5}]
+
+
+def test_watermarks_are_replaced_atomically(tmp_path):
+    path = str(tmp_path / '.export_watermarks.json')
+    watermarks = {"submissions": {"column": "created_at", "watermark": "2026-10-18T07:00:00+00:00"}}
+
+    write_watermarks(path, watermarks)
+    write_watermarks(path, dict(watermarks, users={"column": "created_at", "watermark": 5}))
+
+    assert read_watermarks(path)["users"]["watermark"] == 5
+    assert os.listdir(tmp_path) == ['.export_watermarks.json']
+
+
+@pytest.mark.parametrize('table', ['Order', 'user.events', 'select'])
+def test_table_names_are_sent_verbatim(util, server, tmp_path, table):
+    server.tables[table] = 30
+    path = str(tmp_path / 'export.jsonl')
+    result = util.export_table(table, path, compression='none', jobs=2, page_size=10)
+
+    assert result["success"], result.get("error")
+    assert result["data"]["rows"] == 30
+
+
+def test_unlisted_dotted_name_is_a_schema_and_table(util):
+    assert util.connect_to_database()
+    request = util._table_request('analytics.events')
+
+    assert (request.path, request.headers) == ('/rest/v1/events', {'Accept-Profile': 'analytics'})
+
+
+def test_unknown_table_is_rejected_before_any_export(util, tmp_path):
+    path = str(tmp_path / 'export.jsonl')
+    result = util.export_table('no_such_table', path)
+
+    assert not result["success"]
+    assert "Unknown table 'no_such_table'" in result["error"]
+    assert not os.path.exists(path)
@@ -0,0 +1,101 @@
+import json
+import re
+
+import pytest
+
+from utils.query_core import build_transaction_script, transaction_results
+
+_DELIMITER = re.compile(r'\$([A-Za-z_][A-Za-z_0-9]*)?\$')
+
+
+def dollar_literal(text, start):
+    """(body, end) of the dollar-quoted literal at text[start:], read the way PostgreSQL's lexer does"""
+    opening = _DELIMITER.match(text, start)
+    assert opening, text[start:start + 40]
+    end = text.index(opening.group(0), opening.end())
+    return text[opening.end():end], end + len(opening.group(0))
+
+
+def executed(script):
+    """The statements a transaction script runs, in order"""
+    assert script.startswith("DO ")
+    block, end = dollar_literal(script, 3)
+    assert end == len(script)
+    statements, position = [], 0
+    while True:
+        position = block.find("EXECUTE ", position)
+        if position < 0:
+            return statements
+        body, position = dollar_literal(block, position + len("EXECUTE "))
+        assert block[position] == ';'
+        statements.append(body)
+
+
+@pytest.mark.parametrize('query', [
+    "SELECT $$text$$",
+    "CREATE FUNCTION f() RETURNS int AS $$ BEGIN RETURN 1; END $$ LANGUAGE plpgsql",
+    "SELECT $db_utils_statement$inner$db_utils_statement$",
+    "SELECT $db_utils_transaction$inner$db_utils_transaction$",
+    "SELECT 1 AS x$db_utils_statement",
+    "SELECT 1 AS x$db_utils_transaction",
+    "SELECT $db_utils_statement_$a$db_utils_statement_$, $db_utils_statement$b$db_utils_statement$",
+    "INSERT INTO notes (body) VALUES ('a; b -- not a comment; $$')",
+    "SELECT 'ends with a dollar $'",
+])
+def test_statement_bodies_survive_quoting(query):
+    statements = [(1, "SELECT 1"), (2, query), (3, "SELECT 3")]
+
+    assert executed(build_transaction_script(statements)) == ["SELECT 1", query, "SELECT 3"]
+
+
+def test_comment_lines_are_dropped():
+    script = build_transaction_script([(4, "-- seed\nINSERT INTO t VALUES (1)")])
+
+    assert executed(script) == ["INSERT INTO t VALUES (1)"]
+    assert "current_statement := 4;" in script
+
+
+STATEMENTS = [(3, "INSERT INTO t VALUES (1)"), (4, "INSERT INTO t VALUES ('a;b')"), (5, "INSERT INTO t VALUES (2)")]
+
+
+def postgrest_error(message):
+    body = json.dumps({"code": "23505", "details": None, "hint": None, "message": message})
+    return {"success": False, "error": f"RPC execution failed: HTTP 409 - {body}"}
+
+
+def test_success_reports_every_statement():
+    entries, failed = transaction_results(STATEMENTS, {"success": True, "data": None})
+
+    assert failed is None
+    assert [(entry["query_number"], entry["success"]) for entry in entries] == [(3, True), (4, True), (5, True)]
+
+
+def test_failure_in_the_middle_is_mapped_to_its_statement():
+    message = 'duplicate key value violates unique constraint "t_pkey"'
+    entries, failed = transaction_results(STATEMENTS, postgrest_error(f"db_utils statement 4: {message}"))
+
+    assert failed == 4
+    assert [(entry["query_number"], entry["success"], entry["error"]) for entry in entries] == [
+        (3, False, "Rolled back: statement 4 failed"),
+        (4, False, message),
+        (5, False, "Not executed: statement 4 failed"),
+    ]
+    assert entries[1]["query"] == "INSERT INTO t VALUES ('a;b')"
+
+
+def test_error_returned_with_http_200_is_a_failure():
+    # Some exec_sql functions catch errors and return them as data
+    data = {"error": "db_utils statement 5: division by zero"}
+    entries, failed = transaction_results(STATEMENTS, {"success": True, "data": data})
+
+    assert failed == 5
+    assert entries[2]["error"] == "division by zero"
+    assert not any(entry["success"] for entry in entries)
+
+
+def test_error_without_a_statement_number_fails_the_whole_chunk():
+    result = {"success": False, "error": "RPC execution failed: HTTP 500 - upstream timeout"}
+    entries, failed = transaction_results(STATEMENTS, result)
+
+    assert failed == 3
+    assert all(entry["error"] == f"Transaction failed: {result['error']}" for entry in entries)
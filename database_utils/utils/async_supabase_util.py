@@ -0,0 +1,313 @@
+import asyncio
+import io
+import itertools
+import logging
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Sized, Union
+
+import httpx
+
+from .query_core import (
+    DEFAULT_INSERT_BATCH_SIZE, DEFAULT_PAGE_SIZE, auth_headers, build_select_request, clean_sql_query,
+    group_statements, iter_chunks, plan_batches, summarize_results
+)
+from .query_flows import Connect, Deadline, Flow, Instruction, QueryFlows
+from .postgrest_query import PostgrestRequest
+from .query_metrics import current_metrics, phase, record_request
+from .request_scheduler import IDEMPOTENT_METHODS, RequestScheduler, parse_retry_after
+from .result_cache import ResultCache
+from .rpc_discovery import RpcEndpointCache
+from .sql_splitter import iter_sql_statements
+
+
+class AsyncSupabaseUtil(QueryFlows):
+    """asyncio counterpart of SupabaseUtil built on a shared httpx connection pool
+
+    Exposes the same methods as coroutines, so helpers can run inside async jobs
+    without blocking the event loop. Use it as `async with AsyncSupabaseUtil() as db:`.
+    Statements run through the same flows as SupabaseUtil (see query_flows).
+    """
+
+    def __init__(self, pool_size: int = 10, timeout: float = 30.0,
+                 max_retries: int = 3, backoff_factor: float = 0.5,
+                 connection_ttl: float = 300.0, query_timeout: Optional[float] = None,
+                 rpc_cache: Optional[RpcEndpointCache] = None,
+                 insert_batch_size: int = DEFAULT_INSERT_BATCH_SIZE, result_cache: Optional[ResultCache] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        super().__init__(pool_size, timeout, max_retries, backoff_factor, connection_ttl, rpc_cache,
+                         insert_batch_size, result_cache, scheduler)
+        # Overall deadline for a single statement, including retries and paging
+        self.query_timeout = query_timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        # Created lazily so the lock binds to the running event loop
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self.logger = logging.getLogger(__name__)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled keep-alive client, creating it on first use"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.url or '',
+                headers=auth_headers(self.service_key),
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+                # Transport retries cover connection failures; status retries are below
+                transport=httpx.AsyncHTTPTransport(retries=self.max_retries)
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, idempotent: Optional[bool] = None,
+                       **kwargs) -> httpx.Response:
+        """Send a request over the pooled client, paced by the scheduler
+
+        429 responses are retried; 5xx responses and transport errors only when
+        idempotent (by default GET and HEAD).
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in itertools.count():
+            with phase('throttle'):
+                ticket = await self.scheduler.acquire_async()
+            try:
+                with phase('http'):
+                    response = await self._get_client().request(method, path, **kwargs)
+            except httpx.TransportError:
+                self.scheduler.release(ticket)
+                # Re-probe before the next statement. The client is shared with other tasks and
+                # stays open: the pool discards the broken connection and opens a new one
+                self._connected_at = None
+                delay = self.scheduler.next_retry(attempt, None, idempotent)
+                if delay is None:
+                    raise
+                self.logger.warning(f"Connection lost during {method} {path}, retrying in {delay:.1f}s")
+            except BaseException:
+                # Cancelled (a statement deadline or the caller): give the slot back
+                self.scheduler.release(ticket)
+                raise
+            else:
+                self.scheduler.release(ticket, response.status_code,
+                                       parse_retry_after(response.headers.get('Retry-After')))
+                if current_metrics() is not None:
+                    record_request(len(response.request.content), len(response.content))
+                delay = self.scheduler.next_retry(attempt, response.status_code, idempotent)
+                if delay is None:
+                    return response
+                self.logger.warning(f"HTTP {response.status_code} from {method} {path}, retrying in {delay:.1f}s")
+            with phase('throttle'):
+                await asyncio.sleep(delay)
+
+    async def _run(self, flow: Flow) -> Any:
+        """Drive a flow from query_flows in the event loop and return its result"""
+        send, value = flow.send, None
+        while True:
+            try:
+                instruction = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                value = await self._perform(instruction)
+                send = flow.send
+            except BaseException as e:
+                value, send = e, flow.throw
+
+    async def _perform(self, instruction: Instruction) -> Any:
+        """Carry out one instruction of a flow, raising Deadline if its timeout passes first"""
+        if isinstance(instruction, Connect):
+            action = self.connect_to_database()
+        else:
+            action = self._request(instruction.method, instruction.path, instruction.idempotent,
+                                   params=instruction.params, headers=instruction.headers,
+                                   json=instruction.json, content=instruction.body)
+        if instruction.timeout is None:
+            return await action
+        if instruction.timeout <= 0:
+            action.close()
+            raise Deadline()
+        try:
+            return await asyncio.wait_for(action, instruction.timeout)
+        except asyncio.TimeoutError:
+            raise Deadline() from None
+
+    async def close(self):
+        """Close the pooled client and release its connections"""
+        self._connected_at = None
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    async def connect_to_database(self, force: bool = False) -> bool:
+        """Test database connection, reusing a recent successful probe unless forced"""
+        if not force and self.is_connected:
+            return True
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            return await self._run(self._probe_connection(force))
+
+    async def execute_sql_file(self, file_path: str, jobs: int = 1, single_transaction: bool = False,
+                               transaction_chunk_size: Optional[int] = None) -> Dict[str, Any]:
+        """Execute SQL file against the database, optionally running independent statements concurrently
+
+        The file is read on a worker thread so the event loop never blocks on disk,
+        which means it is held in memory as a whole while it runs.
+        """
+        try:
+            if not os.path.exists(file_path):
+                return {"success": False, "error": f"File {file_path} not found"}
+
+            self.logger.info(f"Executing SQL file: {file_path}")
+            text = await asyncio.get_running_loop().run_in_executor(None, _read_text, file_path)
+            queries = iter_sql_statements(io.StringIO(text))
+
+            if single_transaction:
+                return await self.execute_transaction(queries, transaction_chunk_size)
+
+            first = next(queries, None)
+            if first is None:
+                return {"success": False, "error": "SQL file is empty"}
+
+            second = next(queries, None)
+            if second is None:
+                return await self.execute_raw_query(first)
+            return await self.execute_multiple_queries(itertools.chain([first, second], queries), jobs=jobs)
+
+        except Exception as e:
+            self.logger.error(f"Failed to execute SQL file {file_path}: {e}")
+            return {"success": False, "error": str(e)}
+
+    async def execute_transaction(self, queries: Iterable[str], chunk_size: Optional[int] = None) -> Dict[str, Any]:
+        """Execute statements atomically with one exec_sql call per chunk (default: one call for all)
+
+        Each chunk is committed or rolled back as a whole, and results use the
+        execute_multiple_queries format. After a failed chunk the remaining statements
+        are reported as not executed. Rows returned by SELECTs are discarded in this mode.
+        Accepts plain SQL strings or (query_number, query) pairs.
+        """
+        return await self._run(self._execute_transaction(queries, chunk_size))
+
+    async def iter_select(self, query: str, page_size: int = DEFAULT_PAGE_SIZE,
+                          key_column: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the rows of a plain SELECT page by page (see SupabaseUtil.iter_select)"""
+        request = build_select_request(clean_sql_query(query))
+        async for row in self._iter_pages(request, page_size, key_column):
+            yield row
+
+    async def _iter_pages(self, request: PostgrestRequest, page_size: int = DEFAULT_PAGE_SIZE,
+                          key_column: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield rows from a table endpoint one page at a time"""
+        paginator = await self._run(self._paginator(request, page_size, key_column))
+        while not paginator.done:
+            for row in await self._run(self._fetch_page(request, paginator)):
+                yield row
+
+    async def execute_multiple_queries(self, queries: Iterable[str], jobs: int = 1) -> Dict[str, Any]:
+        """Execute multiple SQL queries and return combined results
+
+        With jobs > 1, dependency-safe batches run as concurrent tasks; DDL and
+        statements touching the same tables stay ordered. Consecutive simple INSERTs
+        into the same table are sent as bulk POSTs of up to insert_batch_size rows.
+        """
+        try:
+            total = len(queries) if isinstance(queries, Sized) else None
+            units = group_statements(queries, self.insert_batch_size)
+            results = []
+            if jobs > 1:
+                await self.connect_to_database()
+                semaphore = asyncio.Semaphore(jobs)
+
+                async def run(unit) -> List[Dict[str, Any]]:
+                    async with semaphore:
+                        return await self._run(self._execute_unit(unit, total))
+
+                for batch in plan_batches(units, jobs, self._linked_tables()):
+                    for entries in await asyncio.gather(*(run(unit) for unit in batch)):
+                        results.extend(entries)
+            else:
+                for unit in units:
+                    results.extend(await self._run(self._execute_unit(unit, total)))
+            return summarize_results(results)
+
+        except Exception as e:
+            self.logger.error(f"Failed to execute multiple queries: {e}")
+            return {"success": False, "error": str(e)}
+
+    async def gather(self, numbered_queries: Iterable, concurrency: int = 10,
+                     total: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Run statements concurrently (at most `concurrency` in flight) and return results in order
+
+        Accepts plain SQL strings or (query_number, query) pairs. Statements are not
+        reordered or batched for dependencies; use execute_multiple_queries for that.
+        """
+        items = [item if isinstance(item, tuple) else (i, item)
+                 for i, item in enumerate(numbered_queries, 1)]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(i: int, query: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._run(self._execute_numbered_query(i, query, total))
+
+        return list(await asyncio.gather(*(run(i, query) for i, query in items)))
+
+    async def execute_raw_query(self, query: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Execute raw SQL query using REST API, giving up after `timeout` (or query_timeout) seconds"""
+        return await self._run(self._measure(query, None, self._execute_raw_query(query, timeout)))
+
+    async def bulk_insert(self, table: str, rows: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+                          batch_size: Optional[int] = None, on_conflict: Optional[str] = None,
+                          conflict_columns: Sequence[str] = ()) -> Dict[str, Any]:
+        """Insert dict rows from a sync or async iterable with one JSON-array POST per batch
+
+        on_conflict="ignore" skips rows that collide with conflict_columns (default: the
+        primary key), "merge" upserts them. Keys missing from some rows of a batch are
+        inserted as NULL. Batches already sent stay committed if a later one fails.
+        """
+        if not await self.connect_to_database():
+            return {"success": False, "error": "Database connection failed"}
+
+        size = batch_size or self.insert_batch_size or DEFAULT_INSERT_BATCH_SIZE
+        chunks = _aiter_chunks(rows, size) if isinstance(rows, AsyncIterable) else _as_async(iter_chunks(rows, size))
+        inserted = requests_sent = 0
+        try:
+            async for chunk in chunks:
+                await self._run(self._insert_chunk(table, chunk, on_conflict, conflict_columns))
+                inserted += len(chunk)
+                requests_sent += 1
+        except Exception as e:
+            return self._bulk_insert_done(table, inserted, requests_sent, e)
+        return self._bulk_insert_done(table, inserted, requests_sent)
+
+    async def aggregate_query(self, query: str, page_size: int = DEFAULT_PAGE_SIZE,
+                              key_column: Optional[str] = None) -> Dict[str, Any]:
+        """Run an aggregate SELECT locally over pushed-down pages (see SupabaseUtil.aggregate_query)"""
+        return await self._run(self._aggregate_query(query, page_size, key_column))
+
+
+def _read_text(file_path: str) -> str:
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+async def _as_async(items: Iterable[Any]) -> AsyncIterator[Any]:
+    """Adapt a plain iterable for async for"""
+    for item in items:
+        yield item
+
+
+async def _aiter_chunks(items: AsyncIterable[Any], size: int) -> AsyncIterator[List[Any]]:
+    """Yield lists of up to size items from an async iterable"""
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
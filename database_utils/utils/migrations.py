@@ -0,0 +1,255 @@
+"""
+Incremental migrations for a directory of SQL files.
+
+Every applied statement is recorded in the db_utils_migrations ledger table
+with the file it came from and a checksum of its normalized text, so a file
+that gains or edits statements only runs the new ones. A per-project JSON
+state file remembers the hash of each fully applied file: when no file hash
+changed, the plan is computed locally and no request is sent at all.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .query_core import SupabaseQueryError, clean_sql_query, iter_chunks
+from .rpc_discovery import cache_dir, write_json_atomic
+from .sql_batches import natural_key
+from .sql_splitter import iter_sql_statements
+
+LEDGER_TABLE = 'db_utils_migrations'
+
+LEDGER_DDL = f"""CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+    file TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    occurrence INTEGER NOT NULL DEFAULT 1,
+    statement_number INTEGER NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (file, checksum, occurrence)
+)"""
+
+# Makes a freshly created ledger readable through the table endpoint right away
+RELOAD_SCHEMA = "NOTIFY pgrst, 'reload schema'"
+
+
+def default_state_path() -> str:
+    """migrations.json in the cache directory"""
+    return os.path.join(cache_dir(), 'migrations.json')
+
+
+def statement_checksum(query: str) -> str:
+    """sha256 of a statement with comments, blank lines and trailing whitespace removed"""
+    lines = (line.rstrip() for line in clean_sql_query(query).split('\n'))
+    normalized = '\n'.join(line for line in lines if line)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class MigrationStatement(NamedTuple):
+    """A statement of a migration file; occurrence tells identical statements apart"""
+    number: int
+    query: str
+    checksum: str
+    occurrence: int
+
+
+class MigrationFile(NamedTuple):
+    """A migration file and the statements it still has to apply"""
+    name: str
+    path: str
+    file_hash: str
+    status: str  # 'unchanged', 'new', 'changed' or 'applied' (changed, but every statement is in the ledger)
+    statements: List[MigrationStatement]
+    pending: List[MigrationStatement]
+
+
+class MigrationPlan(NamedTuple):
+    """What a migration run would do, file by file"""
+    files: List[MigrationFile]
+    ledger_checked: bool  # False when the plan came from the local state alone
+
+    @property
+    def pending_count(self) -> int:
+        return sum(len(file.pending) for file in self.files)
+
+    @property
+    def is_up_to_date(self) -> bool:
+        return all(file.status == 'unchanged' for file in self.files)
+
+
+class MigrationRunner:
+    """Plans and applies the *.sql files of a directory in natural filename order"""
+
+    def __init__(self, util, directory: str, state_path: Optional[str] = '',
+                 chunk_size: Optional[int] = None):
+        self.util = util
+        self.directory = directory
+        self.state_path = default_state_path() if state_path == '' else state_path
+        self.chunk_size = chunk_size
+        self.logger = logging.getLogger(__name__)
+
+    def files(self) -> List[Tuple[str, str]]:
+        """(name, path) of every migration file, in the order they are applied"""
+        names = [name for name in os.listdir(self.directory)
+                 if name.endswith('.sql') and os.path.isfile(os.path.join(self.directory, name))]
+        return [(name, os.path.join(self.directory, name)) for name in sorted(names, key=natural_key)]
+
+    def plan(self, refresh: bool = False) -> MigrationPlan:
+        """Work out the pending statements; the ledger is only read for changed files (or all with refresh)
+
+        Raises SupabaseQueryError if the ledger cannot be read.
+        """
+        known = self._load_state()
+        files = []
+        changed = []
+        for name, path in self.files():
+            with open(path, 'rb') as file:
+                content = file.read()
+            file_hash = hashlib.sha256(content).hexdigest()
+            if known.get(name) == file_hash and not refresh:
+                files.append(MigrationFile(name, path, file_hash, 'unchanged', [], []))
+            else:
+                changed.append((name, path, file_hash, content.decode('utf-8')))
+
+        if not changed:
+            return MigrationPlan(files, ledger_checked=False)
+
+        applied = self._applied_statements([name for name, _, _, _ in changed], bool(known))
+        for name, path, file_hash, content in changed:
+            statements = list(self._parse_statements(content))
+            pending = [statement for statement in statements
+                       if (name, statement.checksum, statement.occurrence) not in applied]
+            if not pending:
+                status = 'unchanged' if known.get(name) == file_hash else 'applied'
+            elif name not in known and len(pending) == len(statements):
+                status = 'new'
+            else:
+                status = 'changed'
+            files.append(MigrationFile(name, path, file_hash, status, statements, pending))
+        files.sort(key=lambda file: natural_key(file.name))
+        return MigrationPlan(files, ledger_checked=True)
+
+    def apply(self, plan: MigrationPlan) -> Dict[str, Any]:
+        """Apply a plan file by file, each chunk in one transaction together with its ledger rows
+
+        Stops at the first failed file; statements of later files are not attempted.
+        Returns data as a list of {"file", "status", "applied", "result"} entries.
+        """
+        try:
+            summaries = []
+            if plan.pending_count:
+                setup = self.ensure_ledger()
+                if not setup["success"]:
+                    return setup
+
+            for file in plan.files:
+                if file.status == 'unchanged':
+                    continue
+                if not file.pending:
+                    self._remember(file)
+                    summaries.append({"file": file.name, "status": file.status, "applied": 0, "result": None})
+                    continue
+
+                self.logger.info(f"Applying {len(file.pending)} statements from {file.name}")
+                result = self._apply_file(file)
+                applied = result.get("successful_queries", 0) if result["success"] else 0
+                summaries.append({"file": file.name, "status": file.status, "applied": applied, "result": result})
+                if not result["success"]:
+                    return {"success": False, "error": f"Migration {file.name} failed: {result.get('error', 'a statement failed')}", "data": summaries}
+                self._remember(file)
+
+            return {"success": True, "data": summaries}
+
+        except Exception as e:
+            self.logger.error(f"Failed to apply migrations: {e}")
+            return {"success": False, "error": str(e)}
+
+    def ensure_ledger(self) -> Dict[str, Any]:
+        """Create the ledger table if it does not exist yet"""
+        result = self.util.execute_raw_query(LEDGER_DDL)
+        if not result["success"]:
+            return {"success": False, "error": f"Could not create {LEDGER_TABLE}: {result.get('error')}"}
+        self.util.execute_raw_query(RELOAD_SCHEMA)
+        return result
+
+    def _apply_file(self, file: MigrationFile) -> Dict[str, Any]:
+        """Run the pending statements of a file, recording each chunk in the ledger inside its transaction"""
+        chunks = iter_chunks(file.pending, self.chunk_size) if self.chunk_size else iter([file.pending])
+        results = []
+        for chunk in chunks:
+            numbered = [(statement.number, statement.query) for statement in chunk]
+            numbered.append((chunk[-1].number + 1, self._ledger_insert(file.name, chunk)))
+            result = self.util.execute_transaction(numbered)
+            # Drop the ledger entry; the error of a failed ledger insert still fails the file
+            entries = (result.get("data") or [])[:-1]
+            results.extend(entries)
+            if not result["success"]:
+                failed = {"success": False, "error": result.get("error"), "data": results}
+                if entries:
+                    failed.update(total_queries=len(results),
+                                  successful_queries=sum(1 for entry in results if entry["success"]))
+                return failed
+        return {"success": True, "data": results, "total_queries": len(results), "successful_queries": len(results)}
+
+    def _ledger_insert(self, name: str, statements: List[MigrationStatement]) -> str:
+        values = ",\n".join(f"({_quote(name)}, {_quote(statement.checksum)}, {statement.occurrence}, {statement.number})"
+                            for statement in statements)
+        return (f"INSERT INTO {LEDGER_TABLE} (file, checksum, occurrence, statement_number) VALUES\n{values}\n"
+                "ON CONFLICT DO NOTHING")
+
+    def _parse_statements(self, content: str) -> Iterator[MigrationStatement]:
+        seen: Dict[str, int] = {}
+        for number, query in enumerate(iter_sql_statements(content), 1):
+            checksum = statement_checksum(query)
+            seen[checksum] = seen.get(checksum, 0) + 1
+            yield MigrationStatement(number, query, checksum, seen[checksum])
+
+    def _applied_statements(self, names: List[str], has_state: bool) -> set:
+        """(file, checksum, occurrence) of every ledger row for the given files"""
+        file_list = ", ".join(_quote(name) for name in names)
+        # Ordered on the ledger's primary key so its pages never overlap
+        query = (f"SELECT file, checksum, occurrence FROM {LEDGER_TABLE} WHERE file IN ({file_list}) "
+                 "ORDER BY file, checksum, occurrence")
+        try:
+            return {(row['file'], row['checksum'], row['occurrence']) for row in self.util.iter_select(query)}
+        except SupabaseQueryError as e:
+            # A missing ledger means nothing was applied, unless this machine already applied migrations
+            if 'HTTP 404' in str(e) and not has_state:
+                return set()
+            raise
+
+    def _load_state(self) -> Dict[str, str]:
+        """{file: hash} of the files fully applied to this project"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            return dict(state.get(self._state_key(), {})) if isinstance(state, dict) else {}
+        except (OSError, ValueError) as e:
+            self.logger.debug(f"Ignoring unreadable migration state {self.state_path}: {e}")
+            return {}
+
+    def _remember(self, file: MigrationFile):
+        if not self.state_path:
+            return
+        state: Dict[str, Any] = {}
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'r', encoding='utf-8') as handle:
+                    state = json.load(handle)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault(self._state_key(), {})[file.name] = file.file_hash
+        try:
+            write_json_atomic(self.state_path, state)
+        except OSError as e:
+            self.logger.debug(f"Could not write migration state {self.state_path}: {e}")
+
+    def _state_key(self) -> str:
+        return f"{self.util.url}|{os.path.abspath(self.directory)}"
@@ -0,0 +1,424 @@
+"""
+Translate parsed SELECT statements into PostgREST table requests.
+
+Column projection, WHERE filters (comparisons, IN, BETWEEN, IS, LIKE and
+AND/OR/NOT trees), ORDER BY, LIMIT and OFFSET are pushed down into query
+parameters so the server only returns the rows and columns asked for.
+Anything that cannot be expressed exactly raises UnsupportedQueryError;
+a query is never sent with some of its filters silently dropped.
+"""
+
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import quote
+
+from .sql_select import (
+    Between, BinaryOp, Cast, Column, FuncCall, InList, Interval, IsTest, Like,
+    Literal, SelectStatement, Star, UnaryOp, UnsupportedQueryError, is_aggregate_query,
+    parse_select
+)
+
+
+class PostgrestRequest(NamedTuple):
+    """A GET against /rest/v1/<table>: path, ordered query parameters and extra headers"""
+    path: str
+    params: List[Tuple[str, str]]
+    headers: Dict[str, str]
+
+
+# --- Constant folding -------------------------------------------------------
+
+class _NotConstant(Exception):
+    pass
+
+
+_INTERVAL_PART = re.compile(r'\s*([+-]?\d+(?:\.\d+)?)\s*([a-z]+)\s*', re.I)
+_INTERVAL_UNITS = {
+    'microsecond': 'microseconds', 'microseconds': 'microseconds', 'us': 'microseconds',
+    'millisecond': 'milliseconds', 'milliseconds': 'milliseconds', 'ms': 'milliseconds',
+    'second': 'seconds', 'seconds': 'seconds', 'sec': 'seconds', 'secs': 'seconds', 's': 'seconds',
+    'minute': 'minutes', 'minutes': 'minutes', 'min': 'minutes', 'mins': 'minutes', 'm': 'minutes',
+    'hour': 'hours', 'hours': 'hours', 'hr': 'hours', 'hrs': 'hours', 'h': 'hours',
+    'day': 'days', 'days': 'days', 'd': 'days',
+    'week': 'weeks', 'weeks': 'weeks', 'w': 'weeks',
+}
+
+
+def parse_interval(text: str) -> timedelta:
+    """Convert an INTERVAL literal such as '1 hour' or '2 days 30 minutes' to a timedelta"""
+    parts = {}
+    pos = 0
+    while pos < len(text):
+        match = _INTERVAL_PART.match(text, pos)
+        if match is None or match.end() == pos:
+            raise UnsupportedQueryError(f"Unsupported INTERVAL literal {text!r}")
+        unit = _INTERVAL_UNITS.get(match.group(2).lower())
+        if unit is None:
+            # Months and years have no fixed length, so they cannot be folded exactly
+            raise UnsupportedQueryError(f"Unsupported INTERVAL unit {match.group(2)!r}")
+        parts[unit] = parts.get(unit, 0) + float(match.group(1))
+        pos = match.end()
+    if not parts:
+        raise UnsupportedQueryError(f"Unsupported INTERVAL literal {text!r}")
+    return timedelta(**parts)
+
+
+def constant_value(expr, now: Optional[datetime] = None) -> Any:
+    """Evaluate an expression that references no columns (NOW() - INTERVAL '1 hour', 2 * 50, ...)
+
+    Raises UnsupportedQueryError if the expression depends on row data or uses
+    something that cannot be evaluated client-side.
+    """
+    try:
+        return _fold(expr, now or datetime.now(timezone.utc))
+    except _NotConstant:
+        raise UnsupportedQueryError("Expression depends on column values") from None
+
+
+def _fold(expr, now: datetime) -> Any:
+    if isinstance(expr, Literal):
+        return expr.value
+    if isinstance(expr, Interval):
+        return parse_interval(expr.text)
+    if isinstance(expr, FuncCall):
+        if expr.name in ('now', 'current_timestamp', 'transaction_timestamp', 'statement_timestamp') and not expr.args:
+            return now
+        if expr.name == 'current_date' and not expr.args:
+            return now.date()
+        raise _NotConstant()
+    if isinstance(expr, Cast) and isinstance(expr.expr, Literal):
+        return cast_value(expr.expr.value, expr.type_name)
+    if isinstance(expr, UnaryOp) and expr.op == '-':
+        return -_fold(expr.operand, now)
+    if isinstance(expr, BinaryOp) and expr.op in ('+', '-', '*', '/'):
+        left, right = _fold(expr.left, now), _fold(expr.right, now)
+        if isinstance(left, date) and isinstance(right, str):
+            right = cast_value(right, 'interval')
+        try:
+            if expr.op == '+':
+                return left + right
+            if expr.op == '-':
+                return left - right
+            if expr.op == '*':
+                return left * right
+            if isinstance(left, int) and isinstance(right, int):
+                return int(left / right)  # integer division truncates toward zero
+            return left / right
+        except (TypeError, ZeroDivisionError) as e:
+            raise UnsupportedQueryError(f"Cannot evaluate constant expression: {e}")
+    raise _NotConstant()
+
+
+def cast_value(value: Any, type_name: str) -> Any:
+    """Apply a ::type cast to a Python value (strings stay strings for text and temporal types)"""
+    type_name = type_name.lower()
+    if value is None:
+        return None
+    if type_name == 'interval':
+        return parse_interval(str(value))
+    if type_name in ('int', 'integer', 'int4', 'int8', 'bigint', 'smallint', 'int2'):
+        return int(value)
+    if type_name in ('numeric', 'decimal', 'real', 'float', 'float4', 'float8', 'double precision'):
+        return float(value)
+    if type_name in ('bool', 'boolean'):
+        return str(value).lower() in ('t', 'true', 'y', 'yes', 'on', '1')
+    if type_name in ('text', 'varchar', 'char', 'character varying', 'uuid', 'date',
+                     'timestamp', 'timestamptz', 'timestamp with time zone',
+                     'timestamp without time zone'):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return value if not isinstance(value, (int, float)) else str(value)
+    raise UnsupportedQueryError(f"Unsupported cast to {type_name}")
+
+
+# --- Value and name formatting ----------------------------------------------
+
+_RESERVED_CHARS = set(',.:()"\\ ')
+
+
+def format_value(value: Any) -> str:
+    """Render a constant the way PostgREST expects it in a filter"""
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return 'null'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        raise UnsupportedQueryError("An INTERVAL cannot be compared with a column directly")
+    return str(value)
+
+
+def quote_value(text: str) -> str:
+    """Double-quote a value for use inside in.(...) lists and and=/or= trees"""
+    if text == '' or any(char in _RESERVED_CHARS for char in text):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+def quote_name(name: str) -> str:
+    """Quote a column name for select=, order= and logic trees when it needs it"""
+    if re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name):
+        return name
+    return '"' + name.replace('"', '\\"') + '"'
+
+
+# --- Filters ----------------------------------------------------------------
+
+class Predicate(NamedTuple):
+    """A single column filter such as test_value gte 200"""
+    column: str
+    operator: str  # eq, neq, lt, lte, gt, gte, in, is, like, ilike (prefixed with not. when negated)
+    value: str  # formatted for a top-level parameter
+    tree_value: str  # formatted for use inside and=/or= trees
+
+    def negate(self) -> 'Predicate':
+        operator = self.operator[4:] if self.operator.startswith('not.') else 'not.' + self.operator
+        return self._replace(operator=operator)
+
+    def tree(self) -> str:
+        return f"{quote_name(self.column)}.{self.operator}.{self.tree_value}"
+
+
+class Group(NamedTuple):
+    """An AND/OR combination of filters"""
+    kind: str  # 'and' or 'or'
+    children: Tuple
+    negated: bool = False
+
+    def negate(self) -> 'Group':
+        return self._replace(negated=not self.negated)
+
+    def tree(self) -> str:
+        prefix = 'not.' if self.negated else ''
+        return f"{prefix}{self.kind}({','.join(child.tree() for child in self.children)})"
+
+
+FilterNode = Union[Predicate, Group]
+
+_COMPARISON_OPERATORS = {'=': 'eq', '<>': 'neq', '<': 'lt', '<=': 'lte', '>': 'gt', '>=': 'gte'}
+_FLIPPED = {'=': '=', '<>': '<>', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+
+def _simple(column: str, operator: str, value: Any) -> Predicate:
+    text = format_value(value)
+    return Predicate(column, operator, text, quote_value(text))
+
+
+def filter_node(expr, resolve_column: Callable[[Column], str],
+                now: Optional[datetime] = None) -> FilterNode:
+    """Translate a boolean expression into a PostgREST filter tree"""
+    if isinstance(expr, BinaryOp) and expr.op in ('AND', 'OR'):
+        kind = expr.op.lower()
+        children = []
+        for side in (expr.left, expr.right):
+            node = filter_node(side, resolve_column, now)
+            # Flatten a AND (b AND c) into one group
+            if isinstance(node, Group) and node.kind == kind and not node.negated:
+                children.extend(node.children)
+            else:
+                children.append(node)
+        return Group(kind, tuple(children))
+
+    if isinstance(expr, UnaryOp) and expr.op == 'NOT':
+        if isinstance(expr.operand, Column):
+            return _simple(resolve_column(expr.operand), 'eq', False)
+        return filter_node(expr.operand, resolve_column, now).negate()
+
+    if isinstance(expr, Column):
+        return _simple(resolve_column(expr), 'eq', True)
+
+    if isinstance(expr, BinaryOp) and expr.op in _COMPARISON_OPERATORS:
+        op, left, right = expr.op, expr.left, expr.right
+        if not isinstance(left, Column) and isinstance(right, Column):
+            op, left, right = _FLIPPED[op], right, left
+        if not isinstance(left, Column):
+            raise UnsupportedQueryError("Only column-vs-constant comparisons can be pushed down")
+        value = constant_value(right, now)
+        if value is None:
+            raise UnsupportedQueryError("Comparisons with NULL never match; use IS NULL")
+        return _simple(resolve_column(left), _COMPARISON_OPERATORS[op], value)
+
+    if isinstance(expr, IsTest):
+        if not isinstance(expr.expr, Column):
+            raise UnsupportedQueryError("IS tests can only be pushed down on columns")
+        node = _simple(resolve_column(expr.expr), 'is', expr.value)
+        return node.negate() if expr.negated else node
+
+    if isinstance(expr, InList):
+        if not isinstance(expr.expr, Column):
+            raise UnsupportedQueryError("IN lists can only be pushed down on columns")
+        values = [constant_value(item, now) for item in expr.items]
+        if any(value is None for value in values):
+            raise UnsupportedQueryError("NULL inside IN (...) is not supported")
+        items = ','.join(quote_value(format_value(value)) for value in values)
+        node = Predicate(resolve_column(expr.expr), 'in', f"({items})", f"({items})")
+        return node.negate() if expr.negated else node
+
+    if isinstance(expr, Between):
+        if not isinstance(expr.expr, Column):
+            raise UnsupportedQueryError("BETWEEN can only be pushed down on columns")
+        column = resolve_column(expr.expr)
+        low, high = constant_value(expr.low, now), constant_value(expr.high, now)
+        if low is None or high is None:
+            raise UnsupportedQueryError("BETWEEN with NULL bounds is not supported")
+        if expr.negated:
+            return Group('or', (_simple(column, 'lt', low), _simple(column, 'gt', high)))
+        return Group('and', (_simple(column, 'gte', low), _simple(column, 'lte', high)))
+
+    if isinstance(expr, Like):
+        if not isinstance(expr.expr, Column):
+            raise UnsupportedQueryError("LIKE can only be pushed down on columns")
+        pattern = constant_value(expr.pattern, now)
+        if not isinstance(pattern, str):
+            raise UnsupportedQueryError("LIKE patterns must be string literals")
+        if '*' in pattern or '\\' in pattern:
+            raise UnsupportedQueryError("LIKE patterns containing * or \\ cannot be pushed down")
+        node = _simple(resolve_column(expr.expr), 'ilike' if expr.case_insensitive else 'like',
+                       pattern.replace('%', '*'))
+        return node.negate() if expr.negated else node
+
+    if isinstance(expr, Literal) and expr.value is True:
+        return Group('and', ())
+
+    raise UnsupportedQueryError(f"Cannot push down WHERE condition: {type(expr).__name__}")
+
+
+def filter_params(node: FilterNode) -> List[Tuple[str, str]]:
+    """Render a filter tree as query parameters (top-level AND becomes separate params)"""
+    if isinstance(node, Predicate):
+        return [(node.column, f"{node.operator}.{node.value}")]
+    if node.kind == 'and' and not node.negated:
+        params = []
+        groups = []
+        for child in node.children:
+            if isinstance(child, Predicate):
+                params.extend(filter_params(child))
+            else:
+                groups.append(child)
+        group_params = [param for group in groups for param in filter_params(group)]
+        if len({key for key, _ in group_params}) < len(group_params):
+            # Repeated or=/and= keys are ambiguous, so combine the groups in one and=(...)
+            group_params = [('and', f"({','.join(group.tree() for group in groups)})")]
+        return params + group_params
+    if not node.children:
+        # NOT TRUE matches nothing; an empty OR is equally unsatisfiable
+        raise UnsupportedQueryError("Constant-false WHERE clauses are not supported")
+    key = ('not.' if node.negated else '') + node.kind
+    return [(key, f"({','.join(child.tree() for child in node.children)})")]
+
+
+# --- SELECT translation -----------------------------------------------------
+
+def column_resolver(statement: SelectStatement) -> Callable[[Column], str]:
+    """Resolve (optionally qualified) column references against the single FROM table"""
+    table = statement.table
+    qualifiers = {table.name, table.alias} - {None}
+    if table.schema:
+        qualifiers.add(f"{table.schema}.{table.name}")
+
+    def resolve(column: Column) -> str:
+        if column.table is not None and column.table not in qualifiers:
+            raise UnsupportedQueryError(f"Unknown table reference {column.table!r}")
+        return column.name
+
+    return resolve
+
+
+def table_path(statement: SelectStatement) -> Tuple[str, Dict[str, str]]:
+    """The REST path for the FROM table and any schema header it needs"""
+    return _table_path(statement.table.name, statement.table.schema)
+
+
+def _table_path(name: str, schema: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    headers = {}
+    if schema and schema != 'public':
+        headers['Accept-Profile'] = schema
+    return f"/rest/v1/{quote(name, safe='')}", headers
+
+
+def table_request(name: str, schema: Optional[str] = None) -> PostgrestRequest:
+    """A request for every row of a table, named exactly (no SQL parsing or case folding)"""
+    path, headers = _table_path(name, schema)
+    return PostgrestRequest(path, [], headers)
+
+
+def _select_param(statement: SelectStatement, resolve: Callable[[Column], str]) -> Optional[str]:
+    fields = []
+    for item in statement.items:
+        expr = item.expr
+        if isinstance(expr, Star):
+            if expr.table is not None:
+                resolve(Column('*', expr.table))
+            fields.append('*')
+            continue
+        cast = ''
+        if isinstance(expr, Cast) and isinstance(expr.expr, Column):
+            cast = f"::{expr.type_name}"
+            expr = expr.expr
+        if not isinstance(expr, Column):
+            raise UnsupportedQueryError("Only plain columns (optionally cast) can be projected")
+        name = resolve(expr)
+        alias = item.alias if item.alias and item.alias != name else None
+        field = quote_name(name) + cast
+        fields.append(f"{quote_name(alias)}:{field}" if alias else field)
+    return None if fields == ['*'] else ','.join(fields)
+
+
+def _order_param(statement: SelectStatement, resolve: Callable[[Column], str]) -> Optional[str]:
+    if not statement.order_by:
+        return None
+    aliases = {item.alias: item.expr for item in statement.items if item.alias}
+    keys = []
+    for order in statement.order_by:
+        expr = order.expr
+        if isinstance(expr, Literal) and isinstance(expr.value, int) and not isinstance(expr.value, bool):
+            # ORDER BY 2 refers to the second select item
+            if not 1 <= expr.value <= len(statement.items):
+                raise UnsupportedQueryError(f"ORDER BY position {expr.value} is out of range")
+            expr = statement.items[expr.value - 1].expr
+        elif isinstance(expr, Column) and expr.table is None and expr.name in aliases:
+            expr = aliases[expr.name]
+        if not isinstance(expr, Column):
+            raise UnsupportedQueryError("Only columns can be used in ORDER BY")
+        key = f"{quote_name(resolve(expr))}.{'desc' if order.descending else 'asc'}"
+        if order.nulls_first is not None:
+            key += '.nullsfirst' if order.nulls_first else '.nullslast'
+        keys.append(key)
+    return ','.join(keys)
+
+
+def translate_select(sql: str) -> PostgrestRequest:
+    """Translate a SELECT into a PostgREST request, or raise UnsupportedQueryError
+
+    Not cached: NOW() and friends are folded to the current time on every call.
+    """
+    statement = parse_select(sql)
+    if is_aggregate_query(statement):
+        raise UnsupportedQueryError("Aggregates, GROUP BY and HAVING cannot be pushed down")
+    if statement.distinct:
+        raise UnsupportedQueryError("SELECT DISTINCT cannot be pushed down")
+
+    resolve = column_resolver(statement)
+    path, headers = table_path(statement)
+    params: List[Tuple[str, str]] = []
+
+    select = _select_param(statement, resolve)
+    if select is not None:
+        params.append(('select', select))
+    if statement.where is not None:
+        params.extend(filter_params(filter_node(statement.where, resolve)))
+    order = _order_param(statement, resolve)
+    if order is not None:
+        params.append(('order', order))
+    if statement.limit is not None:
+        params.append(('limit', str(statement.limit)))
+    if statement.offset is not None:
+        params.append(('offset', str(statement.offset)))
+
+    return PostgrestRequest(path, params, headers)
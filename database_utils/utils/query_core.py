@@ -0,0 +1,488 @@
+"""
+Transport-independent pieces shared by SupabaseUtil and AsyncSupabaseUtil.
+
+Everything here is pure: configuration loading, query routing, request
+building and result normalization. The sync and async utilities only
+differ in how they send the HTTP requests these helpers describe.
+"""
+
+import os
+import re
+import json
+import itertools
+from functools import lru_cache
+from typing import (Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence,
+                    Tuple, Union)
+
+from .postgrest_query import PostgrestRequest, quote_name, translate_select
+from .sql_aggregate import is_local_aggregate
+from .sql_analysis import analyze_statement
+from .sql_insert import InsertStatement, parse_insert, rows_payload, statement_request
+from .sql_select import UnsupportedQueryError
+
+# HTTP statuses worth retrying: rate limiting and transient gateway/server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Keywords whose 201 RPC response to a read should be computed locally rather than reported as generic success
+RPC_LOCAL_KEYWORDS = ['COUNT(', 'AVG(', 'SUM(', 'MIN(', 'MAX(', 'BETWEEN', 'CASE WHEN']
+
+# PostgREST's max-rows on Supabase: no response carries more rows than this, so a
+# larger page would come back short and end the scan early. Pages are capped here.
+MAX_PAGE_SIZE = 1000
+
+# Rows per page when streaming SELECT results
+DEFAULT_PAGE_SIZE = MAX_PAGE_SIZE
+
+# Rows per JSON-array POST when INSERTs are sent straight to the table endpoint
+DEFAULT_INSERT_BATCH_SIZE = 5000
+
+# Prefix of the error raised by a transaction script, naming the statement that failed
+TRANSACTION_ERROR_PREFIX = 'db_utils statement'
+_TRANSACTION_ERROR = re.compile(rf'{TRANSACTION_ERROR_PREFIX} (\d+): ((?:[^"\\]|\\.)*)')
+
+# Returned by interpret_rpc_response when the query should be run by the local aggregate engine
+RUN_LOCALLY = object()
+
+
+class SupabaseQueryError(Exception):
+    """Raised by streaming APIs when a request fails part-way through a result"""
+
+
+@lru_cache(maxsize=None)
+def _load_env_files():
+    """Load the project's .env file into the environment, once per process"""
+    from dotenv import load_dotenv
+
+    # Try to load from parent directory first, then current directory
+    if os.path.exists('../.env.local'):
+        load_dotenv('../.env.local')
+    elif os.path.exists('.env.local'):
+        load_dotenv('.env.local')
+    else:
+        load_dotenv()  # Try default .env file
+
+
+def load_config() -> Tuple[Optional[str], Optional[str]]:
+    """Load .env files (on the first call) and return (NEXT_PUBLIC_SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)"""
+    # .env files never override variables that are already set, so skip reading them when both are
+    if not (os.getenv('NEXT_PUBLIC_SUPABASE_URL') and os.getenv('SUPABASE_SERVICE_ROLE_KEY')):
+        _load_env_files()
+    return os.getenv('NEXT_PUBLIC_SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+
+def auth_headers(service_key: Optional[str]) -> Dict[str, str]:
+    """Headers sent with every REST API request"""
+    return {
+        'apikey': service_key or '',
+        'Authorization': f'Bearer {service_key}',
+        'Content-Type': 'application/json'
+    }
+
+
+def clean_sql_query(query: str) -> str:
+    """Remove comments and clean up the SQL query"""
+    lines = query.split('\n')
+    cleaned_lines = []
+
+    for line in lines:
+        # Remove comments (lines starting with --)
+        if not line.strip().startswith('--'):
+            cleaned_lines.append(line)
+
+    # Join lines and clean up whitespace
+    cleaned_query = '\n'.join(cleaned_lines).strip()
+
+    # If empty, return original
+    if not cleaned_query:
+        return query.strip()
+
+    return cleaned_query
+
+
+def route_query(cleaned_query: str) -> str:
+    """Pick the execution path for a cleaned query: 'select', 'aggregate', 'insert' or 'rpc'"""
+    query_upper = cleaned_query.upper()
+    if query_upper.strip().startswith('SELECT'):
+        try:
+            translate_select(cleaned_query)
+            return 'select'
+        except UnsupportedQueryError:
+            # Aggregates, GROUP BY and DISTINCT are computed locally over pushed-down rows;
+            # anything else stays on the select path and fails there with the reason
+            if is_local_aggregate(cleaned_query):
+                return 'aggregate'
+            return 'select'
+    if query_upper.lstrip().startswith('INSERT'):
+        # Simple INSERT ... VALUES go to the table endpoint; the rest fall back to RPC
+        return 'insert'
+    # For DDL/DML queries, try RPC functions
+    return 'rpc'
+
+
+def build_select_request(query: str) -> PostgrestRequest:
+    """Translate a SELECT into a table request with projection, filters, ordering and limits pushed down
+    
+    Raises UnsupportedQueryError (a ValueError) for anything it cannot translate exactly,
+    rather than fetching unfiltered data.
+    """
+    return translate_select(query)
+
+
+class Paginator:
+    """Computes the parameters of successive pages of a table GET
+
+    Uses keyset pagination (key_column > last seen value) when a key column is
+    given, projected, and compatible with the query's ORDER BY, and limit/offset
+    otherwise. A LIMIT/OFFSET already present in the base parameters bounds the scan.
+    Offset pages without an ORDER BY are ordered by primary_key; if that is unknown
+    too, advance() raises SupabaseQueryError once a second page is needed, since the
+    server could return rows twice or skip them. page_size is capped at MAX_PAGE_SIZE.
+    """
+
+    def __init__(self, params: List[Tuple[str, str]], page_size: int = DEFAULT_PAGE_SIZE,
+                 key_column: Optional[str] = None, primary_key: Sequence[str] = ()):
+        base = []
+        self.remaining = None
+        self.offset = 0
+        order = select = None
+        for key, value in params:
+            if key == 'limit':
+                self.remaining = int(value)
+            elif key == 'offset':
+                self.offset = int(value)
+            else:
+                if key == 'order':
+                    order = value
+                elif key == 'select':
+                    select = value
+                base.append((key, value))
+
+        if key_column and order not in (None, f"{quote_name(key_column)}.asc"):
+            key_column = None
+        if key_column and select is not None and not _selects_column(select, key_column):
+            # Rows would not carry the key, so keyset pagination cannot continue
+            key_column = None
+        if key_column and order is None:
+            base.append(('order', f"{quote_name(key_column)}.asc"))
+        elif order is None and primary_key:
+            base.append(('order', ','.join(f"{quote_name(column)}.asc" for column in primary_key)))
+
+        self.key_column = key_column
+        self.base = base
+        self.unordered = not key_column and order is None and not primary_key
+        self.page_size = min(page_size, MAX_PAGE_SIZE)
+        self.last_key = None
+        self.done = self.remaining == 0
+
+    def next_params(self) -> List[Tuple[str, str]]:
+        """Parameters for the next page request"""
+        limit = self.page_size if self.remaining is None else min(self.page_size, self.remaining)
+        params = list(self.base) + [('limit', str(limit))]
+        if self.key_column and self.last_key is not None:
+            params.append((quote_name(self.key_column), f"gt.{self.last_key}"))
+        if self.offset:
+            params.append(('offset', str(self.offset)))
+        return params
+
+    def advance(self, rows: List[Dict[str, Any]]):
+        """Record a fetched page; sets done when the scan is complete"""
+        requested = self.page_size if self.remaining is None else min(self.page_size, self.remaining)
+        if self.key_column:
+            # The initial OFFSET only applies to the first page of a keyset scan
+            self.offset = 0
+            if rows:
+                self.last_key = rows[-1].get(self.key_column)
+        else:
+            self.offset += len(rows)
+        if self.remaining is not None:
+            self.remaining -= len(rows)
+        self.done = len(rows) < requested or self.remaining == 0 or (
+            self.key_column is not None and self.last_key is None)
+        if self.unordered and not self.done:
+            raise SupabaseQueryError(
+                f"The result is larger than one page ({self.page_size} rows) and has no stable order: "
+                "add an ORDER BY on a unique column, or pass key_column")
+
+
+def _selects_column(select: str, column: str) -> bool:
+    """True if a select= parameter returns the column under its own name"""
+    for field in select.split(','):
+        if field == '*' or field.split('::')[0] == quote_name(column):
+            return True
+    return False
+
+
+def content_range_total(content_range: Optional[str]) -> Optional[int]:
+    """The total row count from a Content-Range header such as '0-24/3573' or '*/0'"""
+    if not content_range or '/' not in content_range:
+        return None
+    total = content_range.rsplit('/', 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+def is_missing_function(response) -> bool:
+    """True if an RPC response means the function (or its argument name) does not exist
+
+    PostgREST answers 404 with a PGRST code for unknown functions, but also maps
+    SQL errors such as undefined_table (42P01) to 404; those come from a working RPC.
+    """
+    if response.status_code != 404:
+        return False
+    try:
+        code = str(response.json().get('code') or '')
+    except (ValueError, AttributeError):
+        return True
+    return not (len(code) == 5 and not code.startswith('PGRST'))
+
+
+def interpret_rpc_response(query: str, response) -> Any:
+    """Turn an RPC response into a result dict, RUN_LOCALLY, or None if the function does not exist
+
+    Works with any response object exposing status_code and json() (requests or httpx).
+    """
+    if response.status_code == 200:
+        result_data = response.json()
+        # Handle different response formats
+        if isinstance(result_data, str):
+            # If it's a string, try to parse as JSON
+            try:
+                return {"success": True, "data": json.loads(result_data)}
+            except ValueError:
+                return {"success": True, "data": result_data}
+        return {"success": True, "data": result_data}
+    elif response.status_code in (201, 204):
+        # A read whose rows were not returned should not be reported as a generic success
+        if (analyze_statement(query).kind == 'select'
+                and any(keyword in query.upper() for keyword in RPC_LOCAL_KEYWORDS)):
+            return RUN_LOCALLY
+        return {"success": True, "data": "Query executed successfully"}
+    elif is_missing_function(response):
+        return None
+    return {"success": False, "error": f"RPC execution failed: HTTP {response.status_code} - {response.text}"}
+
+
+def parse_fast_insert(query: str) -> Optional[InsertStatement]:
+    """The parsed INSERT if the statement can be sent as a JSON-array POST, else None"""
+    cleaned_query = clean_sql_query(query)
+    if route_query(cleaned_query) != 'insert':
+        return None
+    try:
+        return parse_insert(cleaned_query)
+    except UnsupportedQueryError:
+        return None
+
+
+def interpret_insert_response(response) -> Dict[str, Any]:
+    """Turn the response of an insert POST into a result dict"""
+    if response.status_code in (200, 201, 204):
+        return {"success": True, "data": "Query executed successfully"}
+    return {"success": False, "error": f"Insert failed: HTTP {response.status_code} - {response.text}"}
+
+
+def encode_rows(rows: List[Dict[str, Any]]) -> bytes:
+    """Serialize a JSON-array body; dates, decimals and UUIDs are sent as their text form"""
+    return json.dumps(rows, default=str).encode('utf-8')
+
+
+def iter_chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of up to size items, consuming the iterable lazily"""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class InsertRun(NamedTuple):
+    """Consecutive INSERTs with the same target, sent together as one JSON-array POST"""
+    statements: List[Tuple[int, str, InsertStatement]]  # (query_number, query, parsed)
+
+    @property
+    def queries(self) -> List[Tuple[int, str]]:
+        return [(i, query) for i, query, _ in self.statements]
+
+    @property
+    def row_count(self) -> int:
+        return sum(len(statement.rows) for _, _, statement in self.statements)
+
+    def request(self):
+        return statement_request(self.statements[0][2])
+
+    def body(self) -> bytes:
+        return encode_rows(rows_payload(statement for _, _, statement in self.statements))
+
+
+def group_statements(queries: Iterable[str],
+                     insert_batch_size: int = DEFAULT_INSERT_BATCH_SIZE) -> Iterator[Union[Tuple[int, str], InsertRun]]:
+    """Number statements, coalescing consecutive simple INSERTs into the same target
+
+    Yields (query_number, query) for ordinary statements and an InsertRun for each
+    group of inserts, closed when about insert_batch_size rows are pending. A single
+    statement is never split across requests. insert_batch_size=0 disables grouping.
+    """
+    run: List[Tuple[int, str, InsertStatement]] = []
+    pending_rows = 0
+
+    for i, query in enumerate(queries, 1):
+        statement = parse_fast_insert(query) if insert_batch_size else None
+        if run and (statement is None or statement.target != run[0][2].target
+                    or pending_rows + len(statement.rows) > insert_batch_size):
+            yield InsertRun(run)
+            run, pending_rows = [], 0
+        if statement is None:
+            yield i, query
+        else:
+            run.append((i, query, statement))
+            pending_rows += len(statement.rows)
+
+    if run:
+        yield InsertRun(run)
+
+
+def _dollar_quote(text: str, tag: str) -> str:
+    """Quote text as a dollar-quoted literal with a tag that does not occur inside it
+
+    "$tag" alone is enough to rule a tag out: text ending in it would run into the
+    closing "$tag$" and end the literal early.
+    """
+    while f"${tag}" in text:
+        tag += '_'
+    return f"${tag}${text}${tag}$"
+
+
+def build_transaction_script(statements: List[Tuple[int, str]]) -> str:
+    """Wrap numbered statements in one DO block for a single exec_sql call
+
+    An RPC call already runs in one transaction, so no BEGIN/COMMIT is added (and
+    none is allowed inside a function). Each statement runs through EXECUTE; if one
+    fails, the whole block is rolled back and the error names its query_number.
+    """
+    lines = ["DECLARE", "    current_statement integer := 0;", "BEGIN"]
+    for i, query in statements:
+        lines.append(f"    current_statement := {i};")
+        lines.append(f"    EXECUTE {_dollar_quote(clean_sql_query(query), 'db_utils_statement')};")
+    lines += [
+        "EXCEPTION WHEN OTHERS THEN",
+        "    RAISE EXCEPTION USING ERRCODE = SQLSTATE,",
+        f"        MESSAGE = format('{TRANSACTION_ERROR_PREFIX} %s: %s', current_statement, SQLERRM);",
+        "END",
+    ]
+    return "DO " + _dollar_quote('\n'.join(lines), 'db_utils_transaction')
+
+
+def transaction_results(statements: List[Tuple[int, str]],
+                        result: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Per-statement result entries for a transaction script's RPC result, and the failed query_number
+
+    On failure every statement is reported as failed, since nothing was committed;
+    the statement that raised gets the database error. The failed number is None on
+    success and the first statement's if the error does not say which one failed.
+    """
+    error = result.get("error") or ""
+    # Some exec_sql functions catch errors and return them with HTTP 200
+    match = _TRANSACTION_ERROR.search(error if not result["success"] else json.dumps(result.get("data")))
+    if result["success"] and match is None:
+        return [build_query_result(i, query, {"success": True, "data": "Query executed successfully (in transaction)"})
+                for i, query in statements], None
+
+    failed = int(match.group(1)) if match else None
+    message = json.loads(f'"{match.group(2)}"') if match else error
+    entries = []
+    for i, query in statements:
+        if failed is None:
+            entry_error = f"Transaction failed: {message}"
+        elif i == failed:
+            entry_error = message
+        else:
+            entry_error = f"Rolled back: statement {failed} failed" if i < failed else f"Not executed: statement {failed} failed"
+        entries.append(build_query_result(i, query, {"success": False, "error": entry_error}))
+    return entries, failed if failed is not None else statements[0][0]
+
+
+def build_query_result(i: int, query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the per-statement entry of a multi-statement result"""
+    return {
+        "query_number": i,
+        "query": query[:100] + "..." if len(query) > 100 else query,
+        "success": result["success"],
+        "data": result.get("data"),
+        "error": result.get("error")
+    }
+
+
+def summarize_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-statement entries into the execute_multiple_queries result"""
+    return {
+        "success": all(r["success"] for r in results),
+        "data": results,
+        "total_queries": len(results),
+        "successful_queries": sum(1 for r in results if r["success"])
+    }
+
+
+# Tables a statement may reach, or None when it could be any table
+Tables = Optional[FrozenSet[str]]
+
+
+def _reach(tables: FrozenSet[str], links: Optional[Mapping[str, FrozenSet[str]]]) -> Tables:
+    """The tables linked to any of the given ones; None if one of them has unknown links"""
+    reached = frozenset()
+    for table in tables:
+        if links is None or table not in links:
+            return None
+        reached |= links[table]
+    return reached
+
+
+def _union(first: Tables, second: Tables) -> Tables:
+    return None if first is None or second is None else first | second
+
+
+def _overlap(first: Tables, second: Tables) -> bool:
+    if first is None or second is None:
+        # Unknown links overlap with anything except no tables at all
+        return first != frozenset() and second != frozenset()
+    return bool(first & second)
+
+
+def plan_batches(units: Iterable[Union[Tuple[int, str], InsertRun]], jobs: int,
+                 links: Optional[Mapping[str, FrozenSet[str]]] = None
+                 ) -> Iterator[List[Union[Tuple[int, str], InsertRun]]]:
+    """Group the units of group_statements into batches that are safe to run concurrently
+
+    DDL and table-less statements come out as single-unit batches (ordering
+    barriers); a unit that conflicts with the current batch starts a new one.
+    Two units conflict when one writes a table the other touches, or a table
+    linked to it by foreign keys (`links`, from sql_analysis.linked_tables).
+    Without links, or for a table missing from them, a write conflicts with
+    every other statement that touches a table. Batches are capped at
+    jobs * 8 units to bound memory.
+    """
+    batch: List[Union[Tuple[int, str], InsertRun]] = []
+    batch_reads: Tables = frozenset()
+    batch_writes: Tables = frozenset()
+    max_batch = jobs * 8
+
+    for unit in units:
+        # Every insert of a run targets the same table, so its first statement speaks for it
+        query = unit.statements[0][1] if isinstance(unit, InsertRun) else unit[1]
+        info = analyze_statement(query)
+        if info.is_barrier:
+            if batch:
+                yield batch
+            yield [unit]
+            batch, batch_reads, batch_writes = [], frozenset(), frozenset()
+            continue
+
+        reads, writes = _reach(info.reads, links), _reach(info.writes, links)
+        conflicts = (_overlap(writes, _union(batch_reads, batch_writes)) or _overlap(reads, batch_writes))
+        if batch and (conflicts or len(batch) >= max_batch):
+            yield batch
+            batch, batch_reads, batch_writes = [], frozenset(), frozenset()
+        batch.append(unit)
+        batch_reads = _union(batch_reads, reads)
+        batch_writes = _union(batch_writes, writes)
+
+    if batch:
+        yield batch
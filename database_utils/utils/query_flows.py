@@ -0,0 +1,616 @@
+"""
+Statement execution shared by SupabaseUtil and AsyncSupabaseUtil.
+
+Everything the utilities do between HTTP requests is written once here:
+connection checks, routing, the result cache, bulk inserts, transactions,
+RPC discovery and local aggregation. Each step is a flow, a generator
+that never touches the network itself. It yields an HttpCall when it
+needs a request sent, or CONNECT when it needs a verified connection,
+and gets the response (or the exception raised while sending) back:
+
+    response = yield HttpCall('GET', '/rest/v1/')
+
+Each utility drives flows with its own transport in _run(flow):
+SupabaseUtil over a requests session on the calling thread,
+AsyncSupabaseUtil over an httpx client in the event loop. Concurrency,
+file reading and streaming stay with the transport too.
+"""
+
+import time
+from typing import Any, Callable, Dict, FrozenSet, Generator, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from .postgrest_query import PostgrestRequest
+from .query_core import (
+    DEFAULT_INSERT_BATCH_SIZE, DEFAULT_PAGE_SIZE, RETRY_STATUSES, RUN_LOCALLY, InsertRun, Paginator,
+    SupabaseQueryError, build_query_result, build_select_request, build_transaction_script, clean_sql_query,
+    content_range_total, encode_rows, interpret_insert_response, interpret_rpc_response, iter_chunks,
+    load_config, route_query, summarize_results, transaction_results
+)
+from .query_metrics import QueryMetrics, current_metrics, phase, set_path
+from .request_scheduler import BUDGET_EXHAUSTED_ERROR, RequestScheduler
+from .result_cache import ResultCache
+from .rpc_discovery import (
+    NO_RPC, NO_RPC_ERROR, RPC_CANDIDATES, RpcEndpoint, RpcEndpointCache, discover_foreign_keys, discover_primary_keys,
+    discover_rpc_endpoint, rpc_endpoint_cache
+)
+from .sql_aggregate import AggregateEngine, plan_aggregate
+from .sql_analysis import analyze_statement, is_idempotent, is_volatile, linked_tables, modified_tables, normalize_table_name
+from .sql_insert import chunk_request, parse_insert, rows_payload, statement_request
+from .sql_select import UnsupportedQueryError
+
+
+class HttpCall(NamedTuple):
+    """A REST API request a flow needs sent; the driver sends the response back in"""
+    method: str
+    path: str
+    params: Any = None
+    headers: Optional[Dict[str, str]] = None
+    json: Any = None
+    body: Optional[bytes] = None
+    # None: GET, HEAD and OPTIONS are idempotent, other methods are not
+    idempotent: Optional[bool] = None
+    # Seconds left until the statement's deadline, if it has one
+    timeout: Optional[float] = None
+
+
+class Connect(NamedTuple):
+    """A request for a verified connection; the driver sends back connect_to_database()"""
+    timeout: Optional[float] = None
+
+
+CONNECT = Connect()
+
+Instruction = Union[HttpCall, Connect]
+Flow = Generator[Instruction, Any, Any]
+
+
+class Deadline(BaseException):
+    """Thrown into a flow by the driver when its statement runs out of time
+
+    Like asyncio.CancelledError it is not an Exception, so the handlers that turn
+    failures into result dicts let it through to the flow that set the deadline.
+    """
+
+
+class QueryFlows:
+    """Configuration, state and flows shared by SupabaseUtil and AsyncSupabaseUtil
+
+    Subclasses provide the transport: _run(flow) to drive a flow, connect_to_database()
+    (which runs _probe_connection under a lock) and close(). Unless noted otherwise,
+    the underscore methods here return flows.
+    """
+
+    # Overall deadline of a single statement, including retries and paging; None for no deadline
+    query_timeout: Optional[float] = None
+
+    def __init__(self, pool_size: int = 10, timeout: float = 30.0,
+                 max_retries: int = 3, backoff_factor: float = 0.5,
+                 connection_ttl: float = 300.0, rpc_cache: Optional[RpcEndpointCache] = None,
+                 insert_batch_size: int = DEFAULT_INSERT_BATCH_SIZE, result_cache: Optional[ResultCache] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        self.url, self.service_key = load_config()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # Connection state: a successful probe is trusted for connection_ttl seconds
+        self.connection_ttl = connection_ttl
+        self.health_checks = 0
+        self._connected_at: Optional[float] = None
+        # SQL RPC endpoint per project URL, shared across instances and runs
+        self.rpc_cache = rpc_cache or rpc_endpoint_cache
+        self._openapi_checked = False
+        # The OpenAPI response of the last health probe, read for primary and foreign keys when first needed
+        self._openapi_response = None
+        self._primary_keys: Optional[Dict[str, List[str]]] = None
+        self._table_links: Optional[Dict[str, FrozenSet[str]]] = None
+        # Rows per bulk INSERT request; 0 sends every INSERT through the SQL RPC
+        self.insert_batch_size = insert_batch_size
+        # Optional cache of read-only results, invalidated by writes through this instance
+        self.result_cache = result_cache
+        # Paces every request and retries the ones that are safe to retry
+        self.scheduler = scheduler or RequestScheduler(max_concurrency=pool_size, max_retries=max_retries,
+                                                       backoff_factor=backoff_factor)
+        # Called with a QueryMetrics record after every statement; nothing is measured without hooks
+        self.metrics_hooks: List[Callable[[QueryMetrics], None]] = []
+
+    @property
+    def is_connected(self) -> bool:
+        """True if the last health probe succeeded within connection_ttl"""
+        return (self._connected_at is not None
+                and time.monotonic() - self._connected_at < self.connection_ttl)
+
+    def _probe_connection(self, force: bool = False) -> Flow:
+        """Send the health probe unless a recent one succeeded (the body of connect_to_database)"""
+        try:
+            if not self.url or not self.service_key:
+                self.logger.error("Missing NEXT_PUBLIC_SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
+                return False
+
+            # Another thread or task may have probed while we waited for the lock
+            if not force and self.is_connected:
+                return True
+
+            # Test connection with a simple REST API call
+            self.health_checks += 1
+            with phase('connect'):
+                response = yield HttpCall('GET', '/rest/v1/')
+
+                if response.status_code == 200:
+                    self._connected_at = time.monotonic()
+                    self._learn_rpc_endpoint(response)
+                    self._openapi_response, self._primary_keys, self._table_links = response, None, None
+                    self.logger.info("Successfully connected to Supabase database")
+                    return True
+                else:
+                    self._connected_at = None
+                    self.logger.error(f"Connection test failed: HTTP {response.status_code}")
+                    return False
+
+        except Exception as e:
+            self._connected_at = None
+            self.logger.error(f"Failed to connect to database: {e}")
+            return False
+
+    # --- Metrics -------------------------------------------------------------
+
+    def add_metrics_hook(self, hook: Callable[[QueryMetrics], None]):
+        """Call hook(metrics) after every statement, bulk insert run and transaction chunk"""
+        self.metrics_hooks.append(hook)
+
+    def _start_metrics(self, query: str, query_number: Optional[int] = None,
+                       statements: int = 1) -> Optional[QueryMetrics]:
+        """A new record, or None if nobody listens or an enclosing statement is already measured"""
+        if not self.metrics_hooks or current_metrics() is not None:
+            return None
+        return QueryMetrics(query, query_number, statements)
+
+    def _measure(self, query: str, query_number: Optional[int], flow: Flow, statements: int = 1) -> Flow:
+        """Run flow as one measured statement"""
+        metrics = self._start_metrics(query, query_number, statements)
+        if metrics is None:
+            return (yield from flow)
+        with metrics.active():
+            result = yield from flow
+        self._finish_metrics(metrics, result)
+        return result
+
+    def _finish_metrics(self, metrics: QueryMetrics, result: Dict[str, Any]):
+        metrics.finish(result)
+        for hook in self.metrics_hooks:
+            try:
+                hook(metrics)
+            except Exception as e:
+                self.logger.warning(f"Metrics hook failed: {e}")
+
+    def _with_timeout(self, flow: Flow, timeout: Optional[float]) -> Flow:
+        """Run flow with an overall deadline, returning a failed result once timeout seconds have passed"""
+        if timeout is None:
+            return (yield from flow)
+        deadline = time.monotonic() + timeout
+        send, value = flow.send, None
+        while True:
+            try:
+                instruction = send(value)
+            except StopIteration as stop:
+                return stop.value
+            except Deadline:
+                self.logger.error(f"Query timed out after {timeout}s")
+                return {"success": False, "error": f"Query timed out after {timeout}s"}
+            remaining = deadline - time.monotonic()
+            if instruction.timeout is not None:
+                remaining = min(remaining, instruction.timeout)
+            try:
+                value = yield instruction._replace(timeout=remaining)
+                send = flow.send
+            except BaseException as e:
+                value, send = e, flow.throw
+
+    # --- Statements ----------------------------------------------------------
+
+    def _execute_transaction(self, queries: Iterable[Any], chunk_size: Optional[int] = None) -> Flow:
+        try:
+            if not (yield CONNECT):
+                return {"success": False, "error": "Database connection failed"}
+
+            numbered = (item if isinstance(item, tuple) else (i, item) for i, item in enumerate(queries, 1))
+            chunks = iter_chunks(numbered, chunk_size) if chunk_size else iter([list(numbered)])
+            results = []
+            failed = None
+            for chunk in chunks:
+                if not chunk:
+                    return {"success": False, "error": "No statements to execute"}
+                if failed is not None:
+                    results.extend(build_query_result(i, query, {"success": False, "error": f"Not executed: statement {failed} failed"})
+                                   for i, query in chunk)
+                    continue
+
+                self.logger.info(f"Executing queries {chunk[0][0]}-{chunk[-1][0]} in one transaction")
+                result = yield from self._measure(chunk[0][1], chunk[0][0], self._execute_transaction_chunk(chunk),
+                                                  statements=len(chunk))
+                entries, failed = transaction_results(chunk, result)
+                self._invalidate_results(query for _, query in chunk)
+                results.extend(entries)
+                if failed is not None:
+                    self.logger.error(f"Transaction failed at query {failed}; queries {chunk[0][0]}-{chunk[-1][0]} were rolled back")
+
+            return summarize_results(results)
+
+        except Exception as e:
+            self.logger.error(f"Failed to execute transaction: {e}")
+            return {"success": False, "error": str(e)}
+
+    def _execute_transaction_chunk(self, chunk: List[Tuple[int, str]]) -> Flow:
+        set_path('transaction')
+        return (yield from self._execute_rpc_query(build_transaction_script(chunk)))
+
+    def _paginator(self, request: PostgrestRequest, page_size: int = DEFAULT_PAGE_SIZE,
+                   key_column: Optional[str] = None) -> Flow:
+        """Pages of a table request, ordered by the table's primary key if nothing else orders them"""
+        paginator = Paginator(request.params, page_size, key_column)
+        if paginator.unordered:
+            if self._openapi_response is None:
+                # The health probe fetches the OpenAPI document that lists primary keys
+                yield CONNECT
+            paginator = Paginator(request.params, page_size, key_column, self._primary_key(request.path))
+        return paginator
+
+    def _openapi(self) -> Any:
+        """The OpenAPI document of the last health probe, or None (not a flow)"""
+        try:
+            return self._openapi_response.json() if self._openapi_response is not None else None
+        except ValueError:
+            return None
+
+    def _primary_key(self, path: str) -> List[str]:
+        """Primary key columns of a table endpoint, from the OpenAPI document (empty if unknown; not a flow)"""
+        if self._primary_keys is None:
+            self._primary_keys = discover_primary_keys(self._openapi())
+        return self._primary_keys.get(path.rsplit('/', 1)[-1], [])
+
+    def _linked_tables(self) -> Optional[Dict[str, FrozenSet[str]]]:
+        """Tables connected by foreign keys, for plan_batches (None without an OpenAPI document; not a flow)"""
+        if self._table_links is None:
+            references = discover_foreign_keys(self._openapi())
+            if references is None:
+                return None
+            self._table_links = linked_tables(references)
+        return self._table_links
+
+    def _fetch_page(self, request: PostgrestRequest, paginator: Paginator) -> Flow:
+        """Fetch the next page of a table request; returns its rows"""
+        response = yield HttpCall('GET', request.path, params=paginator.next_params(), headers=request.headers)
+        if response.status_code not in (200, 206):
+            raise SupabaseQueryError(f"Table query failed: HTTP {response.status_code} - {response.text}")
+        with phase('decode'):
+            rows = response.json()
+        paginator.advance(rows)
+        return rows
+
+    def _fetch_all(self, request: PostgrestRequest, page_size: int = DEFAULT_PAGE_SIZE,
+                   key_column: Optional[str] = None) -> Flow:
+        """Fetch every page of a table request; returns the rows"""
+        paginator = yield from self._paginator(request, page_size, key_column)
+        rows = []
+        while not paginator.done:
+            rows.extend((yield from self._fetch_page(request, paginator)))
+        return rows
+
+    def _execute_unit(self, unit, total: Optional[int] = None) -> Flow:
+        """Execute a statement or an InsertRun from group_statements; returns its result entries"""
+        if self.scheduler.budget_exhausted:
+            # The run gave up on too many requests: report the rest without sending them
+            queries = unit.queries if isinstance(unit, InsertRun) else [unit]
+            return [build_query_result(i, query, {"success": False, "error": BUDGET_EXHAUSTED_ERROR})
+                    for i, query in queries]
+        if isinstance(unit, InsertRun):
+            return (yield from self._execute_insert_run(unit, total))
+        return [(yield from self._execute_numbered_query(*unit, total))]
+
+    def _execute_numbered_query(self, i: int, query: str, total: Optional[int] = None) -> Flow:
+        """Execute one statement of a multi-statement run and build its result entry"""
+        self.logger.info(f"Executing query {i}/{total}" if total else f"Executing query {i}")
+        result = yield from self._measure(query, i, self._execute_raw_query(query))
+
+        if not result["success"]:
+            self.logger.error(f"Query {i} failed: {result.get('error')}")
+
+        return build_query_result(i, query, result)
+
+    def _execute_raw_query(self, query: str, timeout: Optional[float] = None) -> Flow:
+        timeout = timeout if timeout is not None else self.query_timeout
+        try:
+            if not (yield CONNECT):
+                return {"success": False, "error": "Database connection failed"}
+
+            # Clean and prepare the query
+            query = query.strip()
+            if not query:
+                return {"success": False, "error": "Empty query"}
+
+            # Use REST API to execute SQL
+            return (yield from self._with_timeout(self._execute_ddl_query(query), timeout))
+
+        except Exception as e:
+            self.logger.error(f"Failed to execute query: {e}")
+            return {"success": False, "error": str(e)}
+
+    def _execute_ddl_query(self, query: str) -> Flow:
+        """Execute SQL queries using REST API"""
+        try:
+            # Clean the query by removing comments and finding the actual SQL
+            cleaned_query = self._clean_sql_query(query)
+
+            route = route_query(cleaned_query)
+            set_path(route)
+            if route == 'aggregate':
+                # Skip RPC and compute aggregates locally over pushed-down rows
+                return (yield from self._through_result_cache(cleaned_query, self._aggregate_query))
+            elif route == 'select':
+                return (yield from self._through_result_cache(cleaned_query, self._execute_select_query))
+            elif route == 'insert':
+                return (yield from self._through_result_cache(cleaned_query, self._execute_insert_query))
+            else:
+                # For DDL/DML queries, try RPC functions
+                return (yield from self._through_result_cache(cleaned_query, self._execute_rpc_query))
+
+        except Exception as e:
+            return {"success": False, "error": f"Query execution failed: {str(e)}"}
+
+    def _through_result_cache(self, query: str, execute: Callable[[str], Flow]) -> Flow:
+        """Serve read-only queries from the result cache; other statements drop the results they may change"""
+        if self.result_cache is None:
+            return (yield from execute(query))
+
+        tables = self._cached_tables(query)
+        if tables is None:
+            result = yield from execute(query)
+            self._invalidate_results([query])
+            return result
+
+        hit, data = self.result_cache.get(self.url, query)
+        if hit:
+            set_path('cache')
+            return {"success": True, "data": data}
+        result = yield from execute(query)
+        if result["success"]:
+            self.result_cache.put(self.url, query, tables, result.get("data"))
+        return result
+
+    def _cached_tables(self, query: str) -> Optional[FrozenSet[str]]:
+        """Tables a cacheable statement reads; None for writes, volatile SELECTs and no cache (not a flow)"""
+        info = analyze_statement(query)
+        if self.result_cache is None or info.kind != 'select' or not info.reads or is_volatile(query):
+            return None
+        return info.reads
+
+    def _invalidate_results(self, queries: Iterable[str]):
+        """Drop cached results of every table the statements may have changed (not a flow)"""
+        if self.result_cache is None:
+            return
+        tables = set()
+        for query in queries:
+            modified = modified_tables(clean_sql_query(query))
+            if modified is None:
+                # Unknown effect (functions, views, DO blocks): nothing cached can be trusted
+                self.result_cache.invalidate(self.url)
+                return
+            tables |= modified
+        self.result_cache.invalidate(self.url, tables)
+
+    def _clean_sql_query(self, query: str) -> str:
+        """Remove comments and clean up the SQL query (not a flow)"""
+        return clean_sql_query(query)
+
+    def _execute_select_query(self, query: str) -> Flow:
+        """Execute SELECT queries by extracting table name and using REST API"""
+        try:
+            request = build_select_request(query)
+
+            # Fetch page by page so results are not truncated at the server's row cap
+            return {"success": True, "data": (yield from self._fetch_all(request))}
+
+        except SupabaseQueryError as e:
+            return {"success": False, "error": str(e)}
+        except UnsupportedQueryError as e:
+            return {"success": False, "error": f"Cannot translate SELECT to a PostgREST request: {e}"}
+        except Exception as e:
+            return {"success": False, "error": f"SELECT query failed: {str(e)}"}
+
+    # --- Inserts -------------------------------------------------------------
+
+    def _execute_insert_query(self, query: str) -> Flow:
+        """Execute a simple INSERT as a POST to the table, falling back to the SQL RPC"""
+        if not self.insert_batch_size:
+            return (yield from self._execute_rpc_query(query))
+        try:
+            statement = parse_insert(query)
+        except UnsupportedQueryError:
+            return (yield from self._execute_rpc_query(query))
+
+        try:
+            request = statement_request(statement)
+            response = yield self._post_rows(request, encode_rows(rows_payload([statement])))
+        except Exception as e:
+            return {"success": False, "error": f"Insert failed: {str(e)}"}
+
+        result = interpret_insert_response(response)
+        if 400 <= response.status_code < 500 and self.rpc_cache.get(self.url) is not NO_RPC:
+            # Nothing was written. The table may be too new for PostgREST's schema cache, or the
+            # conflict may be on a unique constraint other than the primary key: let SQL decide
+            self.logger.info(f"Table insert rejected (HTTP {response.status_code}), retrying through the SQL RPC")
+            rpc_result = yield from self._execute_rpc_query(query)
+            if rpc_result.get("error") != NO_RPC_ERROR:
+                return rpc_result
+        return result
+
+    def _execute_insert_run(self, run: InsertRun, total: Optional[int] = None) -> Flow:
+        """Send a run of INSERTs into one table as a single bulk POST, with one result entry per statement"""
+        if len(run.statements) == 1:
+            return [(yield from self._execute_numbered_query(*run.queries[0], total))]
+
+        first, last = run.statements[0][0], run.statements[-1][0]
+        self.logger.info(f"Executing queries {first}-{last} as one bulk insert of {run.row_count} rows")
+        result = yield from self._measure(run.queries[0][1], first, self._post_insert_run(run),
+                                          statements=len(run.statements))
+
+        if not result["success"] and 400 <= result.get("status", 0) < 500:
+            # The POST was rejected, so nothing was written: run the statements one by one
+            # to report the failing one and keep the others' effects, as separate statements would
+            self.logger.warning(f"Bulk insert of queries {first}-{last} was rejected, retrying them one at a time")
+            entries = []
+            for i, query in run.queries:
+                entries.append((yield from self._execute_numbered_query(i, query, total)))
+            return entries
+        if not result["success"]:
+            # A 5xx, timeout or dropped connection does not tell whether the rows were written;
+            # sending them again could insert them twice
+            self.logger.error(f"Bulk insert of queries {first}-{last} failed: {result.get('error')}")
+        return [build_query_result(i, query, result) for i, query in run.queries]
+
+    def _post_insert_run(self, run: InsertRun) -> Flow:
+        set_path('bulk_insert')
+        if not (yield CONNECT):
+            return {"success": False, "error": "Database connection failed"}
+        result = yield from self._with_timeout(self._send_insert_run(run), self.query_timeout)
+        # Every statement of a run targets the same table
+        self._invalidate_results([run.queries[0][1]])
+        return result
+
+    def _send_insert_run(self, run: InsertRun) -> Flow:
+        """POST the rows of a run; a failed result carries the HTTP status, if a response came back"""
+        try:
+            response = yield self._post_rows(run.request(), run.body())
+        except Exception as e:
+            return {"success": False, "error": f"Insert failed: {str(e)}"}
+        result = interpret_insert_response(response)
+        if not result["success"]:
+            result["status"] = response.status_code
+        return result
+
+    def _post_rows(self, request: PostgrestRequest, body: bytes) -> HttpCall:
+        """The POST of a JSON-array body to a table endpoint (a call to yield, not a flow)"""
+        # Rows that resolve conflicts (ignore or merge duplicates) can be sent twice safely
+        return HttpCall('POST', request.path, params=request.params, headers=request.headers, body=body,
+                        idempotent='resolution=' in request.headers.get('Prefer', ''))
+
+    def _insert_chunk(self, table: str, chunk: List[Dict[str, Any]], on_conflict: Optional[str],
+                      conflict_columns: Iterable[str]) -> Flow:
+        """POST one batch of bulk_insert rows; raises SupabaseQueryError if it is rejected"""
+        response = yield self._post_rows(chunk_request(table, chunk, on_conflict, conflict_columns),
+                                         encode_rows(chunk))
+        result = interpret_insert_response(response)
+        if not result["success"]:
+            raise SupabaseQueryError(result["error"])
+
+    def _bulk_insert_done(self, table: str, inserted: int, requests_sent: int,
+                          error: Optional[Exception] = None) -> Dict[str, Any]:
+        """Invalidate cached results of a bulk_insert and build its result dict (not a flow)"""
+        if self.result_cache is not None and inserted:
+            self.result_cache.invalidate(self.url, [normalize_table_name(table)])
+        if error is not None:
+            return {"success": False, "error": f"Bulk insert failed after {inserted} rows: {error}"}
+        self.logger.info(f"Inserted {inserted} rows into {table} in {requests_sent} requests")
+        return {"success": True, "data": {"rows": inserted, "requests": requests_sent}}
+
+    # --- SQL RPC -------------------------------------------------------------
+
+    def _execute_rpc_query(self, query: str) -> Flow:
+        """Execute DDL/DML queries using the project's SQL RPC function"""
+        try:
+            rpc = yield from self._rpc_endpoint()
+            if rpc is NO_RPC:
+                return {"success": False, "error": NO_RPC_ERROR}
+            if rpc is not None:
+                # Known endpoint: exactly one request per statement
+                response = yield HttpCall('POST', rpc.path, json=rpc.payload(query), idempotent=is_idempotent(query))
+                with phase('decode'):
+                    result = interpret_rpc_response(query, response)
+                if result is not None:
+                    return (yield from self._rpc_result(query, result))
+                self.logger.warning(f"{rpc.path} no longer exists, probing for another SQL function")
+                self.rpc_cache.forget(self.url)
+            return (yield from self._probe_rpc(query))
+
+        except Exception as e:
+            return {"success": False, "error": f"RPC execution failed: {str(e)}"}
+
+    def _probe_rpc(self, query: str) -> Flow:
+        """Try every endpoint and payload shape, caching the first function that exists"""
+        idempotent = is_idempotent(query)
+        with phase('rpc_probe'):
+            for candidate in RPC_CANDIDATES:
+                response = yield HttpCall('POST', candidate.path, json=candidate.payload(query), idempotent=idempotent)
+                result = interpret_rpc_response(query, response)
+                if result is None:
+                    continue
+                # A gateway error does not prove the function exists
+                if response.status_code not in RETRY_STATUSES:
+                    self.rpc_cache.store(self.url, candidate)
+                break
+            else:
+                self.rpc_cache.store(self.url, NO_RPC)
+                return {"success": False, "error": NO_RPC_ERROR}
+        return (yield from self._rpc_result(query, result))
+
+    def _rpc_result(self, query: str, result: Any) -> Flow:
+        if result is RUN_LOCALLY:
+            return (yield from self._aggregate_query(query))
+        return result
+
+    def _rpc_endpoint(self) -> Flow:
+        """The project's SQL RPC: cached, read from the OpenAPI document, or None to probe"""
+        rpc = self.rpc_cache.get(self.url)
+        if rpc is None and not self._openapi_checked:
+            with phase('rpc_probe'):
+                self._learn_rpc_endpoint((yield HttpCall('GET', '/rest/v1/')))
+            rpc = self.rpc_cache.get(self.url)
+        return rpc
+
+    def _learn_rpc_endpoint(self, response):
+        """Cache the SQL RPC listed in a /rest/v1/ OpenAPI response, unless already known (not a flow)"""
+        if self._openapi_checked or response.status_code != 200 or self.rpc_cache.get(self.url) is not None:
+            return
+        self._openapi_checked = True
+        try:
+            rpc = discover_rpc_endpoint(response.json())
+        except ValueError:
+            rpc = None
+        if rpc is not None:
+            self.rpc_cache.store(self.url, rpc)
+            self.logger.info(f"SQL RPC endpoint: {rpc.path if isinstance(rpc, RpcEndpoint) else 'none found'}")
+
+    # --- Aggregates ----------------------------------------------------------
+
+    def _aggregate_query(self, query: str, page_size: int = DEFAULT_PAGE_SIZE,
+                         key_column: Optional[str] = None) -> Flow:
+        try:
+            plan = plan_aggregate(self._clean_sql_query(query), key_column=key_column)
+            engine = AggregateEngine(plan)
+            if plan.count_only:
+                engine.feed_count((yield from self._count_rows(plan.request)))
+            else:
+                paginator = yield from self._paginator(plan.request, page_size, key_column)
+                batch: List[Dict[str, Any]] = []
+                while not paginator.done:
+                    batch.extend((yield from self._fetch_page(plan.request, paginator)))
+                    if len(batch) >= engine.batch_size:
+                        engine.feed(batch)
+                        batch = []
+                engine.feed(batch)
+            return {"success": True, "data": engine.result()}
+
+        except SupabaseQueryError as e:
+            return {"success": False, "error": str(e)}
+        except UnsupportedQueryError as e:
+            return {"success": False, "error": f"Cannot run aggregate query locally: {e}"}
+        except Exception as e:
+            return {"success": False, "error": f"Aggregate query failed: {str(e)}"}
+
+    def _count_rows(self, request: PostgrestRequest) -> Flow:
+        """Count the rows a table request matches from its Content-Range header, without fetching them"""
+        response = yield HttpCall('HEAD', request.path, params=request.params, headers=request.headers)
+        total = content_range_total(response.headers.get('Content-Range'))
+        if response.status_code not in (200, 206) or total is None:
+            raise SupabaseQueryError(f"Count query failed: HTTP {response.status_code}")
+        return total
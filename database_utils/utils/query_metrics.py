@@ -0,0 +1,160 @@
+"""
+Per-statement metrics: wall time by phase, HTTP requests, bytes and rows.
+
+A QueryMetrics record is made current (through a context variable, so it
+follows threads and asyncio tasks) while a statement runs. The utilities
+report requests and phases into whatever record is current, and hand the
+finished record to their metrics hooks. Nothing is recorded when no hook is
+registered.
+
+Phases: connect (health probe), rpc_probe (finding the SQL function),
+http (other requests), throttle (waiting on the request scheduler: rate
+limit, Retry-After pauses and retry backoff), decode (JSON parsing) and
+local (everything else: parsing, routing, aggregation, result building).
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, IO, Iterator, List, Optional
+
+PHASES = ['connect', 'rpc_probe', 'http', 'throttle', 'decode', 'local']
+
+_current: ContextVar[Optional['QueryMetrics']] = ContextVar('database_utils_query_metrics', default=None)
+
+
+class QueryMetrics:
+    """Timings and traffic of one statement, bulk insert run or transaction chunk"""
+
+    def __init__(self, query: str, query_number: Optional[int] = None, statements: int = 1):
+        self.query = query
+        self.query_number = query_number
+        self.statements = statements
+        self.path: Optional[str] = None  # select, aggregate, insert, rpc, cache, bulk_insert or transaction
+        self.success: Optional[bool] = None
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.wall_time = 0.0
+        self.phases: Dict[str, float] = {}
+        self.requests = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.rows: Optional[int] = None
+        self._phase: Optional[str] = None
+
+    @contextmanager
+    def active(self) -> Iterator['QueryMetrics']:
+        """Make this the current record; time spent inside counts towards wall_time"""
+        token = _current.set(self)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall_time += time.perf_counter() - start
+            _current.reset(token)
+
+    def finish(self, result: Optional[Dict[str, Any]] = None):
+        """Fill in the outcome from a result dict and attribute untracked time to 'local'"""
+        if result is not None:
+            self.success = bool(result.get("success"))
+            self.error = None if self.success else result.get("error")
+            data = result.get("data")
+            if self.rows is None and isinstance(data, list):
+                self.rows = len(data)
+        tracked = sum(seconds for name, seconds in self.phases.items() if name != 'local')
+        self.phases['local'] = max(0.0, self.wall_time - tracked)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form, one object per JSON line"""
+        return {
+            "query_number": self.query_number,
+            "query": self.query,
+            "statements": self.statements,
+            "path": self.path,
+            "success": self.success,
+            "error": self.error,
+            "started_at": self.started_at,
+            "wall_time": round(self.wall_time, 6),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "requests": self.requests,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "rows": self.rows,
+        }
+
+
+def current_metrics() -> Optional[QueryMetrics]:
+    """The record of the statement running in this thread/task, if metrics are collected"""
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Attribute the enclosed time to a phase; nested phases count towards the outermost one"""
+    metrics = _current.get()
+    if metrics is None or metrics._phase is not None:
+        yield
+        return
+    metrics._phase = name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[name] = metrics.phases.get(name, 0.0) + time.perf_counter() - start
+        metrics._phase = None
+
+
+def record_request(bytes_out: int, bytes_in: int):
+    """Count an HTTP request against the current record"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.requests += 1
+        metrics.bytes_out += bytes_out
+        metrics.bytes_in += bytes_in
+
+
+def set_path(path: str):
+    """Record which execution path the current statement took"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.path = path
+
+
+class MetricsCollector:
+    """Metrics hook that keeps every record and optionally appends each one to a JSON lines file"""
+
+    def __init__(self, jsonl: Optional[IO[str]] = None):
+        self.records: List[QueryMetrics] = []
+        self.jsonl = jsonl
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: QueryMetrics):
+        with self._lock:
+            self.records.append(metrics)
+            if self.jsonl is not None:
+                self.jsonl.write(json.dumps(metrics.as_dict(), default=str) + "\n")
+
+    def slowest(self, count: int = 10) -> List[QueryMetrics]:
+        """The records with the highest wall time"""
+        return sorted(self.records, key=lambda metrics: metrics.wall_time, reverse=True)[:count]
+
+    def totals(self) -> Dict[str, Any]:
+        """Sums over all records, with wall time per phase and statement count per path"""
+        phases = {name: 0.0 for name in PHASES}
+        paths: Dict[str, int] = {}
+        for metrics in self.records:
+            for name, seconds in metrics.phases.items():
+                phases[name] = phases.get(name, 0.0) + seconds
+            paths[metrics.path or 'unknown'] = paths.get(metrics.path or 'unknown', 0) + metrics.statements
+        return {
+            "records": len(self.records),
+            "wall_time": sum(metrics.wall_time for metrics in self.records),
+            "requests": sum(metrics.requests for metrics in self.records),
+            "bytes_out": sum(metrics.bytes_out for metrics in self.records),
+            "bytes_in": sum(metrics.bytes_in for metrics in self.records),
+            "rows": sum(metrics.rows or 0 for metrics in self.records),
+            "phases": phases,
+            "paths": paths,
+        }
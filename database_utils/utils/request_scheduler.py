@@ -0,0 +1,207 @@
+"""
+Client-side pacing and retries for the requests of a run.
+
+Every HTTP request a util sends goes through its RequestScheduler:
+
+- an optional token bucket caps the request rate (rate per second, with
+  bursts of up to burst requests);
+- an AIMD limit caps the requests in flight. It grows by one after a full
+  round of successful responses and is cut by decrease_factor on 429 or
+  503, at most once per round, so concurrency settles just below what the
+  server accepts;
+- a Retry-After header pauses every request until it has passed;
+- failed attempts are retried with full-jitter exponential backoff when
+  that is safe: always after 429, which the API gateway sends before
+  anything runs, and after other 5xx responses or a dropped connection
+  only for idempotent requests;
+- an error budget bounds how many requests a run may give up on. Once it
+  is spent, further requests fail at once with ErrorBudgetExhausted
+  instead of pushing the rest of a backfill at a failing server.
+
+The state is guarded by a threading lock, so one scheduler can be shared
+by threads (acquire) and asyncio tasks (acquire_async).
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .query_core import RETRY_STATUSES, SupabaseQueryError
+
+# Statuses that mean the server is overloaded: concurrency is cut
+THROTTLE_STATUSES = (429, 503)
+# Statuses sent before the request ran, so any request may be retried
+REJECTED_STATUSES = (429,)
+# Methods that never apply a statement, so they may be retried after any transient failure
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+DEFAULT_MAX_BACKOFF = 30.0
+# Result error for statements skipped once the error budget is spent
+BUDGET_EXHAUSTED_ERROR = "Not executed: the run's error budget is exhausted"
+# How often asyncio waiters check for a free slot
+_SLOT_POLL = 0.005
+
+
+class ErrorBudgetExhausted(SupabaseQueryError):
+    """More requests failed in this run than its error budget allows"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delay in seconds or an HTTP date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from datetime import timezone
+    from email.utils import parsedate_to_datetime
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RequestScheduler:
+    """Token bucket, AIMD concurrency limit, retry policy and error budget for one run
+
+    acquire() blocks until a request may be sent and returns a ticket; pass it
+    to release() with the response status, then ask next_retry() whether and
+    when to try again. max_concurrency is where the limit starts and the most
+    it grows to. Retry-After pauses are capped at max_backoff seconds.
+    """
+
+    def __init__(self, max_concurrency: int = 10, min_concurrency: int = 1,
+                 rate: Optional[float] = None, burst: Optional[float] = None,
+                 max_retries: int = 3, backoff_factor: float = 0.5, max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 decrease_factor: float = 0.5, error_budget: Optional[int] = None):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 0.0)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.decrease_factor = decrease_factor
+        # Requests a run may give up on; None for no limit
+        self.error_budget = error_budget
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        """Start a new run: full concurrency and bucket, unspent error budget, zeroed counters"""
+        with self._lock:
+            self.limit = float(self.max_concurrency)
+            self._tokens = float(self.burst)
+            self._refilled_at = time.monotonic()
+            self._paused_until = 0.0
+            self._decreased_at = 0.0
+            self.requests = 0
+            self.retries = 0
+            self.throttled = 0
+            self.failures = 0
+
+    @property
+    def budget_exhausted(self) -> bool:
+        return self.error_budget is not None and self.failures > self.error_budget
+
+    def acquire(self) -> float:
+        """Block until a request may be sent; returns the ticket for release()"""
+        with self._slot_freed:
+            while True:
+                now = time.monotonic()
+                wait = self._try_acquire(now)
+                if wait == 0:
+                    return now
+                self._slot_freed.wait(wait)
+
+    async def acquire_async(self) -> float:
+        """acquire() for asyncio tasks, sleeping instead of blocking the event loop"""
+        import asyncio
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._try_acquire(now)
+            if wait == 0:
+                return now
+            await asyncio.sleep(_SLOT_POLL if wait is None else wait)
+
+    def _try_acquire(self, now: float) -> Optional[float]:
+        """Take a slot and a token and return 0, or the seconds to wait (None: until a slot frees up)"""
+        if self.budget_exhausted:
+            raise ErrorBudgetExhausted(f"Error budget exhausted: {self.failures} requests failed "
+                                       f"(budget {self.error_budget}), not sending more")
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+        self.in_flight += 1
+        self.requests += 1
+        return 0.0
+
+    def release(self, ticket: float, status: Optional[int] = None, retry_after: Optional[float] = None):
+        """Free the slot of an attempt and adapt to its outcome (status None: the connection failed)"""
+        with self._slot_freed:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                # Requests sent before the last cut saw the old limit; cut once per round
+                if ticket >= self._decreased_at:
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    self._decreased_at = now
+            elif status is not None and status < 500:
+                # Additive increase: about one more slot per limit successful responses
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + min(retry_after, self.max_backoff))
+            self._slot_freed.notify_all()
+
+    def next_retry(self, attempt: int, status: Optional[int], idempotent: bool) -> Optional[float]:
+        """Seconds to back off before retrying attempt (0-based), or None to give up
+
+        status None means the connection failed. Giving up on a transient
+        failure spends the error budget; other statuses are returned as is.
+        """
+        if status is not None and status not in RETRY_STATUSES:
+            return None
+        with self._lock:
+            if attempt < self.max_retries and (idempotent or status in REJECTED_STATUSES) and not self.budget_exhausted:
+                self.retries += 1
+                if status in THROTTLE_STATUSES:
+                    # The limit was just cut and acquire() paces the retry; back off only if throttled again
+                    if attempt == 0:
+                        return 0.0
+                    attempt -= 1
+                return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+            self.failures += 1
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters of the current run and where the concurrency limit stands"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+                "concurrency_limit": int(self.limit),
+                "error_budget": self.error_budget,
+            }
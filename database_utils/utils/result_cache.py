@@ -0,0 +1,329 @@
+"""
+Result cache for read-only SQL.
+
+Results of SELECTs served from table endpoints are cached under the project
+URL and the normalized SQL text, first in an in-memory LRU and then in a
+SQLite file shared by every run on the machine. Entries expire after a TTL,
+both tiers are bounded in size, and statements that modify a table through
+the same utility drop every cached result that read from it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from .rpc_discovery import cache_dir
+
+DEFAULT_RESULT_TTL = 300.0
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024
+# Results larger than this are streamed through without being cached
+DEFAULT_MAX_ENTRY_BYTES = 16 * 1024 * 1024
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    size INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS result_tables (
+    key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    table_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_tables_by_table ON result_tables (url, table_name);
+CREATE INDEX IF NOT EXISTS result_tables_by_key ON result_tables (key);
+"""
+
+
+def default_result_cache_path() -> str:
+    """query_results.sqlite in the cache directory"""
+    return os.path.join(cache_dir(), 'query_results.sqlite')
+
+
+def normalize_sql(query: str) -> str:
+    """Lowercase and collapse whitespace outside quoted strings, and drop a trailing semicolon
+
+    Unquoted keywords and identifiers are case-insensitive in PostgreSQL, so
+    "SELECT * FROM Puzzles" and "select *  from puzzles" share a cache entry.
+    """
+    parts = _QUOTED.split(query.strip().rstrip(';').strip())
+    # Odd parts are the quoted strings and identifiers, kept verbatim
+    return ''.join(part if i % 2 else ' '.join(part.lower().split()) for i, part in enumerate(parts))
+
+
+def _copy(data: Any) -> Any:
+    """Copy row lists so callers cannot change what is cached"""
+    if isinstance(data, list):
+        return [dict(row) if isinstance(row, dict) else row for row in data]
+    return data
+
+
+class ResultCache:
+    """Two-tier (memory LRU + SQLite) cache of read-only query results
+
+    Thread-safe. Disk errors are logged and turn the disk tier off; pass
+    path=None to keep everything in memory.
+    """
+
+    def __init__(self, path: Optional[str] = '', ttl: float = DEFAULT_RESULT_TTL,
+                 max_entries: int = DEFAULT_MEMORY_ENTRIES, max_memory_bytes: int = DEFAULT_MEMORY_BYTES,
+                 max_disk_bytes: int = DEFAULT_DISK_BYTES, max_entry_bytes: int = DEFAULT_MAX_ENTRY_BYTES):
+        self.path = default_result_cache_path() if path == '' else path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_entry_bytes = max_entry_bytes
+        # key -> (expires_at, url, tables, size, data)
+        self._memory: "OrderedDict[str, Tuple[float, str, frozenset, int, Any]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_failed = False
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0,
+                       "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def key(self, url: str, query: str) -> str:
+        """Cache key of a query against a project"""
+        return hashlib.sha256(f"{url}\0{normalize_sql(query)}".encode('utf-8')).hexdigest()
+
+    def get(self, url: str, query: str) -> Tuple[bool, Any]:
+        """(True, data) for a fresh cached result, (False, None) otherwise"""
+        key = self.key(url, query)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return True, _copy(entry[4])
+                self._drop_memory(key)
+
+            row = self._disk_get(key, now)
+            if row is not None:
+                expires_at, payload, tables = row
+                data = json.loads(payload)
+                self._remember(key, expires_at, url, tables, len(payload), data)
+                self._stats["hits"] += 1
+                self._stats["disk_hits"] += 1
+                return True, _copy(data)
+
+            self._stats["misses"] += 1
+            return False, None
+
+    def contains(self, url: str, query: str) -> bool:
+        """True if a fresh result is cached; unlike get, this is not counted as a hit or miss"""
+        key = self.key(url, query)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                return True
+            db = self._connect()
+            if db is None:
+                return False
+            row = self._disk(lambda: db.execute("SELECT expires_at FROM results WHERE key = ?", (key,)).fetchone())
+            return row is not None and row[0] > now
+
+    def put(self, url: str, query: str, tables: Iterable[str], data: Any, ttl: Optional[float] = None):
+        """Cache a result that was read from the given tables"""
+        try:
+            payload = json.dumps(data, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return
+        if len(payload) > self.max_entry_bytes:
+            return
+        key = self.key(url, query)
+        tables = frozenset(tables)
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, expires_at, url, tables, len(payload), _copy(data))
+            self._disk_put(key, url, tables, expires_at, payload)
+            self._stats["stores"] += 1
+
+    def tee(self, url: str, query: str, tables: Iterable[str], rows: Iterable[Any]) -> Iterator[Any]:
+        """Yield rows unchanged and cache them once the iterator is exhausted
+
+        Results that grow past max_entry_bytes are passed through without being kept.
+        """
+        collected = []
+        size = 0
+        for row in rows:
+            if collected is not None:
+                collected.append(row)
+                size += len(str(row))
+                if size > self.max_entry_bytes:
+                    collected = None
+            yield row
+        if collected is not None:
+            self.put(url, query, tables, collected)
+
+    def invalidate(self, url: str, tables: Optional[Iterable[str]] = None) -> int:
+        """Drop the project's results that read from any of the tables (all of them if tables is None)"""
+        tables = None if tables is None else frozenset(tables)
+        if tables is not None and not tables:
+            return 0
+        with self._lock:
+            keys = [key for key, entry in self._memory.items()
+                    if entry[1] == url and (tables is None or entry[2] & tables)]
+            for key in keys:
+                self._drop_memory(key)
+            dropped = max(len(keys), self._disk_invalidate(url, tables))
+            self._stats["invalidations"] += dropped
+            return dropped
+
+    def clear(self):
+        """Empty both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            db = self._connect()
+            if db is not None:
+                self._disk(lambda: db.executescript("DELETE FROM results; DELETE FROM result_tables;"))
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process, plus the hit rate and memory tier size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, expires_at: float, url: str, tables: frozenset, size: int, data: Any):
+        self._drop_memory(key)
+        self._memory[key] = (expires_at, url, tables, size, data)
+        self._memory_bytes += size
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_memory_bytes):
+            oldest = next(iter(self._memory))
+            self._drop_memory(oldest)
+            self._stats["evictions"] += 1
+
+    def _drop_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[3]
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is not None or self._disk_failed or not self.path:
+            return self._db
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            self._db = db
+        except (sqlite3.Error, OSError) as e:
+            logger.debug(f"Result cache disk tier disabled ({self.path}): {e}")
+            self._disk_failed = True
+        return self._db
+
+    def _disk(self, operation):
+        """Run a disk operation, turning the disk tier off if it fails"""
+        try:
+            return operation()
+        except sqlite3.Error as e:
+            logger.debug(f"Result cache disk tier disabled ({self.path}): {e}")
+            self._disk_failed = True
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            return None
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str, frozenset]]:
+        db = self._connect()
+        if db is None:
+            return None
+
+        def read():
+            row = db.execute("SELECT expires_at, payload FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] <= now:
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                db.execute("DELETE FROM result_tables WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            tables = frozenset(name for (name,) in db.execute(
+                "SELECT table_name FROM result_tables WHERE key = ?", (key,)))
+            return row[0], row[1], tables
+
+        return self._disk(read)
+
+    def _disk_put(self, key: str, url: str, tables: frozenset, expires_at: float, payload: str):
+        db = self._connect()
+        if db is None:
+            return
+
+        def write():
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute("INSERT OR REPLACE INTO results (key, url, expires_at, last_used, size, payload) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", (key, url, expires_at, time.time(), len(payload), payload))
+                db.execute("DELETE FROM result_tables WHERE key = ?", (key,))
+                db.executemany("INSERT INTO result_tables (key, url, table_name) VALUES (?, ?, ?)",
+                               [(key, url, table) for table in tables])
+                self._disk_evict(db)
+
+        self._disk(write)
+
+    def _disk_evict(self, db: sqlite3.Connection):
+        """Remove expired entries, then least recently used ones until the file fits max_disk_bytes"""
+        db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total > self.max_disk_bytes:
+            for key, size in db.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+                if total <= self.max_disk_bytes:
+                    break
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                self._stats["evictions"] += 1
+        db.execute("DELETE FROM result_tables WHERE key NOT IN (SELECT key FROM results)")
+
+    def _disk_invalidate(self, url: str, tables: Optional[frozenset]) -> int:
+        db = self._connect()
+        if db is None:
+            return 0
+
+        def delete():
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                if tables is None:
+                    cursor = db.execute("DELETE FROM results WHERE url = ?", (url,))
+                    db.execute("DELETE FROM result_tables WHERE url = ?", (url,))
+                    return cursor.rowcount
+                marks = ", ".join("?" for _ in tables)
+                keys = [key for (key,) in db.execute(
+                    f"SELECT DISTINCT key FROM result_tables WHERE url = ? AND table_name IN ({marks})",
+                    (url, *tables))]
+                for key in keys:
+                    db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    db.execute("DELETE FROM result_tables WHERE key = ?", (key,))
+                return len(keys)
+
+        return self._disk(delete) or 0
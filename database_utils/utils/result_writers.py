@@ -0,0 +1,242 @@
+"""
+Result writers: an aligned text table and machine-readable formats.
+
+Rows are written as they arrive. The table writer sizes its columns from a
+sampled prefix of each result rather than the whole result, and every
+writer collects its output and writes it to the stream in large chunks.
+Machine-readable writers (csv, jsonl/ndjson, arrow) only write dict rows;
+status messages and statements without rows are left to the caller.
+"""
+
+import csv
+import itertools
+import json
+from typing import IO, Any, Dict, Iterable, List, Optional
+
+from .query_core import iter_chunks
+
+FORMATS = ['table', 'csv', 'jsonl', 'ndjson', 'arrow']
+
+DEFAULT_SAMPLE_SIZE = 200
+DEFAULT_MAX_WIDTH = 40
+DEFAULT_ARROW_BATCH_SIZE = 10000
+# Output is written once this many characters have been collected
+BUFFER_SIZE = 1 << 16
+
+
+class OutputError(Exception):
+    """Rows cannot be written in the requested format"""
+
+
+class ResultWriter:
+    """Writes result sets: begin_result(), write_rows(), end_result() for each, then close()"""
+
+    machine_readable = True
+
+    def __init__(self, stream: IO):
+        self.stream = stream
+        self._buffer: List[str] = []
+        self._buffered = 0
+
+    def begin_result(self, query_number: Optional[int], query: str):
+        """Start the rows of one statement"""
+
+    def write_rows(self, rows: Iterable[Any]) -> int:
+        """Write rows as they arrive and return how many were written"""
+        raise NotImplementedError
+
+    def end_result(self):
+        """Finish a statement's rows; anything buffered is written out"""
+        self.flush()
+
+    def close(self):
+        self.flush()
+
+    def write(self, text: str):
+        """Buffer text, writing it out in chunks of about BUFFER_SIZE characters"""
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.stream.write(''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        self.stream.flush()
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, default=str)
+    text = str(value)
+    if '\n' in text or '\t' in text or '\r' in text:
+        text = text.replace('\r', '\\r').replace('\n', '\\n').replace('\t', '\\t')
+    return text
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class TableWriter(ResultWriter):
+    """Aligned text table; column widths come from the first sample_size rows
+
+    Text wider than max_width, or than every sampled value, is cut with '…';
+    numbers are never cut.
+    Numeric columns are right-aligned. Rows that are not dicts are printed as is.
+    """
+
+    machine_readable = False
+
+    def __init__(self, stream: IO, sample_size: int = DEFAULT_SAMPLE_SIZE, max_width: int = DEFAULT_MAX_WIDTH):
+        super().__init__(stream)
+        self.sample_size = sample_size
+        self.max_width = max_width
+
+    def write_rows(self, rows: Iterable[Any]) -> int:
+        rows = iter(rows)
+        sample = list(itertools.islice(rows, self.sample_size))
+        if not sample:
+            return 0
+
+        columns: List[str] = []
+        seen = set()
+        for row in sample:
+            if isinstance(row, dict):
+                for column in row:
+                    if column not in seen:
+                        seen.add(column)
+                        columns.append(column)
+        widths = []
+        right_aligned = []
+        for column in columns:
+            values = [row.get(column) for row in sample if isinstance(row, dict)]
+            width = max([len(column)] + [len(_cell(value)) for value in values])
+            widths.append(min(width, self.max_width))
+            present = [value for value in values if value is not None]
+            right_aligned.append(bool(present) and all(_is_number(value) for value in present))
+
+        if columns:
+            header = " | ".join(column[:width].ljust(width) for column, width in zip(columns, widths))
+            self.write(header + "\n" + "-" * len(header) + "\n")
+
+        count = 0
+        for row in itertools.chain(sample, rows):
+            if isinstance(row, dict) and columns:
+                cells = []
+                for column, width, right in zip(columns, widths, right_aligned):
+                    text = _cell(row.get(column))
+                    if len(text) > width and not _is_number(row.get(column)):
+                        text = text[:width - 1] + '…'
+                    cells.append(text.rjust(width) if right else text.ljust(width))
+                self.write(" | ".join(cells) + "\n")
+            else:
+                self.write(f"{row}\n")
+            count += 1
+        return count
+
+
+class CsvWriter(ResultWriter):
+    """CSV with a header row, repeated whenever a result has different columns"""
+
+    def __init__(self, stream: IO):
+        super().__init__(stream)
+        self._csv = csv.writer(self)
+        self._columns: Optional[List[str]] = None
+
+    def write_rows(self, rows: Iterable[Any]) -> int:
+        count = 0
+        for row in rows:
+            if not isinstance(row, dict):
+                continue
+            if self._columns is None or list(row) != self._columns:
+                if self._columns is None or set(row) != set(self._columns):
+                    self._csv.writerow(list(row))
+                    self._columns = list(row)
+            self._csv.writerow(['' if row.get(column) is None else _csv_value(row.get(column))
+                                for column in self._columns])
+            count += 1
+        return count
+
+
+def _csv_value(value: Any) -> Any:
+    return json.dumps(value, default=str) if isinstance(value, (dict, list)) else value
+
+
+class JsonLinesWriter(ResultWriter):
+    """One JSON object per row (JSON Lines / NDJSON)"""
+
+    def write_rows(self, rows: Iterable[Any]) -> int:
+        count = 0
+        for row in rows:
+            if isinstance(row, dict):
+                self.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+
+class ArrowWriter(ResultWriter):
+    """Arrow IPC stream, written in record batches; needs the optional pyarrow package
+
+    An IPC stream holds a single schema, taken from the first batch, so every
+    result written must have the same columns.
+    """
+
+    def __init__(self, stream: IO[bytes], batch_size: int = DEFAULT_ARROW_BATCH_SIZE):
+        super().__init__(stream)
+        try:
+            import pyarrow
+            import pyarrow.ipc
+        except ImportError:
+            raise OutputError("Arrow output needs pyarrow: pip install pyarrow") from None
+        self._pa = pyarrow
+        self.batch_size = batch_size
+        self._writer = None
+        self._schema = None
+
+    def write_rows(self, rows: Iterable[Any]) -> int:
+        count = 0
+        for batch in iter_chunks((row for row in rows if isinstance(row, dict)), self.batch_size):
+            if self._schema is not None and set(batch[0]) != set(self._schema.names):
+                raise OutputError("Arrow output holds one table, but results have different columns")
+            table = self._pa.Table.from_pylist(batch, schema=self._schema)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = self._pa.ipc.new_stream(self.stream, self._schema)
+            self._writer.write_table(table)
+            count += len(batch)
+        return count
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.stream.flush()
+
+
+def create_writer(fmt: str, stream: IO, **options: Any) -> ResultWriter:
+    """A writer for one of FORMATS; arrow needs a binary stream, the others a text stream"""
+    writers: Dict[str, Any] = {
+        'table': TableWriter,
+        'csv': CsvWriter,
+        'jsonl': JsonLinesWriter,
+        'ndjson': JsonLinesWriter,
+        'arrow': ArrowWriter,
+    }
+    if fmt not in writers:
+        raise OutputError(f"Unknown output format {fmt!r}; choose one of {', '.join(FORMATS)}")
+    return writers[fmt](stream, **options)
+
+
+def open_output(path: Optional[str], fmt: str, stdout: IO) -> IO:
+    """The stream a format writes to: the file at path, or stdout (its binary buffer for arrow)"""
+    binary = fmt == 'arrow'
+    if path is None or path == '-':
+        return stdout.buffer if binary else stdout
+    if binary:
+        return open(path, 'wb')
+    return open(path, 'w', encoding='utf-8', newline='' if fmt == 'csv' else None)
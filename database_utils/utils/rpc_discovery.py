@@ -0,0 +1,222 @@
+"""
+Discovery and caching of the SQL execution RPC (exec_sql / execute_sql).
+
+The PostgREST OpenAPI document served at /rest/v1/ lists every exposed
+function with its parameter names, so the endpoint and payload shape can
+be read from the health probe instead of being brute-forced per statement.
+Results are cached per project URL in memory and in a small JSON file
+with a TTL; "no RPC available" is cached too, for a shorter time.
+
+The same document marks primary key columns, which give offset
+pagination a stable order, and foreign keys, which keep statements on
+linked tables out of the same concurrent batch.
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Union
+
+RPC_ENDPOINTS = ["/rest/v1/rpc/exec_sql", "/rest/v1/rpc/execute_sql"]
+RPC_PAYLOAD_KEYS = ["sql", "query"]
+
+# A working endpoint rarely changes; a missing one may be created at any moment
+DEFAULT_TTL = 24 * 3600.0
+DEFAULT_NEGATIVE_TTL = 300.0
+
+_FOREIGN_KEY = re.compile(r"<fk table='([^']+)'")
+
+logger = logging.getLogger(__name__)
+
+
+class RpcEndpoint(NamedTuple):
+    """A SQL execution function and the name of its SQL text argument"""
+    path: str
+    payload_key: str
+
+    def payload(self, query: str) -> Dict[str, str]:
+        return {self.payload_key: query}
+
+
+# Every endpoint/payload combination, in the order they are tried when discovery is not possible
+RPC_CANDIDATES = [RpcEndpoint(path, key) for path in RPC_ENDPOINTS for key in RPC_PAYLOAD_KEYS]
+
+
+class _NoRpc:
+    def __repr__(self):
+        return 'NO_RPC'
+
+
+# Cached when the project is known not to expose any SQL execution function
+NO_RPC = _NoRpc()
+NO_RPC_ERROR = "RPC execution failed: no exec_sql/execute_sql function is exposed by this project"
+
+
+def discover_rpc_endpoint(openapi: Any) -> Union[RpcEndpoint, _NoRpc, None]:
+    """Find the SQL RPC in a PostgREST OpenAPI (Swagger 2.0) document
+
+    Returns the endpoint, NO_RPC if the document lists no usable function, or
+    None if the document has no paths to inspect (e.g. the OpenAPI output is disabled).
+    """
+    paths = openapi.get('paths') if isinstance(openapi, dict) else None
+    if not isinstance(paths, dict):
+        return None
+    for endpoint in RPC_ENDPOINTS:
+        operation = paths.get(endpoint[len('/rest/v1'):], {}).get('post')
+        if not isinstance(operation, dict):
+            continue
+        names = _argument_names(operation)
+        for key in RPC_PAYLOAD_KEYS:
+            if key in names:
+                return RpcEndpoint(endpoint, key)
+    return NO_RPC
+
+
+def discover_primary_keys(openapi: Any) -> Dict[str, List[str]]:
+    """Primary key columns per table from a PostgREST OpenAPI document (empty if it lists no definitions)"""
+    definitions = openapi.get('definitions') if isinstance(openapi, dict) else None
+    if not isinstance(definitions, dict):
+        return {}
+    keys = {}
+    for table, definition in definitions.items():
+        properties = definition.get('properties') if isinstance(definition, dict) else None
+        if not isinstance(properties, dict):
+            continue
+        # PostgREST tags primary key columns with <pk/> in their description
+        columns = [column for column, schema in properties.items()
+                   if isinstance(schema, dict) and '<pk/>' in (schema.get('description') or '')]
+        if columns:
+            keys[table] = columns
+    return keys
+
+
+def discover_tables(openapi: Any) -> Optional[Set[str]]:
+    """Names of the tables and views a PostgREST OpenAPI document lists (None if it lists no definitions)"""
+    definitions = openapi.get('definitions') if isinstance(openapi, dict) else None
+    return set(definitions) if isinstance(definitions, dict) else None
+
+
+def discover_foreign_keys(openapi: Any) -> Optional[Dict[str, Set[str]]]:
+    """Tables each table references, from a PostgREST OpenAPI document (None if it lists no definitions)"""
+    definitions = openapi.get('definitions') if isinstance(openapi, dict) else None
+    if not isinstance(definitions, dict):
+        return None
+    references = {}
+    for table, definition in definitions.items():
+        properties = definition.get('properties') if isinstance(definition, dict) else None
+        # PostgREST tags foreign key columns with <fk table='...' column='...'/> in their description
+        references[table] = {match for schema in (properties or {}).values() if isinstance(schema, dict)
+                             for match in _FOREIGN_KEY.findall(schema.get('description') or '')}
+    return references
+
+
+def _argument_names(operation: Dict[str, Any]) -> List[str]:
+    """Argument names of an RPC from its body parameter schema"""
+    names = []
+    for parameter in operation.get('parameters', []):
+        if isinstance(parameter, dict) and parameter.get('in') == 'body':
+            names.extend((parameter.get('schema') or {}).get('properties', {}))
+    return names
+
+
+def cache_dir() -> str:
+    """~/.cache/database_utils, honoring DB_UTILS_CACHE_DIR and XDG_CACHE_HOME"""
+    return os.getenv('DB_UTILS_CACHE_DIR') or os.path.join(
+        os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'database_utils')
+
+
+def default_cache_path() -> str:
+    """rpc_endpoints.json in the cache directory"""
+    return os.path.join(cache_dir(), 'rpc_endpoints.json')
+
+
+def write_json_atomic(path: str, data: Any):
+    """Write JSON to a temporary file and rename it, so concurrent runs never see half a file"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class RpcEndpointCache:
+    """Per-project cache of the SQL RPC, held in memory and persisted to a JSON file
+
+    Disk errors are logged and otherwise ignored; the cache is an optimization only.
+    Pass path=None to keep it in memory.
+    """
+
+    def __init__(self, path: Optional[str] = '', ttl: float = DEFAULT_TTL,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL):
+        self.path = default_cache_path() if path == '' else path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Union[RpcEndpoint, _NoRpc, None]:
+        """The cached endpoint, NO_RPC, or None if nothing fresh is cached"""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            ttl = self.ttl if entry.get('path') else self.negative_ttl
+            if time.time() - entry.get('checked_at', 0) > ttl:
+                return None
+            if not entry.get('path'):
+                return NO_RPC
+            return RpcEndpoint(entry['path'], entry['payload_key'])
+
+    def store(self, url: str, rpc: Union[RpcEndpoint, _NoRpc]):
+        """Remember the endpoint (or NO_RPC) for a project"""
+        entry = {'checked_at': time.time()}
+        if isinstance(rpc, RpcEndpoint):
+            entry.update(path=rpc.path, payload_key=rpc.payload_key)
+        with self._lock:
+            self._load()
+            self._entries[url] = entry
+            self._save()
+
+    def forget(self, url: str):
+        """Drop a project's entry, e.g. after its cached function returned 404"""
+        with self._lock:
+            self._load()
+            if self._entries.pop(url, None) is not None:
+                self._save()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+            if isinstance(entries, dict):
+                self._entries.update(entries)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Ignoring unreadable RPC cache {self.path}: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            write_json_atomic(self.path, self._entries)
+        except OSError as e:
+            logger.debug(f"Could not write RPC cache {self.path}: {e}")
+
+
+# Shared by every utility instance in the process
+rpc_endpoint_cache = RpcEndpointCache()
@@ -0,0 +1,993 @@
+"""
+Local execution of aggregate SELECTs over columnar batches of table rows.
+
+PostgREST cannot aggregate, so queries using COUNT/SUM/AVG/MIN/MAX,
+GROUP BY, HAVING or DISTINCT are planned here instead: every WHERE
+condition that translates is pushed down as a filter, only the referenced
+columns are fetched, and each batch of rows is converted to columns and
+folded into per-group partial aggregates. Memory grows with the number of
+groups rather than the number of rows, and a bare COUNT(*) is answered
+from the Content-Range header without fetching rows at all.
+
+Numeric reductions run on NumPy arrays when NumPy is installed and on
+plain lists otherwise; both give the same results.
+"""
+
+import itertools
+import math
+import operator
+import re
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .postgrest_query import (
+    Group, PostgrestRequest, cast_value, column_resolver, constant_value, filter_node,
+    filter_params, quote_name, table_path
+)
+from .sql_select import (
+    AGGREGATE_FUNCTIONS, Between, BinaryOp, Case, Cast, Column, FuncCall, InList, IsTest,
+    Like, Literal, OrderItem, SelectItem, SelectStatement, Star, UnaryOp,
+    UnsupportedQueryError, column_names, contains_aggregate, is_aggregate_query, parse_select,
+    walk
+)
+
+# Rows folded into the aggregates at a time
+BATCH_SIZE = 10000
+
+# Below this many values converting to a NumPy array costs more than it saves
+_NUMPY_MIN_VALUES = 512
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """The numpy module if it is installed, else None (imported on first use)"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# --- Columnar batches -------------------------------------------------------
+
+class ColumnBatch:
+    """A batch of rows stored column by column"""
+
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, columns: Dict[str, list], length: int):
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], names: Iterable[str]) -> 'ColumnBatch':
+        columns = {}
+        for name in names:
+            try:
+                columns[name] = list(map(operator.itemgetter(name), rows))
+            except KeyError:
+                columns[name] = [row.get(name) for row in rows]
+        return cls(columns, len(rows))
+
+    def take(self, indices: List[int]) -> 'ColumnBatch':
+        """The rows at the given positions, in that order"""
+        return ColumnBatch({name: [values[i] for i in indices] for name, values in self.columns.items()},
+                           len(indices))
+
+
+# --- Expression compilation -------------------------------------------------
+
+class _Constant:
+    """A compiled expression with the same value on every row"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __call__(self, batch: ColumnBatch) -> list:
+        return [self.value] * batch.length
+
+
+Vector = Callable[[ColumnBatch], list]
+
+_TIMESTAMP_FRACTION = re.compile(r'\.(\d+)')
+
+
+def parse_timestamp(text: str) -> datetime:
+    """Parse a PostgREST timestamp ('2024-01-01T10:00:00.12+00:00', '...Z') into an aware datetime"""
+    text = text.replace(' ', 'T', 1).replace('Z', '+00:00')
+    # fromisoformat before Python 3.11 only accepts 3 or 6 fractional digits
+    text = _TIMESTAMP_FRACTION.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), text, count=1)
+    value = datetime.fromisoformat(text)
+    # timestamp without time zone values are taken to be UTC, the Supabase default
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _temporal(value: Any, like: Any) -> Any:
+    """Convert a timestamp/date string so it can be compared with or added to `like`"""
+    if not isinstance(value, str):
+        return value
+    if isinstance(like, datetime) or isinstance(like, timedelta):
+        return parse_timestamp(value)
+    if isinstance(like, date):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _arithmetic(fn: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    def apply(a, b):
+        try:
+            return fn(a, b)
+        except TypeError:
+            # Timestamps arrive as strings: created_at + INTERVAL '1 day'
+            return fn(_temporal(a, b), _temporal(b, a))
+    return apply
+
+
+def _divide(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        # Integer division truncates toward zero in PostgreSQL
+        quotient = abs(a) // abs(b)
+        return quotient if (a >= 0) == (b >= 0) else -quotient
+    return a / b
+
+
+def _modulo(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return a - b * _divide(a, b)
+    return math.fmod(a, b)
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+_ARITHMETIC = {
+    '+': _arithmetic(operator.add),
+    '-': _arithmetic(operator.sub),
+    '*': operator.mul,
+    '/': _divide,
+    '%': _modulo,
+    '||': lambda a, b: _text(a) + _text(b),
+}
+
+_COMPARISONS = {
+    '=': operator.eq, '<>': operator.ne, '<': operator.lt,
+    '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+
+def _and3(a, b):
+    if a is False or b is False:
+        return False
+    if a is None or b is None:
+        return None
+    return True
+
+
+def _or3(a, b):
+    if a is True or b is True:
+        return True
+    if a is None or b is None:
+        return None
+    return False
+
+
+def _elementwise(fn: Callable[[Any, Any], Any], left: Vector, right: Vector) -> Vector:
+    """Apply a NULL-propagating binary function row by row"""
+    if isinstance(left, _Constant) and isinstance(right, _Constant):
+        return _Constant(None if left.value is None or right.value is None else fn(left.value, right.value))
+    if isinstance(right, _Constant):
+        value = right.value
+        if value is None:
+            return _Constant(None)
+        return lambda batch: [None if a is None else fn(a, value) for a in left(batch)]
+    if isinstance(left, _Constant):
+        value = left.value
+        if value is None:
+            return _Constant(None)
+        return lambda batch: [None if b is None else fn(value, b) for b in right(batch)]
+    return lambda batch: [None if a is None or b is None else fn(a, b)
+                          for a, b in zip(left(batch), right(batch))]
+
+
+def _coerced(vector: Vector, like: Any) -> Vector:
+    """Parse a column of timestamp/date strings when it is compared with a temporal constant"""
+    if isinstance(like, (date, datetime)):
+        return lambda batch: [_temporal(value, like) for value in vector(batch)]
+    return vector
+
+
+def _like_regex(pattern: str, case_insensitive: bool):
+    parts = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.S | (re.I if case_insensitive else 0))
+
+
+def _round(value, digits=0):
+    if isinstance(value, int) and digits >= 0:
+        return value
+    # PostgreSQL rounds halves away from zero
+    rounded = Decimal(str(value)).quantize(Decimal(1).scaleb(-int(digits)), rounding=ROUND_HALF_UP)
+    return int(rounded) if digits <= 0 else float(rounded)
+
+
+def _date_trunc(unit: str, value):
+    value = _temporal(value, datetime.min)
+    unit = unit.lower()
+    if unit == 'week':
+        value = value - timedelta(days=value.weekday())
+        unit = 'day'
+    fields = ['year', 'month', 'day', 'hour', 'minute', 'second']
+    if unit not in fields:
+        raise UnsupportedQueryError(f"Unsupported date_trunc unit {unit!r}")
+    reset = {'month': 1, 'day': 1, 'hour': 0, 'minute': 0, 'second': 0, 'microsecond': 0}
+    keep = fields[:fields.index(unit) + 1]
+    return value.replace(**{field: v for field, v in reset.items() if field not in keep}).isoformat()
+
+
+def _to_date(value):
+    if isinstance(value, str):
+        if len(value) <= 10:
+            return value
+        value = parse_timestamp(value)
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).date().isoformat()
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _greatest(*values):
+    present = [value for value in values if value is not None]
+    return max(present) if present else None
+
+
+def _least(*values):
+    present = [value for value in values if value is not None]
+    return min(present) if present else None
+
+
+# name: (function, strict) where strict functions return NULL if any argument is NULL
+_SCALAR_FUNCTIONS = {
+    'abs': (abs, True),
+    'round': (_round, True),
+    'floor': (math.floor, True),
+    'ceil': (math.ceil, True),
+    'ceiling': (math.ceil, True),
+    'lower': (lambda value: str(value).lower(), True),
+    'upper': (lambda value: str(value).upper(), True),
+    'length': (lambda value: len(str(value)), True),
+    'char_length': (lambda value: len(str(value)), True),
+    'date_trunc': (_date_trunc, True),
+    'coalesce': (lambda *values: next((value for value in values if value is not None), None), False),
+    'nullif': (lambda a, b: None if a is not None and a == b else a, False),
+    'greatest': (_greatest, False),
+    'least': (_least, False),
+}
+
+
+def compile_expression(expr, now: datetime, slots: Optional[Dict[str, str]] = None) -> Vector:
+    """Compile an expression into a function from a ColumnBatch to a list of row values
+
+    With slots (after aggregation), sub-expressions listed there read the
+    precomputed group column of that name and other column references are errors.
+    """
+    if slots is not None and repr(expr) in slots:
+        slot = slots[repr(expr)]
+        return lambda batch: batch.columns[slot]
+
+    if isinstance(expr, FuncCall) and expr.name in AGGREGATE_FUNCTIONS:
+        raise UnsupportedQueryError("Aggregate functions cannot be nested or used in WHERE/GROUP BY")
+    if isinstance(expr, Literal):
+        return _Constant(expr.value)
+    if not isinstance(expr, Column):
+        try:
+            return _Constant(constant_value(expr, now))
+        except UnsupportedQueryError:
+            pass
+
+    if isinstance(expr, Column):
+        if slots is not None:
+            raise UnsupportedQueryError(
+                f'Column "{expr.name}" must appear in the GROUP BY clause or be used in an aggregate function')
+        name = expr.name
+        return lambda batch: batch.columns[name]
+
+    if isinstance(expr, BinaryOp):
+        left = compile_expression(expr.left, now, slots)
+        right = compile_expression(expr.right, now, slots)
+        if expr.op in ('AND', 'OR'):
+            combine = _and3 if expr.op == 'AND' else _or3
+            return lambda batch: [combine(a, b) for a, b in zip(left(batch), right(batch))]
+        if expr.op in _COMPARISONS:
+            if isinstance(right, _Constant):
+                left = _coerced(left, right.value)
+            elif isinstance(left, _Constant):
+                right = _coerced(right, left.value)
+            return _elementwise(_COMPARISONS[expr.op], left, right)
+        if expr.op in _ARITHMETIC:
+            return _elementwise(_ARITHMETIC[expr.op], left, right)
+        raise UnsupportedQueryError(f"Unsupported operator {expr.op}")
+
+    if isinstance(expr, UnaryOp):
+        operand = compile_expression(expr.operand, now, slots)
+        if expr.op == 'NOT':
+            return lambda batch: [None if value is None else not value for value in operand(batch)]
+        return lambda batch: [None if value is None else -value for value in operand(batch)]
+
+    if isinstance(expr, Between):
+        condition = BinaryOp('AND', BinaryOp('>=', expr.expr, expr.low), BinaryOp('<=', expr.expr, expr.high))
+        return compile_expression(UnaryOp('NOT', condition) if expr.negated else condition, now, slots)
+
+    if isinstance(expr, InList):
+        return _compile_in(expr, now, slots)
+
+    if isinstance(expr, IsTest):
+        operand = compile_expression(expr.expr, now, slots)
+        target, negated = expr.value, expr.negated
+        return lambda batch: [(value is target) != negated for value in operand(batch)]
+
+    if isinstance(expr, Like):
+        operand = compile_expression(expr.expr, now, slots)
+        pattern = compile_expression(expr.pattern, now, slots)
+        if not isinstance(pattern, _Constant) or not isinstance(pattern.value, str):
+            raise UnsupportedQueryError("LIKE patterns must be string literals")
+        regex, negated = _like_regex(pattern.value, expr.case_insensitive), expr.negated
+        return lambda batch: [None if value is None else (regex.fullmatch(_text(value)) is not None) != negated
+                              for value in operand(batch)]
+
+    if isinstance(expr, Case):
+        whens = expr.whens
+        if expr.operand is not None:
+            whens = tuple((BinaryOp('=', expr.operand, value), result) for value, result in whens)
+        return _compile_case([(compile_expression(condition, now, slots), compile_expression(result, now, slots))
+                              for condition, result in whens],
+                             compile_expression(expr.default, now, slots) if expr.default is not None else None)
+
+    if isinstance(expr, Cast):
+        operand = compile_expression(expr.expr, now, slots)
+        type_name = expr.type_name.lower()
+        if type_name == 'date':
+            return lambda batch: [None if value is None else _to_date(value) for value in operand(batch)]
+        return lambda batch: [cast_value(value, type_name) for value in operand(batch)]
+
+    if isinstance(expr, FuncCall):
+        if expr.name not in _SCALAR_FUNCTIONS or expr.star or expr.distinct:
+            raise UnsupportedQueryError(f"Function {expr.name}() is not supported locally")
+        fn, strict = _SCALAR_FUNCTIONS[expr.name]
+        args = [compile_expression(arg, now, slots) for arg in expr.args]
+        if strict:
+            return lambda batch: [None if None in values else fn(*values)
+                                  for values in zip(*(arg(batch) for arg in args))]
+        return lambda batch: [fn(*values) for values in zip(*(arg(batch) for arg in args))]
+
+    if isinstance(expr, Star):
+        raise UnsupportedQueryError("* cannot be combined with aggregates or GROUP BY")
+    raise UnsupportedQueryError(f"Unsupported expression: {type(expr).__name__}")
+
+
+def _compile_in(expr: InList, now: datetime, slots: Optional[Dict[str, str]]) -> Vector:
+    operand = compile_expression(expr.expr, now, slots)
+    items = [compile_expression(item, now, slots) for item in expr.items]
+    if not all(isinstance(item, _Constant) for item in items):
+        # Non-constant lists: x IN (a, b) is x = a OR x = b
+        condition = BinaryOp('=', expr.expr, expr.items[0])
+        for item in expr.items[1:]:
+            condition = BinaryOp('OR', condition, BinaryOp('=', expr.expr, item))
+        return compile_expression(UnaryOp('NOT', condition) if expr.negated else condition, now, slots)
+
+    values = [item.value for item in items]
+    has_null = any(value is None for value in values)
+    lookup = set(value for value in values if value is not None)
+    if any(isinstance(value, (date, datetime)) for value in lookup):
+        operand = _coerced(operand, next(value for value in lookup if isinstance(value, (date, datetime))))
+    miss = None if has_null else expr.negated
+
+    return lambda batch: [None if value is None else (not expr.negated if value in lookup else miss)
+                          for value in operand(batch)]
+
+
+def _compile_case(whens: List[Tuple[Vector, Vector]], default: Optional[Vector]) -> Vector:
+    def evaluate(batch: ColumnBatch) -> list:
+        result = [None] * batch.length
+        remaining = list(range(batch.length))
+        current = batch
+        for condition, value in whens:
+            if not remaining:
+                break
+            flags = condition(current)
+            hit = [i for i, flag in enumerate(flags) if flag is True]
+            if not hit:
+                continue
+            # Only evaluate a branch on the rows that take it, like PostgreSQL
+            if isinstance(value, _Constant):
+                values = [value.value] * len(hit)
+            else:
+                values = value(current if len(hit) == current.length else current.take(hit))
+            for i, v in zip(hit, values):
+                result[remaining[i]] = v
+            missed = [i for i, flag in enumerate(flags) if flag is not True]
+            remaining = [remaining[i] for i in missed]
+            current = current.take(missed)
+        if remaining and default is not None:
+            for position, v in zip(remaining, default(current)):
+                result[position] = v
+        return result
+
+    return evaluate
+
+
+# --- Aggregates -------------------------------------------------------------
+
+def _numeric_array(values: list):
+    """(float64 NumPy array with NULL as NaN, True if every value is an int), or None to use Python
+
+    None when NumPy is unavailable, the batch is small or holds anything but ints and floats.
+    Batches with ints are only converted while every sum over them stays below 2**53, where
+    float64 is exact, so larger integers keep Python's exact arithmetic.
+    """
+    if len(values) < _NUMPY_MIN_VALUES:
+        return None
+    np = _numpy()
+    if np is None:
+        return None
+    types = set(map(type, values))
+    types.discard(type(None))
+    if not types or not types <= {int, float}:
+        return None
+    try:
+        array = np.array(values, dtype=float)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if int in types and float(np.nanmax(np.abs(array))) * len(values) >= 2 ** 53:
+        return None
+    return array, float not in types
+
+
+def _merge(total, part, fill, combine):
+    """Combine per-group NumPy partials; part covers at least as many groups as total"""
+    if total is None:
+        return part
+    np = _numpy()
+    if len(total) < len(part):
+        total = np.concatenate([total, np.full(len(part) - len(total), fill, dtype=total.dtype)])
+    combine(total, part, out=total)
+    return total
+
+
+class GroupIds:
+    """The group number of every row in a batch (ids is None when all rows are in group 0)"""
+
+    __slots__ = ('ids', 'count', 'length', '_array')
+
+    def __init__(self, ids: Optional[List[int]], count: int, length: int):
+        self.ids = ids
+        self.count = count
+        self.length = length
+        self._array = None
+
+    def array(self):
+        """The ids as a NumPy array, converted once per batch and shared by every aggregate"""
+        if self._array is None:
+            np = _numpy()
+            self._array = (np.zeros(self.length, dtype=np.intp) if self.ids is None
+                           else np.asarray(self.ids, dtype=np.intp))
+        return self._array
+
+
+class _Aggregate:
+    """Partial state of one aggregate call for every group seen so far
+
+    Python partials live in lists indexed by group; batches reduced with NumPy
+    accumulate into arrays that are merged in once, when results are built.
+    """
+
+    def __init__(self, argument: Optional[Vector]):
+        self.argument = argument
+
+    def update(self, batch: ColumnBatch, groups: GroupIds):
+        raise NotImplementedError
+
+    def results(self, n_groups: int) -> list:
+        raise NotImplementedError
+
+
+class _Count(_Aggregate):
+    def __init__(self, argument: Optional[Vector]):
+        super().__init__(argument)
+        self.counts: List[int] = []
+        self.array_counts = None
+
+    def add_rows(self, count: int):
+        """Count rows known only by number (COUNT(*) answered from Content-Range)"""
+        self._grow(1)
+        self.counts[0] += count
+
+    def _grow(self, n_groups: int):
+        self.counts.extend([0] * (n_groups - len(self.counts)))
+
+    def update(self, batch, groups):
+        self._grow(groups.count)
+        values = self.argument(batch) if self.argument is not None else None
+        if groups.ids is None:
+            self.counts[0] += batch.length if values is None else batch.length - values.count(None)
+            return
+        if values is None and batch.length >= _NUMPY_MIN_VALUES and _numpy() is not None:
+            np = _numpy()
+            self.array_counts = _merge(self.array_counts, np.bincount(groups.array(), minlength=groups.count),
+                                       0, np.add)
+            return
+        if values is None:
+            tally = Counter(groups.ids)
+        else:
+            tally = Counter(gid for gid, value in zip(groups.ids, values) if value is not None)
+        for gid, count in tally.items():
+            self.counts[gid] += count
+
+    def results(self, n_groups):
+        self._grow(n_groups)
+        if self.array_counts is not None:
+            for gid, count in enumerate(self.array_counts.tolist()):
+                self.counts[gid] += count
+            self.array_counts = None
+        return self.counts
+
+
+class _Sum(_Aggregate):
+    """SUM, and AVG when average=True"""
+
+    def __init__(self, argument: Vector, average: bool = False):
+        super().__init__(argument)
+        self.average = average
+        self.sums: List[Any] = []
+        self.counts: List[int] = []
+        # [sums, counts] of the NumPy batches, kept apart for integer (True) and float (False) batches
+        self.partials: Dict[bool, list] = {True: [None, None], False: [None, None]}
+
+    def _grow(self, n_groups: int):
+        missing = n_groups - len(self.sums)
+        self.sums.extend([None] * missing)
+        self.counts.extend([0] * missing)
+
+    def _add(self, gid: int, total, count: int):
+        self.sums[gid] = total if self.sums[gid] is None else self.sums[gid] + total
+        self.counts[gid] += count
+
+    def _fold(self, integral: bool):
+        """Move the NumPy partials of one kind into the Python totals"""
+        sums, counts = self.partials[integral]
+        if sums is None:
+            return
+        self._grow(len(sums))
+        for gid, (total, count) in enumerate(zip(sums.tolist(), counts.tolist())):
+            if count:
+                self._add(gid, total, count)
+        self.partials[integral] = [None, None]
+
+    def update(self, batch, groups):
+        self._grow(groups.count)
+        values = self.argument(batch)
+        numeric = _numeric_array(values)
+        if numeric is not None:
+            np = _numpy()
+            array, integral = numeric
+            valid = ~np.isnan(array)
+            ids = groups.array()[valid]
+            sums = np.bincount(ids, weights=array[valid], minlength=groups.count)
+            if integral:
+                # Exact: integer batches are only sent here while their sums stay below 2**53
+                sums = sums.astype(np.int64)
+            partial = self.partials[integral]
+            partial[0] = _merge(partial[0], sums, 0, np.add)
+            partial[1] = _merge(partial[1], np.bincount(ids, minlength=groups.count), 0, np.add)
+            if integral and int(np.abs(partial[0]).max()) >= 2 ** 62:
+                # Hand over to Python ints long before int64 could overflow
+                self._fold(True)
+            return
+
+        if groups.ids is None:
+            present = [value for value in values if value is not None]
+            if present:
+                self._add(0, sum(present), len(present))
+            return
+        for gid, value in zip(groups.ids, values):
+            if value is not None:
+                self._add(gid, value, 1)
+
+    def results(self, n_groups):
+        self._grow(n_groups)
+        self._fold(True)
+        self._fold(False)
+        if not self.average:
+            return self.sums
+        return [None if count == 0 else total / count for total, count in zip(self.sums, self.counts)]
+
+
+class _Extreme(_Aggregate):
+    """MIN, or MAX when largest=True"""
+
+    def __init__(self, argument: Vector, largest: bool = False):
+        super().__init__(argument)
+        self.largest = largest
+        self.best = max if largest else min
+        self.values: List[Any] = []
+        # Extremes of the NumPy batches, kept apart for integer (True) and float (False) batches
+        self.partials: Dict[bool, Any] = {True: None, False: None}
+
+    def _grow(self, n_groups: int):
+        self.values.extend([None] * (n_groups - len(self.values)))
+
+    def _add(self, gid: int, value):
+        current = self.values[gid]
+        self.values[gid] = value if current is None else self.best(current, value)
+
+    def update(self, batch, groups):
+        self._grow(groups.count)
+        values = self.argument(batch)
+        numeric = _numeric_array(values)
+        if numeric is not None:
+            np = _numpy()
+            array, integral = numeric
+            valid = ~np.isnan(array)
+            fill, combine = (-np.inf, np.maximum) if self.largest else (np.inf, np.minimum)
+            extremes = np.full(groups.count, fill)
+            combine.at(extremes, groups.array()[valid], array[valid])
+            self.partials[integral] = _merge(self.partials[integral], extremes, fill, combine)
+            return
+
+        if groups.ids is None:
+            present = [value for value in values if value is not None]
+            if present:
+                self._add(0, self.best(present))
+            return
+        for gid, value in zip(groups.ids, values):
+            if value is not None:
+                self._add(gid, value)
+
+    def results(self, n_groups):
+        self._grow(n_groups)
+        for integral, extremes in self.partials.items():
+            if extremes is None:
+                continue
+            for gid, value in enumerate(extremes.tolist()):
+                # Groups never reached by a NumPy batch of this kind are still at +/-inf
+                if not math.isinf(value):
+                    self._add(gid, int(value) if integral else value)
+            self.partials[integral] = None
+        return self.values
+
+
+class _Distinct(_Aggregate):
+    """COUNT/SUM/AVG/MIN/MAX(DISTINCT ...): keeps the set of values per group"""
+
+    def __init__(self, argument: Vector, name: str):
+        super().__init__(argument)
+        self.name = name
+        self.sets: List[set] = []
+
+    def update(self, batch, groups):
+        self.sets.extend(set() for _ in range(groups.count - len(self.sets)))
+        values = self.argument(batch)
+        if groups.ids is None:
+            self.sets[0].update(value for value in values if value is not None)
+            return
+        for gid, value in zip(groups.ids, values):
+            if value is not None:
+                self.sets[gid].add(value)
+
+    def results(self, n_groups):
+        self.sets.extend(set() for _ in range(n_groups - len(self.sets)))
+        if self.name == 'count':
+            return [len(values) for values in self.sets]
+        if self.name == 'avg':
+            return [sum(values) / len(values) if values else None for values in self.sets]
+        fn = {'sum': sum, 'min': min, 'max': max}[self.name]
+        return [fn(values) if values else None for values in self.sets]
+
+
+def _make_aggregate(call: FuncCall, now: datetime) -> _Aggregate:
+    if call.star:
+        if call.name != 'count':
+            raise UnsupportedQueryError(f"{call.name.upper()}(*) is not valid")
+        return _Count(None)
+    if len(call.args) != 1:
+        raise UnsupportedQueryError(f"{call.name.upper()}() takes exactly one argument")
+    argument = compile_expression(call.args[0], now)
+    if call.distinct:
+        return _Distinct(argument, call.name)
+    if call.name == 'count':
+        return _Count(argument)
+    if call.name in ('sum', 'avg'):
+        return _Sum(argument, average=call.name == 'avg')
+    return _Extreme(argument, largest=call.name == 'max')
+
+
+# --- Planning ---------------------------------------------------------------
+
+class AggregatePlan(NamedTuple):
+    """How to run an aggregate SELECT: the pushed-down request plus what is left to do locally"""
+    request: PostgrestRequest
+    columns: Tuple[str, ...]  # columns fetched for every row
+    count_only: bool  # answer COUNT(*) from Content-Range instead of fetching rows
+    statement: SelectStatement  # with qualifiers stripped and aliases/ordinals resolved
+    residual: Tuple  # WHERE conditions that could not be pushed down
+    now: datetime
+
+
+def _conjuncts(expr) -> List[Any]:
+    """Split a condition on its top-level ANDs"""
+    if expr is None:
+        return []
+    if isinstance(expr, BinaryOp) and expr.op == 'AND':
+        return _conjuncts(expr.left) + _conjuncts(expr.right)
+    return [expr]
+
+
+def _conjunction(conditions) -> Any:
+    result = None
+    for condition in conditions:
+        result = condition if result is None else BinaryOp('AND', result, condition)
+    return result
+
+
+def _strip_qualifiers(node, resolve: Callable[[Column], str]):
+    """Rebuild an expression with every column reference resolved to its bare name"""
+    if isinstance(node, Column):
+        return Column(resolve(node))
+    if isinstance(node, tuple):
+        children = [_strip_qualifiers(child, resolve) for child in node]
+        return type(node)(*children) if hasattr(node, '_fields') else tuple(children)
+    return node
+
+
+def _resolve_reference(expr, items: Tuple[SelectItem, ...], clause: str):
+    """Resolve GROUP BY/ORDER BY output ordinals and aliases to the select item expression"""
+    if isinstance(expr, Literal) and isinstance(expr.value, int) and not isinstance(expr.value, bool):
+        if not 1 <= expr.value <= len(items):
+            raise UnsupportedQueryError(f"{clause} position {expr.value} is out of range")
+        return items[expr.value - 1].expr
+    if isinstance(expr, Column) and expr.table is None:
+        for item in items:
+            if item.alias == expr.name:
+                return item.expr
+    return expr
+
+
+def _normalize(statement: SelectStatement, resolve: Callable[[Column], str]) -> SelectStatement:
+    statement = _strip_qualifiers(statement, resolve)
+    items = statement.items
+    if any(isinstance(item.expr, Star) for item in items):
+        raise UnsupportedQueryError("* cannot be combined with aggregates, GROUP BY or DISTINCT")
+
+    group_by = tuple(_resolve_reference(expr, items, 'GROUP BY') for expr in statement.group_by)
+    distinct = statement.distinct
+    if distinct and not is_aggregate_query(statement):
+        # SELECT DISTINCT a, b is GROUP BY a, b
+        group_by, distinct = tuple(item.expr for item in items), False
+
+    where, having = statement.where, statement.having
+    if group_by and having is not None:
+        # HAVING conditions on grouping columns filter rows just as well, and can be pushed down
+        conditions = _conjuncts(having)
+        moved = [c for c in conditions if not contains_aggregate(c) and column_names(c)]
+        if moved:
+            where = _conjunction(_conjuncts(where) + moved)
+            having = _conjunction([c for c in conditions if not any(c is m for m in moved)])
+
+    order_by = tuple(OrderItem(_resolve_reference(order.expr, items, 'ORDER BY'), order.descending,
+                               order.nulls_first) for order in statement.order_by)
+    return statement._replace(where=where, group_by=group_by, having=having,
+                              order_by=order_by, distinct=distinct)
+
+
+def _aggregate_calls(statement: SelectStatement) -> List[FuncCall]:
+    """Every distinct aggregate call in the select list, HAVING and ORDER BY"""
+    calls: Dict[str, FuncCall] = {}
+    for expr in itertools.chain((item.expr for item in statement.items), [statement.having],
+                                (order.expr for order in statement.order_by)):
+        for node in walk(expr):
+            if isinstance(node, FuncCall) and node.name in AGGREGATE_FUNCTIONS:
+                calls.setdefault(repr(node), node)
+    return list(calls.values())
+
+
+def is_local_aggregate(sql: str) -> bool:
+    """True if the statement is a SELECT that the aggregate engine should run"""
+    try:
+        statement = parse_select(sql)
+    except UnsupportedQueryError:
+        return False
+    return is_aggregate_query(statement) or statement.distinct
+
+
+def plan_aggregate(sql: str, key_column: Optional[str] = None,
+                   now: Optional[datetime] = None) -> AggregatePlan:
+    """Plan an aggregate SELECT, raising UnsupportedQueryError outside the supported subset
+
+    key_column is added to the fetched columns so the scan can use keyset pagination.
+    """
+    statement = parse_select(sql)
+    if not (is_aggregate_query(statement) or statement.distinct):
+        raise UnsupportedQueryError("Not an aggregate or DISTINCT query")
+    now = now or datetime.now(timezone.utc)
+    resolve = column_resolver(statement)
+    path, headers = table_path(statement)
+    statement = _normalize(statement, resolve)
+
+    pushed, residual = [], []
+    for condition in _conjuncts(statement.where):
+        if contains_aggregate(condition):
+            raise UnsupportedQueryError("Aggregate functions are not allowed in WHERE")
+        try:
+            pushed.append(filter_node(condition, resolve, now))
+        except UnsupportedQueryError:
+            residual.append(condition)
+    params = filter_params(Group('and', tuple(pushed))) if pushed else []
+
+    columns: List[str] = []
+    for expr in itertools.chain((item.expr for item in statement.items), residual, statement.group_by,
+                                [statement.having], (order.expr for order in statement.order_by)):
+        for column in column_names(expr):
+            if column.name not in columns:
+                columns.append(column.name)
+
+    calls = _aggregate_calls(statement)
+    count_only = (not columns and not residual and not statement.group_by and bool(calls)
+                  and all(call.star for call in calls))
+    if count_only:
+        headers = dict(headers, Prefer='count=exact')
+        params = params + [('limit', '1')]
+    else:
+        if key_column and columns and key_column not in columns:
+            columns.append(key_column)
+        if columns:
+            params = [('select', ','.join(quote_name(name) for name in columns))] + params
+
+    return AggregatePlan(PostgrestRequest(path, params, headers), tuple(columns), count_only,
+                         statement, tuple(residual), now)
+
+
+# --- Execution --------------------------------------------------------------
+
+def _output_name(item: SelectItem) -> str:
+    """The result column name PostgreSQL would use"""
+    if item.alias:
+        return item.alias
+    expr = item.expr
+    while isinstance(expr, Cast):
+        expr = expr.expr
+    if isinstance(expr, Column):
+        return expr.name
+    if isinstance(expr, FuncCall):
+        return expr.name
+    if isinstance(expr, Case):
+        return 'case'
+    return '?column?'
+
+
+class AggregateEngine:
+    """Folds batches of rows into per-group partial aggregates and produces the result rows"""
+
+    def __init__(self, plan: AggregatePlan, batch_size: int = BATCH_SIZE):
+        statement, now = plan.statement, plan.now
+        self.plan = plan
+        self.batch_size = batch_size
+        # Compile everything up front so unsupported expressions fail before any fetching
+        self.residual = compile_expression(_conjunction(plan.residual), now) if plan.residual else None
+        self.keys = [compile_expression(expr, now) for expr in statement.group_by]
+        calls = _aggregate_calls(statement)
+        self.aggregates = [_make_aggregate(call, now) for call in calls]
+
+        slots = {repr(expr): f"g{i}" for i, expr in enumerate(statement.group_by)}
+        slots.update((repr(call), f"a{i}") for i, call in enumerate(calls))
+        self.outputs = [(_output_name(item), compile_expression(item.expr, now, slots))
+                        for item in statement.items]
+        self.having = compile_expression(statement.having, now, slots) if statement.having is not None else None
+        self.order = [(compile_expression(order.expr, now, slots), order) for order in statement.order_by]
+
+        self.groups: Dict[Any, int] = {}
+        self.rows_scanned = 0
+
+    def consume(self, rows: Iterable[Dict[str, Any]]):
+        """Feed an iterable of rows in batch_size batches"""
+        iterator = iter(rows)
+        while True:
+            batch = list(itertools.islice(iterator, self.batch_size))
+            if not batch:
+                return
+            self.feed(batch)
+
+    def feed(self, rows: List[Dict[str, Any]]):
+        """Fold one batch of row dicts into the aggregates"""
+        if not rows:
+            return
+        batch = ColumnBatch.from_rows(rows, self.plan.columns)
+        self.rows_scanned += batch.length
+        if self.residual is not None:
+            keep = [i for i, flag in enumerate(self.residual(batch)) if flag is True]
+            if len(keep) < batch.length:
+                batch = batch.take(keep)
+        if not batch.length:
+            return
+
+        groups = GroupIds(None, 1, batch.length)
+        if self.keys:
+            vectors = [key(batch) for key in self.keys]
+            keys = vectors[0] if len(vectors) == 1 else zip(*vectors)
+            index = self.groups
+            try:
+                ids = [index.setdefault(key, len(index)) for key in keys]
+            except TypeError:
+                raise UnsupportedQueryError("GROUP BY on json or array values is not supported") from None
+            groups = GroupIds(ids, len(index), batch.length)
+
+        for aggregate in self.aggregates:
+            aggregate.update(batch, groups)
+
+    def feed_count(self, count: int):
+        """Record the row count of a count_only plan"""
+        self.rows_scanned += count
+        for aggregate in self.aggregates:
+            aggregate.add_rows(count)
+
+    def result(self) -> List[Dict[str, Any]]:
+        """Apply HAVING, ORDER BY, DISTINCT, OFFSET and LIMIT and build the result rows"""
+        statement = self.plan.statement
+        if self.keys:
+            n_groups = len(self.groups)
+            keys = list(self.groups)
+            columns = ({'g0': keys} if len(self.keys) == 1
+                       else {f"g{i}": [key[i] for key in keys] for i in range(len(self.keys))})
+        else:
+            # An ungrouped aggregate always returns one row, even over no input
+            n_groups = 1
+            columns = {}
+        for i, aggregate in enumerate(self.aggregates):
+            columns[f"a{i}"] = aggregate.results(n_groups)
+        batch = ColumnBatch(columns, n_groups)
+
+        if self.having is not None:
+            batch = batch.take([i for i, flag in enumerate(self.having(batch)) if flag is True])
+
+        order = list(range(batch.length))
+        for vector, item in reversed(self.order):
+            values = vector(batch)
+            nulls_first = item.nulls_first if item.nulls_first is not None else item.descending
+            flip = nulls_first != item.descending
+            # Stable sorts from the last key to the first give a multi-key ordering
+            order.sort(key=lambda i: ((values[i] is None) != flip, 0 if values[i] is None else values[i]),
+                       reverse=item.descending)
+
+        names = [name for name, _ in self.outputs]
+        vectors = [vector(batch) for _, vector in self.outputs]
+        rows = [dict(zip(names, (vector[i] for vector in vectors))) for i in order]
+
+        if statement.distinct:
+            seen = set()
+            unique = []
+            for row in rows:
+                key = tuple(row.values())
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(row)
+            rows = unique
+        start = statement.offset or 0
+        end = None if statement.limit is None else start + statement.limit
+        return rows[start:end]
@@ -0,0 +1,159 @@
+"""
+Lightweight statement classification used to schedule SQL safely.
+
+This is not a parser: it strips literals and comments, then looks at
+keywords to decide what kind of statement it is and which tables it
+reads and writes. Anything it is unsure about is reported as a barrier
+so callers fall back to running it on its own.
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, Mapping, NamedTuple, Optional
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\$([A-Za-z_]\w*)?\$.*?\$\1\$", re.S)
+_IDENTIFIER = r'(?:"[^"]+"|[A-Za-z_][\w$]*)(?:\s*\.\s*(?:"[^"]+"|[A-Za-z_][\w$]*))?'
+_READ_TABLE = re.compile(rf'\b(?:FROM|JOIN|USING)\s+(?:ONLY\s+)?({_IDENTIFIER})', re.I)
+_WRITE_TABLE = re.compile(
+    rf'\b(?:INSERT\s+INTO|UPDATE(?:\s+ONLY)?|DELETE\s+FROM(?:\s+ONLY)?)\s+({_IDENTIFIER})', re.I
+)
+_FIRST_WORD = re.compile(r'\s*\(?\s*([A-Za-z]+)')
+_DATA_MODIFYING = re.compile(r'\b(?:INSERT|UPDATE|DELETE|MERGE)\b', re.I)
+_SELECT_INTO = re.compile(r'\bINTO\b', re.I)
+_LOCKING = re.compile(r'\bFOR\s+(?:UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b', re.I)
+_DDL_TABLES = re.compile(
+    rf'\s*(?:(?:ALTER|DROP)\s+TABLE|TRUNCATE(?:\s+TABLE)?)\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?'
+    rf'({_IDENTIFIER}(?:\s*,\s*{_IDENTIFIER})*)', re.I
+)
+# DDL that creates new objects without changing what existing tables return
+_CREATES_NEW = re.compile(r'\s*CREATE\s+(?:UNIQUE\s+)?(?:TABLE|INDEX|SEQUENCE)\b', re.I)
+# DDL that leaves the same state when run twice
+_REPEATABLE_DDL = re.compile(
+    r'\s*(?:CREATE\s+OR\s+REPLACE\b'
+    r'|CREATE\s+(?:UNIQUE\s+)?(?:[A-Za-z]+\s+){1,2}?(?:CONCURRENTLY\s+)?IF\s+NOT\s+EXISTS\b'
+    r'|DROP\s+(?:[A-Za-z]+\s+){1,2}?(?:CONCURRENTLY\s+)?IF\s+EXISTS\b'
+    rf'|ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?{_IDENTIFIER}\s+'
+    r'(?:ADD\s+(?:COLUMN\s+)?IF\s+NOT\s+EXISTS|DROP\s+(?:COLUMN\s+|CONSTRAINT\s+)?IF\s+EXISTS)\b)', re.I
+)
+_ALTER_ACTION = re.compile(r'\b(?:ADD|DROP|ALTER|RENAME)\b', re.I)
+# Calls whose result changes from one statement to the next
+_VOLATILE = re.compile(
+    r'\b(?:(?:now|clock_timestamp|statement_timestamp|transaction_timestamp|timeofday|random|setseed'
+    r'|gen_random_uuid|uuid_generate_v[14]|nextval|currval|lastval|txid_current|pg_current_xact_id)\s*\('
+    r'|current_(?:date|time|timestamp)\b|local(?:time|timestamp)\b)', re.I
+)
+_DO_NOTHING = re.compile(r'\bON\s+CONFLICT\b[^;]*?\bDO\s+NOTHING\s*$', re.I)
+
+READ_KEYWORDS = {'SELECT', 'WITH', 'TABLE', 'VALUES'}
+WRITE_KEYWORDS = {'INSERT', 'UPDATE', 'DELETE'}
+
+
+class StatementInfo(NamedTuple):
+    """What a statement does and which tables it touches"""
+    kind: str  # 'select', 'dml' or 'ddl' (anything else, always a barrier)
+    reads: FrozenSet[str]
+    writes: FrozenSet[str]
+
+    @property
+    def is_barrier(self) -> bool:
+        """True if the statement must not run concurrently with anything"""
+        if self.kind == 'ddl':
+            return True
+        # Without a known table we cannot prove independence (e.g. SELECT my_func())
+        return not (self.reads or self.writes)
+
+
+def normalize_table_name(name: str) -> str:
+    """Fold an identifier the way PostgreSQL does and drop the public schema"""
+    parts = [part.strip() for part in name.split('.')]
+    folded = [part[1:-1] if part.startswith('"') else part.lower() for part in parts]
+    if len(folded) == 2 and folded[0] == 'public':
+        folded = folded[1:]
+    return '.'.join(folded)
+
+
+def linked_tables(references: Mapping[str, Iterable[str]]) -> Dict[str, FrozenSet[str]]:
+    """Every table mapped to the tables it is connected to through foreign keys, itself included
+
+    Links are followed in both directions and transitively: an insert needs the
+    rows it references, and a delete may cascade into every table below it.
+    """
+    groups: Dict[str, FrozenSet[str]] = {}
+    for table, referenced in references.items():
+        group = frozenset([table, *referenced])
+        for member in group:
+            group |= groups.get(member, frozenset())
+        for member in group:
+            groups[member] = group
+    return groups
+
+
+def strip_literals(query: str) -> str:
+    """Blank out string and dollar-quoted literals so keywords inside them are ignored"""
+    return _LITERAL.sub("''", query)
+
+
+def analyze_statement(query: str) -> StatementInfo:
+    """Classify a single (comment-free) SQL statement"""
+    text = strip_literals(query)
+    match = _FIRST_WORD.match(text)
+    keyword = match.group(1).upper() if match else ''
+
+    reads = frozenset(normalize_table_name(t) for t in _READ_TABLE.findall(text))
+    # "ON CONFLICT ... DO UPDATE SET" is not a table reference
+    writes = frozenset(normalize_table_name(t) for t in _WRITE_TABLE.findall(text)
+                       if t.upper() != 'SET')
+
+    if keyword in READ_KEYWORDS:
+        if keyword == 'WITH' and _DATA_MODIFYING.search(text):
+            return StatementInfo('dml', reads, writes) if writes else StatementInfo('ddl', reads, writes)
+        if _SELECT_INTO.search(text) or _LOCKING.search(text):
+            return StatementInfo('ddl', reads, writes)
+        return StatementInfo('select', reads, frozenset())
+
+    if keyword in WRITE_KEYWORDS:
+        if not writes:
+            return StatementInfo('ddl', reads, writes)
+        return StatementInfo('dml', reads, writes)
+
+    return StatementInfo('ddl', reads, writes)
+
+
+def modified_tables(query: str) -> Optional[FrozenSet[str]]:
+    """Tables whose contents a (comment-free) statement may change; None if it could be any table"""
+    info = analyze_statement(query)
+    if info.kind == 'select':
+        return frozenset()
+    if info.kind == 'dml':
+        return info.writes
+
+    text = strip_literals(query)
+    match = _DDL_TABLES.match(text)
+    if match:
+        return frozenset(normalize_table_name(t) for t in re.findall(_IDENTIFIER, match.group(1)))
+    if _CREATES_NEW.match(text):
+        return frozenset()
+    return None
+
+
+def is_idempotent(query: str) -> bool:
+    """True if running a (comment-free) statement twice leaves the same state as running it once
+
+    Covers table reads, CREATE OR REPLACE, CREATE ... IF NOT EXISTS, DROP ... IF EXISTS,
+    single-action ALTER TABLE ... IF [NOT] EXISTS and INSERT ... ON CONFLICT DO NOTHING.
+    Anything else is assumed unsafe to retry once it may have reached the database.
+    """
+    info = analyze_statement(query)
+    if info.kind == 'select':
+        # SELECT my_func() may have side effects
+        return bool(info.reads)
+    text = strip_literals(query).strip().rstrip(';')
+    if info.kind == 'dml':
+        return text[:6].upper() == 'INSERT' and bool(_DO_NOTHING.search(text))
+    if not _REPEATABLE_DDL.match(text):
+        return False
+    return not text.upper().startswith('ALTER') or len(_ALTER_ACTION.findall(text)) == 2
+
+
+def is_volatile(query: str) -> bool:
+    """True if a (comment-free) statement calls a function whose result changes between calls (now(), random()...)"""
+    return bool(_VOLATILE.search(strip_literals(query)))
@@ -0,0 +1,106 @@
+"""
+Ordering for runs of several SQL files.
+
+Files are grouped into stages that run one after another, while the files
+of one stage are independent and may run concurrently. Stages come from a
+manifest, or else from numeric filename prefixes: 01_schema.sql runs before
+02_seed_users.sql and 02_seed_puzzles.sql, which run together. Files
+without a numeric prefix have no ordering constraint and join the first
+stage.
+
+A manifest lists one stage per line; paths and globs on the same line run
+concurrently, relative paths are resolved against the manifest's directory
+and '#' starts a comment:
+
+    01_schema.sql
+    seeds/*.sql  reference_data.sql
+    views.sql
+"""
+
+import glob
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+_PREFIX = re.compile(r'(\d+)')
+
+
+def natural_key(name: str) -> List[Any]:
+    """Sort key that puts 2_x.sql before 10_x.sql"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def numeric_prefix(path: str) -> Optional[int]:
+    """The number a file name starts with (7 for 007_users.sql), or None"""
+    match = _PREFIX.match(os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+
+def expand_paths(patterns: Iterable[str], base_dir: str = '') -> List[str]:
+    """Expand files, directories (their .sql files) and glob patterns, dropping duplicates
+
+    Matches of one pattern are sorted naturally; the order of the patterns is kept.
+    Raises FileNotFoundError for a path or pattern that matches nothing.
+    """
+    paths: List[str] = []
+    seen = set()
+    for pattern in patterns:
+        pattern = os.path.join(base_dir, pattern) if base_dir else pattern
+        if glob.has_magic(pattern):
+            matches = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+        elif os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)
+                       if name.endswith('.sql') and os.path.isfile(os.path.join(pattern, name))]
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = []
+        if not matches:
+            raise FileNotFoundError(f"No SQL files match {pattern}")
+        for path in sorted(matches, key=natural_key):
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+def plan_stages(paths: List[str]) -> List[List[str]]:
+    """Group files by numeric prefix, in ascending order; unprefixed files join the first stage"""
+    stages: Dict[int, List[str]] = {}
+    unordered = []
+    for path in paths:
+        prefix = numeric_prefix(path)
+        if prefix is None:
+            unordered.append(path)
+        else:
+            stages.setdefault(prefix, []).append(path)
+    ordered = [stages[prefix] for prefix in sorted(stages)]
+    if not ordered:
+        return [unordered] if unordered else []
+    ordered[0] = unordered + ordered[0]
+    return ordered
+
+
+def read_manifest(path: str) -> List[List[str]]:
+    """Stages listed in a manifest file, one line each
+
+    Raises FileNotFoundError if the manifest or one of its entries is missing,
+    and ValueError if a file is listed twice.
+    """
+    base_dir = os.path.dirname(path)
+    stages = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as manifest:
+        for line in manifest:
+            entries = line.split('#', 1)[0].split()
+            if not entries:
+                continue
+            stage = expand_paths(entries, base_dir)
+            for file in stage:
+                key = os.path.abspath(file)
+                if key in seen:
+                    raise ValueError(f"{file} is listed more than once in {path}")
+                seen.add(key)
+            stages.append(stage)
+    return stages
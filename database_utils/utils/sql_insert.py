@@ -0,0 +1,303 @@
+"""
+Parser for simple INSERT ... VALUES statements that can be sent to
+PostgREST as JSON-array POSTs instead of through an exec_sql RPC.
+
+Supported shape:
+
+    INSERT INTO [schema.]table (column, ...)
+    VALUES (value, ...) [, ...]
+    [ON CONFLICT [(column, ...)] DO NOTHING
+     | ON CONFLICT (column, ...) DO UPDATE SET column = EXCLUDED.column, ...]
+
+Values must be constants: numbers, strings, TRUE/FALSE, NULL, typed
+literals and :: casts. DO UPDATE must assign every inserted column that
+is not part of the conflict target from EXCLUDED, which is exactly what
+PostgREST's resolution=merge-duplicates does. Anything else (INSERT ...
+SELECT, DEFAULT, RETURNING, function calls, strings that may be JSON or
+array literals without a cast) raises UnsupportedQueryError so the
+statement keeps going through the RPC path.
+"""
+
+import json
+import re
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from .postgrest_query import PostgrestRequest, quote_name
+from .sql_select import _RESERVED, Token, UnsupportedQueryError, _Parser
+
+# Prefer: resolution= values for ON CONFLICT DO NOTHING and DO UPDATE (upsert)
+IGNORE_DUPLICATES = 'ignore-duplicates'
+MERGE_DUPLICATES = 'merge-duplicates'
+
+_JSON_TYPES = ('json', 'jsonb')
+_TYPED_LITERALS = ('timestamp', 'timestamptz', 'date', 'time', 'interval')
+
+# Seed files are mostly plain literals in unquoted tables and columns. Those are
+# matched with regular expressions; anything else goes through the token parser.
+_NAME = r'[A-Za-z_][A-Za-z0-9_$]*'
+_FAST_HEADER = re.compile(
+    rf'\s*INSERT\s+INTO\s+(?:({_NAME})\s*\.\s*)?({_NAME})\s*\(([\w$\s,]*)\)\s*VALUES\s*', re.I)
+_FAST_VALUE = r"(?:-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|'(?:[^']|'')*'|NULL|TRUE|FALSE)"
+_FAST_ROW = re.compile(rf'\(\s*{_FAST_VALUE}(?:\s*,\s*{_FAST_VALUE})*\s*\)', re.I)
+_FAST_VALUES = re.compile(_FAST_VALUE, re.I)
+_FAST_SEPARATOR = re.compile(r'\s*,\s*')
+_FAST_NAME = re.compile(_NAME)
+_FAST_END = re.compile(r'\s*;?\s*')
+_FAST_KEYWORDS = {'null': None, 'true': True, 'false': False}
+
+
+class InsertStatement(NamedTuple):
+    """A parsed INSERT: target table, column list, constant rows and conflict handling"""
+    table: str  # [schema.]table as PostgreSQL resolves it
+    columns: Tuple[str, ...]
+    rows: List[List[Any]]
+    resolution: Optional[str] = None  # None, IGNORE_DUPLICATES or MERGE_DUPLICATES
+    conflict_columns: Tuple[str, ...] = ()
+
+    @property
+    def target(self) -> Tuple:
+        """Statements with the same target can be sent in one request"""
+        return self.table, self.columns, self.resolution, self.conflict_columns
+
+
+class _InsertParser(_Parser):
+    def parse_insert(self) -> InsertStatement:
+        if self.at_keyword('with'):
+            raise UnsupportedQueryError("WITH (CTE) inserts are not supported")
+        self.expect_keyword('insert')
+        self.expect_keyword('into')
+        table = self.identifier()
+        if self.accept_op('.'):
+            schema, table = table, self.identifier()
+            if schema != 'public':
+                table = f"{schema}.{table}"
+
+        if not self.at_op('('):
+            raise UnsupportedQueryError("INSERT without a column list is not supported")
+        columns = self.name_list()
+        if len(set(columns)) != len(columns):
+            raise UnsupportedQueryError("INSERT lists a column more than once")
+
+        self.expect_keyword('values')
+        rows = [self.row(len(columns))]
+        while self.accept_op(','):
+            rows.append(self.row(len(columns)))
+
+        resolution, conflict_columns = self.statement_end(columns)
+        return InsertStatement(table, columns, rows, resolution, conflict_columns)
+
+    def statement_end(self, columns: Tuple[str, ...]) -> Tuple[Optional[str], Tuple[str, ...]]:
+        """The optional ON CONFLICT clause, which must end the statement"""
+        resolution, conflict_columns = None, ()
+        if self.accept_keyword('on'):
+            resolution, conflict_columns = self.on_conflict(columns)
+
+        token = self.peek()
+        if token.kind != 'eof':
+            if token.keyword == 'returning':
+                raise UnsupportedQueryError("INSERT ... RETURNING is not supported")
+            raise UnsupportedQueryError(f"Unexpected {token.value!r} in INSERT")
+        return resolution, conflict_columns
+
+    def name_list(self) -> Tuple[str, ...]:
+        self.expect_op('(')
+        names = [self.identifier()]
+        while self.accept_op(','):
+            names.append(self.identifier())
+        self.expect_op(')')
+        return tuple(names)
+
+    def row(self, width: int) -> List[Any]:
+        self.expect_op('(')
+        values = [self.value()]
+        while self.accept_op(','):
+            values.append(self.value())
+        self.expect_op(')')
+        if len(values) != width:
+            raise UnsupportedQueryError(f"VALUES row has {len(values)} values for {width} columns")
+        return values
+
+    def value(self) -> Any:
+        token = self.next()
+        negative = token == Token('op', '-')
+        if negative:
+            token = self.next()
+            if token.kind != 'number':
+                raise UnsupportedQueryError("Only numbers can be negated in VALUES")
+
+        if token.kind == 'number':
+            value = _number(token.value, negative)
+        elif token.kind == 'string':
+            value = token.value
+        elif token.keyword == 'null':
+            value = None
+        elif token.keyword in ('true', 'false'):
+            value = token.keyword == 'true'
+        elif token.keyword in _TYPED_LITERALS and self.peek().kind == 'string':
+            # TIMESTAMP '2024-01-01' is sent as text and converted by the column type
+            value = self.next().value
+        else:
+            raise UnsupportedQueryError(f"Only constant values are supported, found {token.value or 'end of query'!r}")
+
+        cast = None
+        while self.accept_op('::'):
+            cast = self.type_name()
+        if isinstance(value, str):
+            if cast in _JSON_TYPES:
+                try:
+                    return json.loads(value)
+                except ValueError:
+                    raise UnsupportedQueryError(f"Invalid {cast} literal {value[:40]!r}")
+            if cast is None and value.lstrip()[:1] in ('{', '['):
+                # Could be JSON for a json column or an array literal: only SQL knows the column type
+                raise UnsupportedQueryError("Uncast '{...}'/'[...]' literals are not supported")
+        return value
+
+    def type_name(self) -> str:
+        type_name = self.identifier()
+        while self.peek().kind == 'ident' and self.peek().value in ('with', 'without', 'time', 'zone', 'precision', 'varying'):
+            type_name += ' ' + self.next().value
+        if self.at_op('('):
+            raise UnsupportedQueryError("Casts with type modifiers are not supported")
+        return type_name
+
+    def on_conflict(self, columns: Tuple[str, ...]) -> Tuple[str, Tuple[str, ...]]:
+        self.expect_keyword('conflict')
+        if self.at_keyword('on'):
+            raise UnsupportedQueryError("ON CONFLICT ON CONSTRAINT is not supported")
+        target = self.name_list() if self.at_op('(') else ()
+        self.expect_keyword('do')
+        if self.accept_keyword('nothing'):
+            return IGNORE_DUPLICATES, target
+
+        self.expect_keyword('update')
+        if not target:
+            raise UnsupportedQueryError("ON CONFLICT DO UPDATE requires a conflict target")
+        self.expect_keyword('set')
+        assigned = [self.excluded_assignment()]
+        while self.accept_op(','):
+            assigned.append(self.excluded_assignment())
+        if self.at_keyword('where'):
+            raise UnsupportedQueryError("ON CONFLICT DO UPDATE ... WHERE is not supported")
+        # merge-duplicates overwrites every sent column, so the SET list must do the same
+        if set(assigned) | set(target) != set(columns) | set(target) or not set(assigned) <= set(columns):
+            raise UnsupportedQueryError("DO UPDATE must set every inserted column to EXCLUDED.column")
+        return MERGE_DUPLICATES, target
+
+    def excluded_assignment(self) -> str:
+        column = self.identifier()
+        self.expect_op('=')
+        if not (self.accept_keyword('excluded') and self.accept_op('.') and self.identifier() == column):
+            raise UnsupportedQueryError("Only SET column = EXCLUDED.column assignments are supported")
+        return column
+
+
+def _number(text: str, negative: bool = False) -> Any:
+    """A numeric literal as int, float if that is exact, else the text (converted server-side)"""
+    if text.isdigit():
+        return -int(text) if negative else int(text)
+    value = float(text)
+    if Decimal(repr(value)) != Decimal(text):
+        return '-' + text if negative else text
+    return -value if negative else value
+
+
+def _fast_value(text: str) -> Any:
+    first = text[0]
+    if first == "'":
+        value = text[1:-1].replace("''", "'")
+        if value.lstrip()[:1] in ('{', '['):
+            raise UnsupportedQueryError("Uncast '{...}'/'[...]' literals are not supported")
+        return value
+    if first == '-':
+        return _number(text[1:], True)
+    if first.isdigit() or first == '.':
+        return _number(text)
+    return _FAST_KEYWORDS[text.lower()]
+
+
+def _fast_parse(sql: str) -> Optional[InsertStatement]:
+    """Parse INSERTs of plain literals with regular expressions, or return None"""
+    header = _FAST_HEADER.match(sql)
+    if header is None:
+        return None
+    schema, table, column_list = header.groups()
+    columns = tuple(column.strip().lower() for column in column_list.split(','))
+    if (len(set(columns)) != len(columns) or table.lower() in _RESERVED
+            or not all(_FAST_NAME.fullmatch(column) and column not in _RESERVED for column in columns)):
+        return None
+    schema = schema.lower() if schema else None
+    table = table.lower() if schema in (None, 'public') else f"{schema}.{table.lower()}"
+
+    rows = []
+    pos = header.end()
+    while True:
+        row = _FAST_ROW.match(sql, pos)
+        if row is None:
+            return None
+        values = [_fast_value(value) for value in _FAST_VALUES.findall(row.group())]
+        if len(values) != len(columns):
+            return None
+        rows.append(values)
+        separator = _FAST_SEPARATOR.match(sql, row.end())
+        if separator is None:
+            pos = row.end()
+            break
+        pos = separator.end()
+
+    if _FAST_END.fullmatch(sql, pos):
+        return InsertStatement(table, columns, rows)
+    # Only the short tail (ON CONFLICT ...) goes through the tokenizer
+    resolution, conflict_columns = _InsertParser(sql[pos:]).statement_end(columns)
+    return InsertStatement(table, columns, rows, resolution, conflict_columns)
+
+
+def parse_insert(sql: str) -> InsertStatement:
+    """Parse a simple INSERT ... VALUES, raising UnsupportedQueryError outside the supported subset"""
+    return _fast_parse(sql) or _InsertParser(sql).parse_insert()
+
+
+def insert_request(table: str, columns: Sequence[str], resolution: Optional[str] = None,
+                   conflict_columns: Sequence[str] = ()) -> PostgrestRequest:
+    """The POST that inserts rows into a table; the JSON array body is sent separately"""
+    headers = {'Prefer': 'return=minimal'}
+    if resolution:
+        headers['Prefer'] += f",resolution={resolution}"
+    schema, _, name = table.rpartition('.')
+    if schema:
+        headers['Content-Profile'] = schema
+    # columns= lets PostgREST skip scanning every object for its keys
+    params = [('columns', ','.join(quote_name(column) for column in columns))]
+    if conflict_columns:
+        params.append(('on_conflict', ','.join(quote_name(column) for column in conflict_columns)))
+    return PostgrestRequest(f"/rest/v1/{quote(name, safe='')}", params, headers)
+
+
+def statement_request(statement: InsertStatement) -> PostgrestRequest:
+    """The POST for a parsed INSERT"""
+    return insert_request(statement.table, statement.columns, statement.resolution,
+                          statement.conflict_columns)
+
+
+def rows_payload(statements: Iterable[InsertStatement]) -> List[Dict[str, Any]]:
+    """The JSON array body for one or more INSERTs with the same target"""
+    payload = []
+    for statement in statements:
+        columns = statement.columns
+        payload.extend(dict(zip(columns, row)) for row in statement.rows)
+    return payload
+
+
+# bulk_insert(on_conflict=...) values
+RESOLUTIONS = {'ignore': IGNORE_DUPLICATES, 'merge': MERGE_DUPLICATES}
+
+
+def chunk_request(table: str, rows: List[Dict[str, Any]], on_conflict: Optional[str] = None,
+                  conflict_columns: Sequence[str] = ()) -> PostgrestRequest:
+    """The POST for a chunk of dict rows; keys missing from some rows are inserted as NULL"""
+    if on_conflict is not None and on_conflict not in RESOLUTIONS:
+        raise ValueError(f"on_conflict must be one of {sorted(RESOLUTIONS)} or None, got {on_conflict!r}")
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    return insert_request(table, columns, RESOLUTIONS.get(on_conflict), conflict_columns)
@@ -0,0 +1,585 @@
+"""
+Parser for the subset of PostgreSQL SELECT that database_utils can execute
+without an exec_sql RPC.
+
+Supported shape:
+
+    SELECT [DISTINCT] item [, ...]
+    FROM [schema.]table [[AS] alias]
+    [WHERE expr] [GROUP BY expr, ...] [HAVING expr]
+    [ORDER BY expr [ASC|DESC] [NULLS FIRST|LAST], ...]
+    [LIMIT n|ALL] [OFFSET n]
+
+Expressions cover literals, (qualified, quoted) columns, arithmetic, ||,
+comparisons, AND/OR/NOT, [NOT] IN (...), [NOT] BETWEEN, IS [NOT]
+NULL/TRUE/FALSE, [NOT] LIKE/ILIKE, CASE WHEN, function calls (including
+aggregates with DISTINCT or *), INTERVAL '...' literals and :: casts.
+Joins, subqueries, set operations and CTEs raise UnsupportedQueryError.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+
+class UnsupportedQueryError(ValueError):
+    """The statement is outside the SQL subset that can be executed client-side"""
+
+
+# --- Tokens -----------------------------------------------------------------
+
+class Token(NamedTuple):
+    kind: str  # 'ident', 'qident', 'string', 'number', 'op', 'eof'
+    value: str
+
+    @property
+    def keyword(self) -> str:
+        """The (lower-cased) word for unquoted identifiers, '' for anything else"""
+        return self.value if self.kind == 'ident' else ''
+
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<string>[Ee]?'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")+")
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op><>|!=|<=|>=|::|\|\||[=<>+\-*/%(),.;])
+  | (?P<param>\$\d+)
+""", re.X)
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Split a statement into tokens, raising UnsupportedQueryError on anything unknown"""
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        match = _TOKEN.match(sql, pos)
+        if match is None:
+            raise UnsupportedQueryError(f"Unexpected character {sql[pos]!r} at position {pos}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        pos = match.end()
+        if kind == 'ws':
+            continue
+        if kind == 'param':
+            raise UnsupportedQueryError("Positional parameters are not supported")
+        if kind == 'string':
+            if text[0] in 'eE':
+                raise UnsupportedQueryError("E'' escape strings are not supported")
+            text = text[1:-1].replace("''", "'")
+        elif kind == 'qident':
+            text = text[1:-1].replace('""', '"')
+        elif kind == 'ident':
+            text = text.lower()  # unquoted identifiers fold to lower case
+        tokens.append(Token(kind, text))
+    # A trailing semicolon is harmless
+    if tokens and tokens[-1] == Token('op', ';'):
+        tokens.pop()
+    tokens.append(Token('eof', ''))
+    return tokens
+
+
+# --- AST --------------------------------------------------------------------
+
+class Literal(NamedTuple):
+    value: Any
+
+
+class Interval(NamedTuple):
+    text: str
+
+
+class Column(NamedTuple):
+    name: str
+    table: Optional[str] = None
+
+
+class Star(NamedTuple):
+    table: Optional[str] = None
+
+
+class FuncCall(NamedTuple):
+    name: str
+    args: Tuple = ()
+    distinct: bool = False
+    star: bool = False
+
+
+class BinaryOp(NamedTuple):
+    op: str  # '+', '-', '*', '/', '%', '||', '=', '<>', '<', '<=', '>', '>=', 'AND', 'OR'
+    left: Any
+    right: Any
+
+
+class UnaryOp(NamedTuple):
+    op: str  # 'NOT', '-'
+    operand: Any
+
+
+class Between(NamedTuple):
+    expr: Any
+    low: Any
+    high: Any
+    negated: bool = False
+
+
+class InList(NamedTuple):
+    expr: Any
+    items: Tuple
+    negated: bool = False
+
+
+class IsTest(NamedTuple):
+    expr: Any
+    value: Any  # None, True or False
+    negated: bool = False
+
+
+class Like(NamedTuple):
+    expr: Any
+    pattern: Any
+    case_insensitive: bool = False
+    negated: bool = False
+
+
+class Case(NamedTuple):
+    whens: Tuple  # ((condition, result), ...)
+    default: Any = None
+    operand: Any = None  # CASE operand WHEN value ... form
+
+
+class Cast(NamedTuple):
+    expr: Any
+    type_name: str
+
+
+class SelectItem(NamedTuple):
+    expr: Any
+    alias: Optional[str] = None
+
+
+class OrderItem(NamedTuple):
+    expr: Any
+    descending: bool = False
+    nulls_first: Optional[bool] = None
+
+
+class TableRef(NamedTuple):
+    name: str
+    schema: Optional[str] = None
+    alias: Optional[str] = None
+
+
+class SelectStatement(NamedTuple):
+    items: Tuple
+    table: TableRef
+    where: Any = None
+    group_by: Tuple = ()
+    having: Any = None
+    order_by: Tuple = ()
+    limit: Optional[int] = None
+    offset: Optional[int] = None
+    distinct: bool = False
+
+
+AGGREGATE_FUNCTIONS = {'count', 'sum', 'avg', 'min', 'max'}
+
+# Words that end an expression or cannot be used as a bare alias
+_RESERVED = {
+    'select', 'from', 'where', 'group', 'having', 'order', 'limit', 'offset', 'and', 'or',
+    'not', 'as', 'on', 'join', 'inner', 'left', 'right', 'full', 'cross', 'union', 'intersect',
+    'except', 'by', 'asc', 'desc', 'nulls', 'is', 'in', 'between', 'like', 'ilike', 'case',
+    'when', 'then', 'else', 'end', 'null', 'true', 'false', 'distinct', 'all', 'fetch',
+    'for', 'window', 'using', 'natural', 'lateral', 'interval', 'with', 'into',
+}
+
+_COMPARISON_OPS = {'=', '<>', '!=', '<', '<=', '>', '>='}
+
+
+# --- Parser -----------------------------------------------------------------
+
+class _Parser:
+    def __init__(self, sql: str):
+        self.tokens = tokenize(sql)
+        self.pos = 0
+
+    # Token helpers
+
+    def peek(self, offset: int = 0) -> Token:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Token:
+        token = self.tokens[self.pos]
+        if token.kind != 'eof':
+            self.pos += 1
+        return token
+
+    def at_keyword(self, *words: str) -> bool:
+        return self.peek().keyword in words
+
+    def accept_keyword(self, *words: str) -> bool:
+        if self.at_keyword(*words):
+            self.pos += 1
+            return True
+        return False
+
+    def expect_keyword(self, word: str):
+        if not self.accept_keyword(word):
+            raise UnsupportedQueryError(f"Expected {word}, found {self.peek().value or 'end of query'!r}")
+
+    def at_op(self, *ops: str) -> bool:
+        token = self.peek()
+        return token.kind == 'op' and token.value in ops
+
+    def accept_op(self, *ops: str) -> Optional[str]:
+        if self.at_op(*ops):
+            return self.next().value
+        return None
+
+    def expect_op(self, op: str):
+        if not self.accept_op(op):
+            raise UnsupportedQueryError(f"Expected {op!r}, found {self.peek().value or 'end of query'!r}")
+
+    def identifier(self) -> str:
+        token = self.peek()
+        if token.kind == 'qident' or (token.kind == 'ident' and token.value not in _RESERVED):
+            self.pos += 1
+            return token.value
+        raise UnsupportedQueryError(f"Expected an identifier, found {token.value or 'end of query'!r}")
+
+    def integer(self, clause: str) -> int:
+        token = self.next()
+        if token.kind != 'number' or not token.value.isdigit():
+            raise UnsupportedQueryError(f"{clause} must be a non-negative integer literal")
+        return int(token.value)
+
+    # Statement
+
+    def parse_select(self) -> SelectStatement:
+        if self.at_keyword('with'):
+            raise UnsupportedQueryError("WITH (CTE) queries are not supported")
+        self.expect_keyword('select')
+        distinct = self.accept_keyword('distinct')
+        if distinct and self.at_keyword('on'):
+            raise UnsupportedQueryError("DISTINCT ON is not supported")
+        self.accept_keyword('all')
+
+        items = [self.select_item()]
+        while self.accept_op(','):
+            items.append(self.select_item())
+
+        if not self.accept_keyword('from'):
+            raise UnsupportedQueryError("SELECT without FROM is not supported")
+        table = self.table_ref()
+        if self.at_op(',') or self.at_keyword('join', 'inner', 'left', 'right', 'full', 'cross', 'natural'):
+            raise UnsupportedQueryError("Joins are not supported")
+
+        where = self.expression() if self.accept_keyword('where') else None
+
+        group_by: List[Any] = []
+        if self.accept_keyword('group'):
+            self.expect_keyword('by')
+            group_by.append(self.expression())
+            while self.accept_op(','):
+                group_by.append(self.expression())
+
+        having = self.expression() if self.accept_keyword('having') else None
+
+        order_by: List[OrderItem] = []
+        if self.accept_keyword('order'):
+            self.expect_keyword('by')
+            order_by.append(self.order_item())
+            while self.accept_op(','):
+                order_by.append(self.order_item())
+
+        limit = offset = None
+        while self.at_keyword('limit', 'offset'):
+            if self.accept_keyword('limit'):
+                if not self.accept_keyword('all'):
+                    limit = self.integer('LIMIT')
+            else:
+                self.next()
+                offset = self.integer('OFFSET')
+                self.accept_keyword('row', 'rows')
+
+        token = self.peek()
+        if token.kind != 'eof':
+            if token.keyword in ('union', 'intersect', 'except'):
+                raise UnsupportedQueryError("Set operations (UNION/INTERSECT/EXCEPT) are not supported")
+            raise UnsupportedQueryError(f"Unexpected {token.value!r} in SELECT")
+
+        return SelectStatement(tuple(items), table, where, tuple(group_by), having,
+                               tuple(order_by), limit, offset, distinct)
+
+    def select_item(self) -> SelectItem:
+        if self.accept_op('*'):
+            return SelectItem(Star())
+        token, following = self.peek(), self.peek(1)
+        if (token.kind in ('ident', 'qident') and following == Token('op', '.')
+                and self.peek(2) == Token('op', '*')):
+            self.pos += 3
+            return SelectItem(Star(token.value))
+        expr = self.expression()
+        alias = None
+        if self.accept_keyword('as'):
+            alias = self.identifier()
+        elif self.peek().kind == 'qident' or (self.peek().kind == 'ident' and self.peek().value not in _RESERVED):
+            alias = self.identifier()
+        return SelectItem(expr, alias)
+
+    def table_ref(self) -> TableRef:
+        if self.at_op('('):
+            raise UnsupportedQueryError("Subqueries in FROM are not supported")
+        name = self.identifier()
+        schema = None
+        if self.accept_op('.'):
+            schema, name = name, self.identifier()
+        if self.at_op('('):
+            raise UnsupportedQueryError("Table functions in FROM are not supported")
+        alias = None
+        if self.accept_keyword('as'):
+            alias = self.identifier()
+        elif self.peek().kind == 'qident' or (self.peek().kind == 'ident' and self.peek().value not in _RESERVED):
+            alias = self.identifier()
+        return TableRef(name, schema, alias)
+
+    def order_item(self) -> OrderItem:
+        expr = self.expression()
+        descending = False
+        if self.accept_keyword('desc'):
+            descending = True
+        else:
+            self.accept_keyword('asc')
+        nulls_first = None
+        if self.accept_keyword('nulls'):
+            if self.accept_keyword('first'):
+                nulls_first = True
+            else:
+                self.expect_keyword('last')
+                nulls_first = False
+        return OrderItem(expr, descending, nulls_first)
+
+    # Expressions, lowest precedence first
+
+    def expression(self):
+        return self.or_expr()
+
+    def or_expr(self):
+        left = self.and_expr()
+        while self.accept_keyword('or'):
+            left = BinaryOp('OR', left, self.and_expr())
+        return left
+
+    def and_expr(self):
+        left = self.not_expr()
+        while self.accept_keyword('and'):
+            left = BinaryOp('AND', left, self.not_expr())
+        return left
+
+    def not_expr(self):
+        if self.accept_keyword('not'):
+            return UnaryOp('NOT', self.not_expr())
+        return self.predicate()
+
+    def predicate(self):
+        left = self.additive()
+        while True:
+            op = self.accept_op(*_COMPARISON_OPS)
+            if op:
+                left = BinaryOp('<>' if op == '!=' else op, left, self.additive())
+                continue
+            if self.accept_keyword('is'):
+                negated = self.accept_keyword('not')
+                if self.accept_keyword('null'):
+                    left = IsTest(left, None, negated)
+                elif self.accept_keyword('true'):
+                    left = IsTest(left, True, negated)
+                elif self.accept_keyword('false'):
+                    left = IsTest(left, False, negated)
+                else:
+                    raise UnsupportedQueryError("Only IS [NOT] NULL/TRUE/FALSE is supported")
+                continue
+            negated = False
+            if self.at_keyword('not') and self.peek(1).keyword in ('between', 'in', 'like', 'ilike'):
+                self.next()
+                negated = True
+            if self.accept_keyword('between'):
+                if self.accept_keyword('symmetric'):
+                    raise UnsupportedQueryError("BETWEEN SYMMETRIC is not supported")
+                low = self.additive()
+                self.expect_keyword('and')
+                left = Between(left, low, self.additive(), negated)
+            elif self.accept_keyword('in'):
+                self.expect_op('(')
+                if self.at_keyword('select', 'with'):
+                    raise UnsupportedQueryError("Subqueries are not supported")
+                items = [self.expression()]
+                while self.accept_op(','):
+                    items.append(self.expression())
+                self.expect_op(')')
+                left = InList(left, tuple(items), negated)
+            elif self.at_keyword('like', 'ilike'):
+                case_insensitive = self.next().keyword == 'ilike'
+                left = Like(left, self.additive(), case_insensitive, negated)
+                if self.at_keyword('escape'):
+                    raise UnsupportedQueryError("LIKE ... ESCAPE is not supported")
+            else:
+                return left
+
+    def additive(self):
+        left = self.multiplicative()
+        while True:
+            op = self.accept_op('+', '-', '||')
+            if not op:
+                return left
+            left = BinaryOp(op, left, self.multiplicative())
+
+    def multiplicative(self):
+        left = self.unary()
+        while True:
+            op = self.accept_op('*', '/', '%')
+            if not op:
+                return left
+            left = BinaryOp(op, left, self.unary())
+
+    def unary(self):
+        if self.accept_op('-'):
+            operand = self.unary()
+            if isinstance(operand, Literal) and isinstance(operand.value, (int, float)):
+                return Literal(-operand.value)
+            return UnaryOp('-', operand)
+        self.accept_op('+')
+        return self.postfix()
+
+    def postfix(self):
+        expr = self.primary()
+        while self.accept_op('::'):
+            type_name = self.identifier()
+            # Multi-word types such as "timestamp with time zone" or "double precision"
+            while self.peek().kind == 'ident' and self.peek().value in ('with', 'without', 'time', 'zone', 'precision', 'varying'):
+                type_name += ' ' + self.next().value
+            expr = Cast(expr, type_name)
+        return expr
+
+    def primary(self):
+        token = self.peek()
+
+        if token.kind == 'number':
+            self.next()
+            text = token.value
+            return Literal(int(text) if text.isdigit() else float(text))
+        if token.kind == 'string':
+            self.next()
+            return Literal(token.value)
+        if self.accept_op('('):
+            if self.at_keyword('select', 'with'):
+                raise UnsupportedQueryError("Subqueries are not supported")
+            expr = self.expression()
+            self.expect_op(')')
+            return expr
+        if token.kind == 'op':
+            raise UnsupportedQueryError(f"Unexpected {token.value!r} in expression")
+        if token.kind == 'eof':
+            raise UnsupportedQueryError("Unexpected end of query")
+
+        if token.kind == 'ident':
+            word = token.value
+            if word == 'null':
+                self.next()
+                return Literal(None)
+            if word in ('true', 'false'):
+                self.next()
+                return Literal(word == 'true')
+            if word == 'case':
+                self.next()
+                return self.case_expr()
+            if word == 'interval' and self.peek(1).kind == 'string':
+                self.next()
+                return Interval(self.next().value)
+            if word in ('current_timestamp', 'current_date', 'localtimestamp') and not self.peek(1) == Token('op', '('):
+                self.next()
+                return FuncCall(word)
+            if word in ('exists', 'any', 'some', 'array') or (word == 'all' and self.peek(1) == Token('op', '(')):
+                raise UnsupportedQueryError(f"{word.upper()} is not supported")
+            if word in ('timestamp', 'timestamptz', 'date') and self.peek(1).kind == 'string':
+                # Typed literal such as TIMESTAMP '2024-01-01'
+                self.next()
+                return Cast(Literal(self.next().value), word)
+            if word in _RESERVED:
+                raise UnsupportedQueryError(f"Unexpected {word.upper()} in expression")
+
+        name = self.identifier()
+        if self.accept_op('('):
+            return self.function_call(name)
+        if self.accept_op('.'):
+            column = self.identifier()
+            if self.at_op('('):
+                raise UnsupportedQueryError("Schema-qualified function calls are not supported")
+            return Column(column, name)
+        return Column(name)
+
+    def function_call(self, name: str) -> FuncCall:
+        if self.accept_op(')'):
+            return FuncCall(name)
+        if self.accept_op('*'):
+            self.expect_op(')')
+            return FuncCall(name, (), False, True)
+        distinct = self.accept_keyword('distinct')
+        args = [self.expression()]
+        while self.accept_op(','):
+            args.append(self.expression())
+        if self.at_keyword('order', 'filter'):
+            raise UnsupportedQueryError("Aggregate ORDER BY/FILTER clauses are not supported")
+        self.expect_op(')')
+        if self.at_keyword('over', 'filter', 'within'):
+            raise UnsupportedQueryError("Window functions are not supported")
+        return FuncCall(name, tuple(args), distinct)
+
+    def case_expr(self) -> Case:
+        operand = None if self.at_keyword('when') else self.expression()
+        whens = []
+        while self.accept_keyword('when'):
+            condition = self.expression()
+            self.expect_keyword('then')
+            whens.append((condition, self.expression()))
+        if not whens:
+            raise UnsupportedQueryError("CASE requires at least one WHEN")
+        default = self.expression() if self.accept_keyword('else') else None
+        self.expect_keyword('end')
+        return Case(tuple(whens), default, operand)
+
+
+@lru_cache(maxsize=256)
+def parse_select(sql: str) -> SelectStatement:
+    """Parse a SELECT statement, raising UnsupportedQueryError outside the supported subset"""
+    return _Parser(sql).parse_select()
+
+
+# --- Tree helpers -----------------------------------------------------------
+
+def walk(node):
+    """Yield node and every expression nested inside it"""
+    yield node
+    if isinstance(node, (Literal, Interval, Column, Star)) or node is None:
+        return
+    if isinstance(node, tuple):
+        for child in node:
+            if isinstance(child, tuple):
+                yield from walk(child)
+
+
+def contains_aggregate(node) -> bool:
+    """True if the expression calls an aggregate function"""
+    return any(isinstance(n, FuncCall) and n.name in AGGREGATE_FUNCTIONS for n in walk(node))
+
+
+def is_aggregate_query(statement: SelectStatement) -> bool:
+    """True if the SELECT groups or aggregates rows"""
+    return bool(statement.group_by or statement.having is not None
+                or any(contains_aggregate(item.expr) for item in statement.items))
+
+
+def column_names(node) -> List[Column]:
+    """All column references inside an expression"""
+    return [n for n in walk(node) if isinstance(n, Column)]
@@ -0,0 +1,230 @@
+"""
+Streaming SQL statement splitter.
+
+Splits PostgreSQL scripts on top-level semicolons while respecting
+quoted strings ('...', E'...'), quoted identifiers ("..."), dollar-quoted
+bodies ($$...$$, $tag$...$tag$), -- line comments and nested /* */ block
+comments. Input is consumed in chunks so large dumps split in bounded
+memory, and every character is scanned a constant number of times.
+"""
+
+import io
+import re
+from typing import Iterator, List, TextIO, Union
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# Lexer states
+_NORMAL = 0
+_SINGLE_QUOTE = 1
+_DOUBLE_QUOTE = 2
+_DOLLAR_QUOTE = 3
+_LINE_COMMENT = 4
+_BLOCK_COMMENT = 5
+
+_NORMAL_SPECIAL = re.compile(r"[;'\"$/-]")
+_ESCAPE_STRING_SPECIAL = re.compile(r"[\\']")
+_BLOCK_COMMENT_SPECIAL = re.compile(r"/\*|\*/")
+# Tag characters are letters, digits (not first), '_' and anything non-ASCII. The classes are
+# written as negated ASCII ranges: a \u0080-\uffff range takes ~10ms to compile at import.
+_DOLLAR_TAG = re.compile(r"\$([^\x00-\x40\x5b-\x5e\x60\x7b-\x7f][^\x00-\x2f\x3a-\x40\x5b-\x5e\x60\x7b-\x7f]*)?\$")
+_DOLLAR_TAG_PREFIX = re.compile(r"\$[^\x00-\x2f\x3a-\x40\x5b-\x5e\x60\x7b-\x7f]*")
+
+
+def _is_identifier_char(char: str) -> bool:
+    return char.isalnum() or char in '_$'
+
+
+class SqlStatementSplitter:
+    """Incremental splitter: feed() text chunks, then finish()"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._history = ""  # last characters consumed before the buffer start
+        self._parts: List[str] = []
+        self._state = _NORMAL
+        self._dollar_delimiter = ""
+        self._comment_depth = 0
+        self._backslash_escapes = False
+
+    def feed(self, chunk: str) -> List[str]:
+        """Consume a chunk and return the statements it completed"""
+        self._buffer += chunk
+        return self._scan(final=False)
+
+    def finish(self) -> List[str]:
+        """Flush the remaining input and return any final statement"""
+        statements = self._scan(final=True)
+        statement = self._take_statement()
+        if statement:
+            statements.append(statement)
+        return statements
+
+    def _take_statement(self) -> str:
+        statement = "".join(self._parts).strip()
+        self._parts = []
+        return statement
+
+    def _preceding(self, buf: str, index: int) -> str:
+        """The (up to) two characters before buf[index], across chunk boundaries"""
+        return (self._history + buf[max(0, index - 2):index])[-2:]
+
+    def _scan(self, final: bool) -> List[str]:
+        buf = self._buffer
+        end = len(buf)
+        pos = 0
+        segment = 0  # start of statement text not yet moved into _parts
+        statements = []
+
+        while pos < end:
+            state = self._state
+
+            if state == _NORMAL:
+                match = _NORMAL_SPECIAL.search(buf, pos)
+                if match is None:
+                    pos = end
+                    break
+                i = match.start()
+                char = buf[i]
+
+                if char == ';':
+                    self._parts.append(buf[segment:i])
+                    statement = self._take_statement()
+                    if statement:
+                        statements.append(statement)
+                    pos = segment = i + 1
+
+                elif char == '-' or char == '/':
+                    if i + 1 >= end and not final:
+                        pos = i  # need the next character to decide
+                        break
+                    following = buf[i + 1] if i + 1 < end else ''
+                    if char == '-' and following == '-':
+                        self._parts.append(buf[segment:i])
+                        self._state = _LINE_COMMENT
+                        pos = segment = i + 2
+                    elif char == '/' and following == '*':
+                        self._parts.append(buf[segment:i])
+                        self._state = _BLOCK_COMMENT
+                        self._comment_depth = 1
+                        pos = segment = i + 2
+                    else:
+                        pos = i + 1
+
+                elif char == "'":
+                    before = self._preceding(buf, i)
+                    # E'...' strings honour backslash escapes; a quote right after
+                    # a closing quote is a doubled '' and keeps the string's mode
+                    if before[-1:] != "'":
+                        self._backslash_escapes = (
+                            before[-1:] in ('e', 'E')
+                            and not _is_identifier_char(before[-2:-1] or ' ')
+                        )
+                    self._state = _SINGLE_QUOTE
+                    pos = i + 1
+
+                elif char == '"':
+                    self._state = _DOUBLE_QUOTE
+                    pos = i + 1
+
+                else:  # '$'
+                    before = self._preceding(buf, i)
+                    if before and _is_identifier_char(before[-1]):
+                        pos = i + 1  # part of an identifier such as foo$bar
+                        continue
+                    tag = _DOLLAR_TAG.match(buf, i)
+                    if tag is not None:
+                        self._dollar_delimiter = tag.group(0)
+                        self._state = _DOLLAR_QUOTE
+                        pos = tag.end()
+                    elif not final and _DOLLAR_TAG_PREFIX.match(buf, i).end() == end:
+                        pos = i  # tag may continue in the next chunk
+                        break
+                    else:
+                        pos = i + 1  # positional parameter like $1
+
+            elif state == _SINGLE_QUOTE:
+                if self._backslash_escapes:
+                    match = _ESCAPE_STRING_SPECIAL.search(buf, pos)
+                    if match is None:
+                        pos = end
+                        break
+                    i = match.start()
+                    if buf[i] == '\\':
+                        if i + 1 >= end and not final:
+                            pos = i
+                            break
+                        pos = i + 2
+                        continue
+                else:
+                    i = buf.find("'", pos)
+                    if i < 0:
+                        pos = end
+                        break
+                # A doubled '' re-enters the string on the next quote
+                self._state = _NORMAL
+                pos = i + 1
+
+            elif state == _DOUBLE_QUOTE:
+                i = buf.find('"', pos)
+                if i < 0:
+                    pos = end
+                    break
+                self._state = _NORMAL
+                pos = i + 1
+
+            elif state == _DOLLAR_QUOTE:
+                delimiter = self._dollar_delimiter
+                i = buf.find(delimiter, pos)
+                if i < 0:
+                    # Keep a tail that could hold the start of the closing tag
+                    pos = end if final else max(pos, end - len(delimiter) + 1)
+                    break
+                self._state = _NORMAL
+                pos = i + len(delimiter)
+
+            elif state == _LINE_COMMENT:
+                i = buf.find('\n', pos)
+                if i < 0:
+                    pos = segment = end
+                    break
+                self._state = _NORMAL
+                pos = segment = i  # the newline stays as whitespace
+
+            else:  # _BLOCK_COMMENT
+                match = _BLOCK_COMMENT_SPECIAL.search(buf, pos)
+                if match is None:
+                    pos = segment = end if final else max(pos, end - 1)
+                    break
+                if match.group(0) == '/*':
+                    self._comment_depth += 1
+                else:
+                    self._comment_depth -= 1
+                pos = segment = match.end()
+                if self._comment_depth == 0:
+                    self._state = _NORMAL
+                    self._parts.append(' ')
+
+        if segment < pos:
+            self._parts.append(buf[segment:pos])
+        self._history = (self._history + buf[max(0, pos - 2):pos])[-2:]
+        self._buffer = buf[pos:]
+        return statements
+
+
+def iter_sql_statements(source: Union[str, TextIO],
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """Yield the statements of a SQL script (string or text file object), comments removed"""
+    reader = io.StringIO(source) if isinstance(source, str) else source
+    splitter = SqlStatementSplitter()
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            break
+        yield from splitter.feed(chunk)
+    yield from splitter.finish()
+
+
+def split_sql_statements(sql_content: str) -> List[str]:
+    """Split a SQL script held in memory into a list of statements"""
+    return list(iter_sql_statements(sql_content))
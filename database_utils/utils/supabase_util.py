@@ -1,404 +1,522 @@
 import os
+import time
 import logging
-import requests
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
-from supabase import create_client, Client
-
-class SupabaseUtil:
-    def __init__(self):
-        # Try to load from parent directory first, then current directory
-        env_file_found = None
-        if os.path.exists('../.env.local'):
-            load_dotenv('../.env.local')
-            env_file_found = '../.env.local'
-        elif os.path.exists('.env.local'):
-            load_dotenv('.env.local')
-            env_file_found = '.env.local'
-        else:
-            load_dotenv()  # Try default .env file
-            env_file_found = '.env (default)'
-        
-        self.url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
-        self.service_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-        self.client: Optional[Client] = None
+import itertools
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Dict, Any, Iterable, Iterator, List, Sequence, Sized, Tuple
+from .query_core import (
+    DEFAULT_INSERT_BATCH_SIZE, DEFAULT_PAGE_SIZE, InsertRun, SupabaseQueryError, auth_headers,
+    build_select_request, group_statements, iter_chunks, plan_batches, route_query, summarize_results
+)
+from .query_flows import Connect, Flow, QueryFlows
+from .postgrest_query import PostgrestRequest, quote_name, table_request
+from .query_metrics import QueryMetrics, current_metrics, phase, record_request, set_path
+from .request_scheduler import IDEMPOTENT_METHODS, RequestScheduler, parse_retry_after
+from .result_cache import ResultCache
+from .result_writers import OutputError
+from .rpc_discovery import RpcEndpointCache, discover_tables
+from .sql_select import UnsupportedQueryError
+from .sql_splitter import iter_sql_statements, split_sql_statements
+from .table_export import CHUNKS_PER_JOB, ExportFile, ExportPart, export_format, key_ranges
+
+if TYPE_CHECKING:
+    import requests
+
+# Marks the end of a row iterator
+_END = object()
+
+
+@lru_cache(maxsize=None)
+def _configure_logging():
+    """Set up console logging once per process"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+class SupabaseUtil(QueryFlows):
+    """Runs SQL against a Supabase project over a pooled requests session
+
+    How statements are executed is shared with AsyncSupabaseUtil through QueryFlows;
+    this class sends the requests, runs statements on threads and streams results.
+    """
+
+    def __init__(self, pool_size: int = 10, timeout: float = 30.0,
+                 max_retries: int = 3, backoff_factor: float = 0.5,
+                 connection_ttl: float = 300.0, rpc_cache: Optional[RpcEndpointCache] = None,
+                 insert_batch_size: int = DEFAULT_INSERT_BATCH_SIZE, result_cache: Optional[ResultCache] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        super().__init__(pool_size, timeout, max_retries, backoff_factor, connection_ttl, rpc_cache,
+                         insert_batch_size, result_cache, scheduler)
+        self._client = None
+        # requests (and the supabase SDK) are imported on first use, which keeps short runs fast to start
+        self._session: Optional['requests.Session'] = None
+        self._session_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
         self.setup_logging()
-        
-    
-    def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def client(self):
+        """supabase-py client for the same project, created on first use"""
+        if self._client is None:
+            from supabase import create_client
+            self._client = create_client(self.url, self.service_key)
+        return self._client
+
+    def _get_session(self) -> 'requests.Session':
+        """Return the pooled keep-alive session, creating it on first use"""
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self) -> 'requests.Session':
+        """Build a session with a sized connection pool and retry policy"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        # Failed connects never reached the server and are retried here; status and read
+        # retries are left to the scheduler, which knows which requests are idempotent
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=0,
+            backoff_factor=self.backoff_factor,
+            respect_retry_after_header=False,
+            raise_on_status=False
         )
-        self.logger = logging.getLogger(__name__)
-    
-    def connect_to_database(self) -> bool:
-        """Test database connection"""
-        try:
-            if not self.url or not self.service_key:
-                self.logger.error("Missing NEXT_PUBLIC_SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
-                return False
-            
-            # Test connection with a simple REST API call
-            headers = {
-                'apikey': self.service_key,
-                'Authorization': f'Bearer {self.service_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Test with a simple API call
-            test_url = f"{self.url}/rest/v1/"
-            response = requests.get(test_url, headers=headers)
-            
-            if response.status_code == 200:
-                self.logger.info("Successfully connected to Supabase database")
-                return True
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self._auth_headers())
+        return session
+
+    def _auth_headers(self) -> Dict[str, str]:
+        """Headers sent with every REST API request"""
+        return auth_headers(self.service_key)
+
+    def _request(self, method: str, path: str, idempotent: Optional[bool] = None,
+                 **kwargs) -> 'requests.Response':
+        """Send a request to the Supabase REST API over the pooled session
+
+        The scheduler paces requests and retries 429 responses; 5xx responses and
+        dropped connections are only retried when idempotent (by default GET and HEAD).
+        """
+        import requests
+
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in itertools.count():
+            with phase('throttle'):
+                ticket = self.scheduler.acquire()
+            try:
+                with phase('http'):
+                    response = self._get_session().request(method, f"{self.url}{path}", **kwargs)
+            except requests.ConnectionError:
+                self.scheduler.release(ticket)
+                # Re-probe before the next statement. The session is shared with other threads and
+                # stays open: the pool discards the broken connection and opens a new one
+                self._connected_at = None
+                delay = self.scheduler.next_retry(attempt, None, idempotent)
+                if delay is None:
+                    raise
+                self.logger.warning(f"Connection lost during {method} {path}, retrying in {delay:.1f}s")
+            except BaseException:
+                # Any other error (a broken body, an invalid URL, an interrupt): give the slot back
+                self.scheduler.release(ticket)
+                raise
             else:
-                self.logger.error(f"Connection test failed: HTTP {response.status_code}")
-                return False
-                
+                self.scheduler.release(ticket, response.status_code,
+                                       parse_retry_after(response.headers.get('Retry-After')))
+                if current_metrics() is not None:
+                    record_request(len(response.request.body or b''), len(response.content))
+                delay = self.scheduler.next_retry(attempt, response.status_code, idempotent)
+                if delay is None:
+                    return response
+                self.logger.warning(f"HTTP {response.status_code} from {method} {path}, retrying in {delay:.1f}s")
+            with phase('throttle'):
+                time.sleep(delay)
+
+    def _run(self, flow: Flow) -> Any:
+        """Drive a flow from query_flows on this thread and return its result"""
+        send, value = flow.send, None
+        while True:
+            try:
+                instruction = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                if isinstance(instruction, Connect):
+                    value = self.connect_to_database()
+                else:
+                    value = self._request(instruction.method, instruction.path, instruction.idempotent,
+                                          params=instruction.params, headers=instruction.headers,
+                                          json=instruction.json, data=instruction.body)
+                send = flow.send
+            except BaseException as e:
+                value, send = e, flow.throw
+
+    def close(self):
+        """Close the pooled session and release its connections"""
+        self._connected_at = None
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _measured_rows(self, metrics: QueryMetrics, rows: Iterator[Any]) -> Iterator[Any]:
+        """Pass rows through, counting them and the requests made to fetch them"""
+        count = 0
+        result = {"success": True}
+        try:
+            while True:
+                with metrics.active():
+                    row = next(rows, _END)
+                if row is _END:
+                    break
+                count += 1
+                yield row
         except Exception as e:
-            self.logger.error(f"Failed to connect to database: {e}")
-            return False
-    
-    def execute_sql_file(self, file_path: str) -> Dict[str, Any]:
-        """Execute SQL file against the database"""
+            result = {"success": False, "error": str(e)}
+            raise
+        finally:
+            metrics.rows = count
+            self._finish_metrics(metrics, result)
+
+    def setup_logging(self):
+        _configure_logging()
+        self.logger = logging.getLogger(__name__)
+
+    def connect_to_database(self, force: bool = False) -> bool:
+        """Test database connection, reusing a recent successful probe unless forced"""
+        if not force and self.is_connected:
+            return True
+        with self._connect_lock:
+            return self._run(self._probe_connection(force))
+
+    def execute_sql_file(self, file_path: str, jobs: int = 1, single_transaction: bool = False,
+                         transaction_chunk_size: Optional[int] = None) -> Dict[str, Any]:
+        """Execute SQL file against the database, optionally running independent statements on `jobs` threads"""
         try:
             if not os.path.exists(file_path):
                 return {"success": False, "error": f"File {file_path} not found"}
-            
-            with open(file_path, 'r', encoding='utf-8') as file:
-                sql_content = file.read().strip()
-            
-            if not sql_content:
-                return {"success": False, "error": "SQL file is empty"}
-            
+
             self.logger.info(f"Executing SQL file: {file_path}")
-            
-            # Split the SQL content into individual queries
-            queries = self._split_sql_queries(sql_content)
-            
-            if len(queries) == 1:
-                # Single query - execute normally
-                return self.execute_raw_query(queries[0])
-            else:
-                # Multiple queries - execute each one
-                return self.execute_multiple_queries(queries)
-            
+
+            if single_transaction:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    return self.execute_transaction(iter_sql_statements(file), transaction_chunk_size)
+
+            with open(file_path, 'r', encoding='utf-8') as file:
+                # Stream statements from the file instead of reading it whole
+                queries = iter_sql_statements(file)
+                first = next(queries, None)
+                if first is None:
+                    return {"success": False, "error": "SQL file is empty"}
+
+                second = next(queries, None)
+                if second is None:
+                    # Single query - execute normally
+                    return self.execute_raw_query(first)
+                else:
+                    # Multiple queries - execute each one
+                    return self.execute_multiple_queries(itertools.chain([first, second], queries), jobs=jobs)
+
         except Exception as e:
             self.logger.error(f"Failed to execute SQL file {file_path}: {e}")
             return {"success": False, "error": str(e)}
-    
+
+    def execute_transaction(self, queries: Iterable[str], chunk_size: Optional[int] = None) -> Dict[str, Any]:
+        """Execute statements atomically with one exec_sql call per chunk (default: one call for all)
+
+        Each chunk is committed or rolled back as a whole, and results use the
+        execute_multiple_queries format. After a failed chunk the remaining statements
+        are reported as not executed. Rows returned by SELECTs are discarded in this mode.
+        Accepts plain SQL strings or (query_number, query) pairs.
+        """
+        return self._run(self._execute_transaction(queries, chunk_size))
+
+    def iter_sql_file(self, file_path: str) -> Iterator[str]:
+        """Yield the statements of a SQL file as they are read"""
+        with open(file_path, 'r', encoding='utf-8') as file:
+            yield from iter_sql_statements(file)
+
+    def stream_query(self, query: str, page_size: int = DEFAULT_PAGE_SIZE,
+                     query_number: Optional[int] = None) -> Dict[str, Any]:
+        """Like execute_raw_query, but plain SELECT results come back as a lazy row iterator
+
+        For SELECTs served from a table endpoint, "data" is a generator that fetches
+        page_size rows at a time (see iter_select). Other statements return the usual result.
+        Metrics of a streamed SELECT are reported once its rows have been read.
+        """
+        metrics = self._start_metrics(query, query_number)
+        if metrics is None:
+            return self._stream_query(query, page_size)
+        with metrics.active():
+            result = self._stream_query(query, page_size)
+        if result["success"] and isinstance(result.get("data"), Iterator):
+            result["data"] = self._measured_rows(metrics, result["data"])
+        else:
+            self._finish_metrics(metrics, result)
+        return result
+
+    def is_cached(self, query: str) -> bool:
+        """True if stream_query would answer the statement from the result cache, without any request"""
+        cleaned_query = self._clean_sql_query(query)
+        return (route_query(cleaned_query) == 'select' and self._cached_tables(cleaned_query) is not None
+                and self.result_cache.contains(self.url, cleaned_query))
+
+    def _stream_query(self, query: str, page_size: int) -> Dict[str, Any]:
+        cleaned_query = self._clean_sql_query(query)
+        if route_query(cleaned_query) != 'select':
+            return self.execute_raw_query(query)
+
+        # A cache hit needs no connection at all
+        tables = self._cached_tables(cleaned_query)
+        if tables is not None:
+            hit, data = self.result_cache.get(self.url, cleaned_query)
+            if hit:
+                set_path('cache')
+                return {"success": True, "data": data}
+        if not self.connect_to_database():
+            return {"success": False, "error": "Database connection failed"}
+        try:
+            build_select_request(cleaned_query)
+        except UnsupportedQueryError as e:
+            return {"success": False, "error": f"Cannot translate SELECT to a PostgREST request: {e}"}
+        set_path('select')
+        rows = self.iter_select(cleaned_query, page_size=page_size)
+        if tables is not None:
+            # Cache the rows once the caller has read them all
+            rows = self.result_cache.tee(self.url, cleaned_query, tables, rows)
+        return {"success": True, "data": rows}
+
+    def iter_select(self, query: str, page_size: int = DEFAULT_PAGE_SIZE,
+                    key_column: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield the rows of a plain SELECT page by page, keeping memory flat
+
+        Pages use limit/offset, or keyset pagination on key_column (e.g. "id") when
+        given, which stays fast and consistent on large, growing tables.
+        Raises SupabaseQueryError if a page request fails.
+        """
+        request = build_select_request(self._clean_sql_query(query))
+        yield from self._iter_pages(request, page_size, key_column)
+
+    def _iter_pages(self, request: PostgrestRequest, page_size: int = DEFAULT_PAGE_SIZE,
+                    key_column: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield rows from a table endpoint one page at a time"""
+        paginator = self._run(self._paginator(request, page_size, key_column))
+        while not paginator.done:
+            yield from self._run(self._fetch_page(request, paginator))
+
     def _split_sql_queries(self, sql_content: str) -> list:
         """Split SQL content into individual queries"""
-        # Remove comments first
-        lines = sql_content.split('\n')
-        clean_lines = []
-        
-        for line in lines:
-            if not line.strip().startswith('--'):
-                clean_lines.append(line)
-        
-        clean_content = '\n'.join(clean_lines)
-        
-        # Split by semicolons, but be careful about semicolons in strings
-        queries = []
-        current_query = ""
-        in_string = False
-        string_char = None
-        
-        for char in clean_content:
-            if char in ["'", '"'] and (not in_string or char == string_char):
-                in_string = not in_string
-                if in_string:
-                    string_char = char
-                else:
-                    string_char = None
-                current_query += char
-            elif char == ';' and not in_string:
-                current_query = current_query.strip()
-                if current_query:
-                    queries.append(current_query)
-                current_query = ""
-            else:
-                current_query += char
-        
-        # Add the last query if it doesn't end with semicolon
-        current_query = current_query.strip()
-        if current_query:
-            queries.append(current_query)
-        
-        return [q for q in queries if q.strip()]
-    
-    def execute_multiple_queries(self, queries: list) -> Dict[str, Any]:
-        """Execute multiple SQL queries and return combined results"""
+        return split_sql_statements(sql_content)
+
+    def execute_multiple_queries(self, queries: Iterable[str], jobs: int = 1) -> Dict[str, Any]:
+        """Execute multiple SQL queries (any iterable, consumed lazily) and return combined results
+
+        With jobs > 1, independent statements run concurrently on up to `jobs` threads.
+        DDL and statements touching the same tables are ordering barriers, and results
+        keep their query_number order either way. Consecutive simple INSERTs into the
+        same table are sent as bulk POSTs of up to insert_batch_size rows.
+        """
         try:
-            results = []
-            all_successful = True
-            
-            for i, query in enumerate(queries, 1):
-                self.logger.info(f"Executing query {i}/{len(queries)}")
-                result = self.execute_raw_query(query)
-                
-                query_result = {
-                    "query_number": i,
-                    "query": query[:100] + "..." if len(query) > 100 else query,
-                    "success": result["success"],
-                    "data": result.get("data"),
-                    "error": result.get("error")
-                }
-                
-                results.append(query_result)
-                
-                if not result["success"]:
-                    all_successful = False
-                    self.logger.error(f"Query {i} failed: {result.get('error')}")
-            
-            return {
-                "success": all_successful,
-                "data": results,
-                "total_queries": len(queries),
-                "successful_queries": sum(1 for r in results if r["success"])
-            }
-            
+            total = len(queries) if isinstance(queries, Sized) else None
+            units = group_statements(queries, self.insert_batch_size)
+
+            if jobs > 1:
+                results = self._execute_queries_concurrently(units, jobs, total)
+            else:
+                results = [entry for unit in units for entry in self._run(self._execute_unit(unit, total))]
+
+            return summarize_results(results)
+
         except Exception as e:
             self.logger.error(f"Failed to execute multiple queries: {e}")
             return {"success": False, "error": str(e)}
-    
+
+    def _execute_queries_concurrently(self, units: Iterable[Any], jobs: int,
+                                      total: Optional[int]) -> list:
+        """Run statements in dependency-safe batches on a bounded thread pool"""
+        # Probe once up front so worker threads never race on the health check
+        self.connect_to_database()
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        results = []
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for batch in plan_batches(units, jobs, self._linked_tables()):
+                for entries in pool.map(lambda unit: self._run(self._execute_unit(unit, total)), batch):
+                    results.extend(entries)
+
+        return results
+
+    def stream_queries(self, queries: Iterable[str],
+                       page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """Execute statements in order, yielding (query_number, query, result) as each one finishes
+
+        SELECT results are lazy row iterators as in stream_query, and consecutive simple
+        INSERTs are sent as bulk POSTs.
+        """
+        for unit in group_statements(queries, self.insert_batch_size):
+            if isinstance(unit, InsertRun) or self.scheduler.budget_exhausted:
+                numbered = unit.queries if isinstance(unit, InsertRun) else [unit]
+                for (i, query), entry in zip(numbered, self._run(self._execute_unit(unit))):
+                    yield i, query, entry
+            else:
+                i, query = unit
+                yield i, query, self.stream_query(query, page_size=page_size, query_number=i)
+
     def execute_raw_query(self, query: str) -> Dict[str, Any]:
         """Execute raw SQL query using REST API"""
+        return self._run(self._measure(query, None, self._execute_raw_query(query)))
+
+    def bulk_insert(self, table: str, rows: Iterable[Dict[str, Any]], batch_size: Optional[int] = None,
+                    on_conflict: Optional[str] = None, conflict_columns: Sequence[str] = ()) -> Dict[str, Any]:
+        """Insert dict rows from any iterable (consumed lazily) with one JSON-array POST per batch
+
+        on_conflict="ignore" skips rows that collide with conflict_columns (default: the
+        primary key), "merge" upserts them. Keys missing from some rows of a batch are
+        inserted as NULL. Batches already sent stay committed if a later one fails.
+        """
+        if not self.connect_to_database():
+            return {"success": False, "error": "Database connection failed"}
+
+        inserted = requests_sent = 0
         try:
-            if not self.connect_to_database():
-                return {"success": False, "error": "Database connection failed"}
-            
-            # Clean and prepare the query
-            query = query.strip()
-            if not query:
-                return {"success": False, "error": "Empty query"}
-            
-            # Use REST API to execute SQL
-            return self._execute_ddl_query(query)
-                
-        except Exception as e:
-            self.logger.error(f"Failed to execute query: {e}")
-            return {"success": False, "error": str(e)}
-    
-    def _execute_ddl_query(self, query: str) -> Dict[str, Any]:
-        """Execute SQL queries using REST API"""
-        try:
-            headers = {
-                'apikey': self.service_key,
-                'Authorization': f'Bearer {self.service_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Clean the query by removing comments and finding the actual SQL
-            cleaned_query = self._clean_sql_query(query)
-            
-            # For SELECT queries, check if it's a complex query that needs simulation
-            if cleaned_query.upper().strip().startswith('SELECT'):
-                # Check if it's a complex query (COUNT, AVG, etc.) that needs simulation
-                complex_keywords = ['COUNT(', 'AVG(', 'SUM(', 'MIN(', 'MAX(', 'GROUP BY', 'HAVING', 'CASE WHEN', 'BETWEEN', 'NOW()']
-                if any(keyword in cleaned_query.upper() for keyword in complex_keywords):
-                    # Skip RPC and go directly to simulation for complex queries
-                    return self._simulate_complex_query(cleaned_query)
-                else:
-                    return self._execute_select_query(cleaned_query, headers)
-            else:
-                # For DDL/DML queries, try RPC functions
-                return self._execute_rpc_query(cleaned_query, headers)
-                
-        except Exception as e:
-            return {"success": False, "error": f"Query execution failed: {str(e)}"}
-    
-    def _clean_sql_query(self, query: str) -> str:
-        """Remove comments and clean up the SQL query"""
-        lines = query.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            # Remove comments (lines starting with --)
-            if not line.strip().startswith('--'):
-                cleaned_lines.append(line)
-        
-        # Join lines and clean up whitespace
-        cleaned_query = '\n'.join(cleaned_lines).strip()
-        
-        # If empty, return original
-        if not cleaned_query:
-            return query.strip()
-            
-        return cleaned_query
-    
-    def _execute_select_query(self, query: str, headers: Dict[str, str]) -> Dict[str, Any]:
-        """Execute SELECT queries by extracting table name and using REST API"""
-        try:
-            # Simple table name extraction for basic SELECT queries
-            import re
-            match = re.search(r'FROM\s+(\w+)', query.upper())
-            if match:
-                table_name = match.group(1).lower()  # Convert to lowercase for Supabase
-                # Use the table endpoint to get data
-                table_url = f"{self.url}/rest/v1/{table_name}"
-                
-                # Extract WHERE clause and other conditions
-                where_clause = ""
-                if "WHERE" in query.upper():
-                    where_match = re.search(r'WHERE\s+(.+?)(?:\s+ORDER\s+BY|\s+GROUP\s+BY|\s+LIMIT|$)', query.upper())
-                    if where_match:
-                        where_clause = where_match.group(1)
-                
-                # Add query parameters for Supabase REST API
-                params = {}
-                if where_clause:
-                    # Convert WHERE clause to Supabase query parameters
-                    where_clause_upper = where_clause.upper()
-                    if "IS_ACTIVE = TRUE" in where_clause_upper:
-                        params["is_active"] = "eq.true"
-                    elif "IS_ACTIVE = FALSE" in where_clause_upper:
-                        params["is_active"] = "eq.false"
-                
-                # Add ORDER BY parameter if present
-                if "ORDER BY" in query.upper():
-                    order_match = re.search(r'ORDER BY\s+(\w+)(?:\s+(ASC|DESC))?', query.upper())
-                    if order_match:
-                        column = order_match.group(1).lower()  # Convert to lowercase
-                        direction = (order_match.group(2) or "asc").lower()  # Convert to lowercase
-                        params["order"] = f"{column}.{direction}"
-                
-                # Make the request
-                response = requests.get(table_url, headers=headers, params=params)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return {"success": True, "data": data}
-                else:
-                    return {"success": False, "error": f"Table query failed: HTTP {response.status_code} - {response.text}"}
-            else:
-                return {"success": False, "error": "Could not extract table name from SELECT query"}
-                
-        except Exception as e:
-            return {"success": False, "error": f"SELECT query failed: {str(e)}"}
-    
-    def _execute_rpc_query(self, query: str, headers: Dict[str, str]) -> Dict[str, Any]:
-        """Execute DDL/DML queries using RPC functions"""
-        try:
-            # Try multiple endpoints for SQL execution
-            endpoints_to_try = [
-                f"{self.url}/rest/v1/rpc/exec_sql",
-                f"{self.url}/rest/v1/rpc/execute_sql"
-            ]
-            
-            payloads_to_try = [
-                {"sql": query},
-                {"query": query}
-            ]
-            
-            for endpoint in endpoints_to_try:
-                for payload in payloads_to_try:
-                    try:
-                        response = requests.post(endpoint, headers=headers, json=payload)
-                        if response.status_code == 200:
-                            result_data = response.json()
-                            # Handle different response formats
-                            if isinstance(result_data, str):
-                                # If it's a string, try to parse as JSON
-                                try:
-                                    import json
-                                    parsed_data = json.loads(result_data)
-                                    return {"success": True, "data": parsed_data}
-                                except:
-                                    return {"success": True, "data": result_data}
-                            else:
-                                return {"success": True, "data": result_data}
-                        elif response.status_code == 201:
-                            # Don't return generic success for complex queries, try simulation instead
-                            if any(keyword in query.upper() for keyword in ['COUNT(', 'AVG(', 'SUM(', 'MIN(', 'MAX(', 'BETWEEN', 'CASE WHEN']):
-                                return self._simulate_complex_query(query)
-                            else:
-                                return {"success": True, "data": "Query executed successfully"}
-                    except Exception as e:
-                        continue
-            
-            # If RPC fails, try to simulate complex query results for testing
-            return self._simulate_complex_query(query)
-                
+            for chunk in iter_chunks(rows, batch_size or self.insert_batch_size or DEFAULT_INSERT_BATCH_SIZE):
+                self._run(self._insert_chunk(table, chunk, on_conflict, conflict_columns))
+                inserted += len(chunk)
+                requests_sent += 1
         except Exception as e:
-            return {"success": False, "error": f"RPC execution failed: {str(e)}"}
-    
-    def _simulate_complex_query(self, query: str) -> Dict[str, Any]:
-        """Simulate complex query results for testing when RPC is not available"""
-        query_upper = query.upper()
-        
-        # Get all data first for calculations
-        headers = {
-            'apikey': self.service_key,
-            'Authorization': f'Bearer {self.service_key}',
-            'Content-Type': 'application/json'
-        }
-        
+            return self._bulk_insert_done(table, inserted, requests_sent, e)
+        return self._bulk_insert_done(table, inserted, requests_sent)
+
+    def aggregate_query(self, query: str, page_size: int = DEFAULT_PAGE_SIZE,
+                        key_column: Optional[str] = None) -> Dict[str, Any]:
+        """Run an aggregate SELECT (COUNT/SUM/AVG/MIN/MAX, GROUP BY, HAVING, DISTINCT) locally
+
+        WHERE filters are pushed down and only the referenced columns are fetched, page by
+        page, into the columnar aggregate engine. Pass key_column (e.g. "id") to scan large
+        tables with keyset pagination.
+        """
+        return self._run(self._aggregate_query(query, page_size, key_column))
+
+    def export_table(self, table: str, path: str, fmt: Optional[str] = None, jobs: int = 4,
+                     key_column: str = 'id', page_size: int = DEFAULT_PAGE_SIZE,
+                     watermark_column: Optional[str] = None, since: Any = None,
+                     compression: Optional[str] = None) -> Dict[str, Any]:
+        """Dump a table to a Parquet, CSV or JSON Lines file, fetching key ranges on `jobs` threads
+
+        An integer key_column range is split into chunks that are streamed page by page into
+        part files and joined into path once every chunk has succeeded; other key types are
+        read in one scan. fmt defaults to the file extension (.parquet, .csv[.gz], .jsonl[.gz]).
+        With watermark_column (e.g. "created_at"), only rows newer than `since` are exported,
+        up to the newest value when the export starts, which is returned as "watermark" to pass
+        as `since` next time. No file is written when no rows match.
+        """
         try:
-            response = requests.get(f"{self.url}/rest/v1/db_utils_test_table", headers=headers)
-            if response.status_code != 200:
-                return {"success": False, "error": "Could not fetch data for simulation"}
-            
-            all_data = response.json()
-            
-            # Query 2: SELECT COUNT(*) as total_test_records FROM db_utils_test_table
-            if "COUNT(*)" in query_upper and "TOTAL_TEST_RECORDS" in query_upper and "WHERE" not in query_upper:
-                count = len(all_data)
-                return {"success": True, "data": [{"total_test_records": count}]}
-            
-            # Query 3: SELECT COUNT(*) as active_test_records FROM db_utils_test_table WHERE is_active = true
-            elif "COUNT(*)" in query_upper and "ACTIVE_TEST_RECORDS" in query_upper and "IS_ACTIVE = TRUE" in query_upper:
-                count = sum(1 for row in all_data if row.get('is_active') == True)
-                return {"success": True, "data": [{"active_test_records": count}]}
-            
-            # Query 4: SELECT test_name, test_value, test_description FROM db_utils_test_table WHERE test_value BETWEEN 200 AND 600 ORDER BY test_value
-            elif "BETWEEN" in query_upper and "200" in query and "600" in query:
-                filtered_data = [row for row in all_data if 200 <= row.get('test_value', 0) <= 600]
-                # Sort by test_value
-                filtered_data.sort(key=lambda x: x.get('test_value', 0))
-                # Return only selected columns
-                result = []
-                for row in filtered_data:
-                    result.append({
-                        "test_name": row.get("test_name"),
-                        "test_value": row.get("test_value"),
-                        "test_description": row.get("test_description")
-                    })
-                return {"success": True, "data": result}
-            
-            # Query 5: Statistics query with COUNT, AVG, MIN, MAX, and CASE WHEN
-            elif "AVG(TEST_VALUE)" in query_upper and "MIN(TEST_VALUE)" in query_upper and "MAX(TEST_VALUE)" in query_upper:
-                values = [row.get('test_value', 0) for row in all_data if row.get('test_value') is not None]
-                if values:
-                    active_count = sum(1 for row in all_data if row.get('is_active') == True)
-                    stats = {
-                        "total_records": len(all_data),
-                        "average_value": round(sum(values) / len(values), 2),
-                        "min_value": min(values),
-                        "max_value": max(values),
-                        "active_count": active_count
-                    }
-                    return {"success": True, "data": [stats]}
-            
-            # Query 6: SELECT test_name, test_value, created_at FROM db_utils_test_table WHERE created_at >= NOW() - INTERVAL '1 hour'
-            elif "CREATED_AT" in query_upper and "NOW()" in query_upper and "INTERVAL" in query_upper:
-                # Since all records were created recently (within the last hour), return all records
-                # but only with selected columns
-                result = []
-                for row in all_data:
-                    result.append({
-                        "test_name": row.get("test_name"),
-                        "test_value": row.get("test_value"),
-                        "created_at": row.get("created_at")
-                    })
-                return {"success": True, "data": result}
-            
-            # Default fallback - return all data for any other SELECT query
-            else:
-                return {"success": True, "data": all_data}
-            
+            fmt = export_format(path, fmt)
+            if not self.connect_to_database():
+                return {"success": False, "error": "Database connection failed"}
+
+            request = self._table_request(table)
+            filters: List[Tuple[str, str]] = []
+            watermark = since
+            if watermark_column:
+                if since is not None:
+                    filters.append((quote_name(watermark_column), f"gt.{since}"))
+                watermark = self._edge_value(request, watermark_column, filters, descending=True)
+                if watermark is None:
+                    return {"success": True, "data": {"path": None, "rows": 0, "chunks": 0, "watermark": since}}
+                # Rows added while the export runs are left for the next one
+                filters.append((quote_name(watermark_column), f"lte.{watermark}"))
+            low = self._edge_value(request, key_column, filters)
+            if low is None:
+                return {"success": True, "data": {"path": None, "rows": 0, "chunks": 0, "watermark": since}}
+            ranges = key_ranges(low, self._edge_value(request, key_column, filters, descending=True),
+                                jobs * CHUNKS_PER_JOB, min_span=page_size)
+            request = PostgrestRequest(request.path, request.params + filters, request.headers)
+            self.logger.info(f"Exporting {table} in {len(ranges)} chunks on {min(jobs, len(ranges))} threads")
+
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ExportFile(path, fmt, compression) as output, \
+                    ThreadPoolExecutor(max_workers=min(jobs, len(ranges))) as pool:
+                futures = [pool.submit(self._export_range, request, key_column, key_range, output.part(i), page_size)
+                           for i, key_range in enumerate(ranges)]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                size = output.commit()
+                rows = output.rows
+
+        except (SupabaseQueryError, OutputError) as e:
+            return {"success": False, "error": f"Export of {table} failed: {e}"}
         except Exception as e:
-            return {"success": False, "error": f"Query simulation failed: {str(e)}"}
+            return {"success": False, "error": f"Export of {table} failed: {str(e)}"}
+
+        self.logger.info(f"Exported {rows} rows of {table} to {path}")
+        return {"success": True, "data": {"path": path, "rows": rows, "bytes": size, "chunks": len(ranges),
+                                          "watermark": watermark}}
+
+    def _table_request(self, table: str) -> PostgrestRequest:
+        """The request for every row of a table named verbatim (e.g. on the command line)
+
+        A name the OpenAPI document does not list is read as schema.table; raises
+        SupabaseQueryError if the document lists neither.
+        """
+        tables = discover_tables(self._openapi())
+        if tables is None or table in tables:
+            return table_request(table)
+        schema, _, name = table.partition('.')
+        if name:
+            return table_request(name, schema)
+        raise SupabaseQueryError(f"Unknown table {table!r}")
+
+    def _export_range(self, request: PostgrestRequest, key_column: str, key_range: Tuple[Any, Any],
+                      part: ExportPart, page_size: int):
+        """Stream the rows of one [start, end) key range into its part file"""
+        start, end = key_range
+        params = request.params
+        if start is not None:
+            params = params + [(quote_name(key_column), f"gte.{start}"), (quote_name(key_column), f"lt.{end}")]
+        rows = self._iter_pages(PostgrestRequest(request.path, params, request.headers), page_size, key_column)
+        for page in iter_chunks(rows, page_size):
+            part.write_rows(page)
+        part.close()
+
+    def _edge_value(self, request: PostgrestRequest, column: str, filters: List[Tuple[str, str]],
+                    descending: bool = False) -> Any:
+        """The smallest (or largest) non-null value of a column in the rows matching filters, or None"""
+        params = request.params + filters + [
+            ('select', quote_name(column)), (quote_name(column), 'not.is.null'),
+            ('order', f"{quote_name(column)}.{'desc' if descending else 'asc'}"), ('limit', '1')
+        ]
+        response = self._request('GET', request.path, params=params, headers=request.headers)
+        if response.status_code not in (200, 206):
+            raise SupabaseQueryError(f"Table query failed: HTTP {response.status_code} - {response.text}")
+        rows = response.json()
+        return rows[0].get(column) if rows else None
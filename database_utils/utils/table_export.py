@@ -0,0 +1,294 @@
+"""
+Table exports: whole tables to Parquet, gzipped CSV or JSON Lines files.
+
+An export splits the key range of a table into chunks that are fetched
+concurrently. Each chunk streams its pages into its own part file in a
+temporary directory next to the output, so memory stays at a page per
+chunk however large the table is. Once every chunk is done the parts are
+joined in key order into the output file, which is replaced atomically:
+a failed export never leaves a partial file behind.
+
+Gzipped parts are joined byte for byte (a gzip file may hold several
+members). Parquet parts are re-read and written as row groups of one
+file, with column types unified across parts, so a column that is null
+on the first page and filled later still gets one type.
+
+Incremental exports keep a watermark per table (the newest value of a
+column such as created_at that was exported) in a small JSON state file.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from .result_writers import OutputError, _csv_value
+from .rpc_discovery import write_json_atomic
+
+# File extension of each export format; csv and jsonl files are gzipped when the name ends in .gz
+EXPORT_FORMATS = {'parquet': '.parquet', 'csv': '.csv.gz', 'jsonl': '.jsonl.gz'}
+
+# Chunks per concurrent job: smaller chunks keep every job busy when keys are unevenly spread
+CHUNKS_PER_JOB = 4
+DEFAULT_PARQUET_COMPRESSION = 'zstd'
+# Rows per batch when joining Parquet parts, which is also the row group size of the output
+PARQUET_BATCH_SIZE = 65536
+WATERMARK_FILE = '.export_watermarks.json'
+
+
+@lru_cache(maxsize=None)
+def _pyarrow():
+    """(pyarrow, pyarrow.parquet), imported on first use"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise OutputError("Parquet export needs pyarrow: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def export_format(path: str, fmt: Optional[str] = None) -> str:
+    """The export format: fmt if given, or the one matching the file extension"""
+    if fmt is None:
+        name = path.lower()
+        for candidate, extension in EXPORT_FORMATS.items():
+            if name.endswith(extension) or name.endswith(extension.replace('.gz', '')):
+                return candidate
+        raise OutputError(f"Cannot tell the export format of {path}; choose one of {', '.join(EXPORT_FORMATS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise OutputError(f"Unknown export format {fmt!r}; choose one of {', '.join(EXPORT_FORMATS)}")
+    return fmt
+
+
+def key_ranges(low: Any, high: Any, count: int, min_span: int = 1) -> List[Tuple[Any, Any]]:
+    """Split the keys from low to high (inclusive) into up to count [start, end) ranges
+
+    Ranges are at least min_span keys wide, so a small table is not split into
+    requests for a handful of rows. Only integer keys can be split; any other key
+    type gives a single (None, None) range, i.e. one sequential scan.
+    """
+    if not all(isinstance(key, int) and not isinstance(key, bool) for key in (low, high)):
+        return [(None, None)]
+    span = high - low + 1
+    count = max(1, min(count, span // max(1, min_span)))
+    bounds = [low + span * i // count for i in range(count)] + [high + 1]
+    return list(zip(bounds, bounds[1:]))
+
+
+class ExportPart:
+    """Rows of one chunk, written to a part file as they arrive"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.columns: Optional[List[str]] = None
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _check_columns(self, rows: List[Dict[str, Any]]):
+        """Take the columns from the first row written and raise OutputError for a row with other keys"""
+        if self.columns is None:
+            self.columns = list(rows[0])
+        expected = set(self.columns)
+        for row in rows:
+            if row.keys() != expected:
+                raise OutputError(f"Rows returned different columns: {self.columns} and {list(row)}")
+
+
+class TextPart(ExportPart):
+    """CSV rows without a header, or JSON lines, optionally gzipped"""
+
+    def __init__(self, path: str, fmt: str, compress: bool):
+        super().__init__(path)
+        self.fmt = fmt
+        self._file: IO[str] = (gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6) if compress
+                               else open(path, 'w', encoding='utf-8', newline=''))
+        self._csv = csv.writer(self._file) if fmt == 'csv' else None
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        self._check_columns(rows)
+        if self._csv is not None:
+            self._csv.writerows(['' if row.get(column) is None else _csv_value(row.get(column))
+                                 for column in self.columns] for row in rows)
+        else:
+            self._file.write(''.join(json.dumps(row, default=str, ensure_ascii=False) + "\n" for row in rows))
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPart(ExportPart):
+    """Parquet segments; a page whose values do not fit the types seen so far starts a new segment"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.segments: List[str] = []
+        self._writer = None
+        self._schema = None
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        pa, pq = _pyarrow()
+        # from_pylist would silently drop keys missing from the schema
+        self._check_columns(rows)
+        # Nested values are stored as JSON text, like the CSV export
+        rows = [{column: json.dumps(value, default=str) if isinstance(value, (dict, list)) else value
+                 for column, value in row.items()} for row in rows]
+        table = None
+        if self._writer is not None:
+            try:
+                table = pa.Table.from_pylist(rows, schema=self._schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                self._writer.close()
+                self._writer = None
+        if table is None:
+            table = pa.Table.from_pylist(rows)
+            self._schema = table.schema
+            segment = f"{self.path}.{len(self.segments)}"
+            # Parts are read back once, so favour speed over size
+            self._writer = pq.ParquetWriter(segment, self._schema, compression='snappy')
+            self.segments.append(segment)
+        self._writer.write_table(table)
+        self.rows += len(rows)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ExportFile:
+    """The output file of one export, assembled from per-chunk parts
+
+    Use as a context manager: part(i) opens the part of chunk i, commit()
+    joins the parts in chunk order into path, and leaving the block removes
+    the temporary parts whether or not the export was committed.
+    """
+
+    def __init__(self, path: str, fmt: str, compression: Optional[str] = None):
+        self.path = path
+        self.fmt = fmt
+        if fmt == 'parquet':
+            _pyarrow()
+            self.compression = compression or DEFAULT_PARQUET_COMPRESSION
+        elif compression not in (None, 'gzip', 'none'):
+            raise OutputError(f"{fmt} exports are gzipped or not compressed ('none'), not {compression!r}")
+        else:
+            self.compression = compression or ('gzip' if path.endswith('.gz') else 'none')
+        self.parts: Dict[int, ExportPart] = {}
+        self._dir: Optional[str] = None
+
+    def __enter__(self) -> 'ExportFile':
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Next to the output, so the final rename stays on one filesystem
+        self._dir = tempfile.mkdtemp(prefix='.export-', dir=directory)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for part in self.parts.values():
+            part.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+        return False
+
+    def part(self, index: int) -> ExportPart:
+        path = os.path.join(self._dir, f"part-{index:05d}")
+        if self.fmt == 'parquet':
+            part: ExportPart = ParquetPart(path)
+        else:
+            part = TextPart(path, self.fmt, self.compression == 'gzip')
+        self.parts[index] = part
+        return part
+
+    @property
+    def rows(self) -> int:
+        return sum(part.rows for part in self.parts.values())
+
+    def commit(self) -> int:
+        """Join the parts in order into the output file and return its size in bytes"""
+        parts = [self.parts[index] for index in sorted(self.parts) if self.parts[index].rows]
+        for part in parts:
+            part.close()
+        columns = parts[0].columns if parts else None
+        for part in parts:
+            if part.columns != columns:
+                raise OutputError(f"Chunks returned different columns: {columns} and {part.columns}")
+
+        temporary = os.path.join(self._dir, 'output')
+        if self.fmt == 'parquet':
+            self._join_parquet([segment for part in parts for segment in part.segments], temporary)
+        else:
+            with open(temporary, 'wb') as output:
+                if self.fmt == 'csv' and columns:
+                    header = _csv_header(columns).encode('utf-8')
+                    output.write(gzip.compress(header) if self.compression == 'gzip' else header)
+                for part in parts:
+                    with open(part.path, 'rb') as source:
+                        shutil.copyfileobj(source, output, 1 << 20)
+        os.replace(temporary, self.path)
+        return os.path.getsize(self.path)
+
+    def _join_parquet(self, segments: List[str], path: str):
+        pa, pq = _pyarrow()
+        schemas = [pq.read_schema(segment) for segment in segments]
+        try:
+            schema = pa.unify_schemas(schemas, promote_options='permissive')
+        except TypeError:
+            # pyarrow < 14 only unifies null columns with typed ones
+            schema = pa.unify_schemas(schemas)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise OutputError(f"A column holds values of incompatible types: {e}") from None
+        with pq.ParquetWriter(path, schema, compression=self.compression) as writer:
+            for segment in segments:
+                for batch in pq.ParquetFile(segment).iter_batches(batch_size=PARQUET_BATCH_SIZE):
+                    table = pa.Table.from_batches([batch]).select(schema.names)
+                    writer.write_table(table.cast(schema))
+
+
+def _csv_header(columns: List[str]) -> str:
+    line = io.StringIO()
+    csv.writer(line).writerow(columns)
+    return line.getvalue()
+
+
+def snapshot_name(table: str, fmt: str, incremental: bool = False, compress: bool = True,
+                  now: Optional[datetime] = None) -> str:
+    """File name of a table export: table.parquet, or table.20261018T070000Z.parquet for an increment"""
+    extension = EXPORT_FORMATS[fmt]
+    if not compress and extension.endswith('.gz'):
+        extension = extension[:-len('.gz')]
+    if not incremental:
+        return table + extension
+    stamp = (now or datetime.now(timezone.utc)).strftime('%Y%m%dT%H%M%SZ')
+    return f"{table}.{stamp}{extension}"
+
+
+def read_watermarks(path: str) -> Dict[str, Dict[str, Any]]:
+    """Watermarks of earlier incremental exports by table, from the state file at path"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        raise OutputError(f"Cannot read export watermarks from {path}: {e}") from None
+    return state if isinstance(state, dict) else {}
+
+
+def write_watermarks(path: str, watermarks: Dict[str, Dict[str, Any]]):
+    """Save the watermarks, replacing the state file atomically"""
+    write_json_atomic(path, watermarks)